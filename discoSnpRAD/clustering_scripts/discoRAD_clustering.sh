@@ -111,7 +111,9 @@ echo "############################################################"
 echo "${yellow}#Filtering variants with more than ${min_rank} missing data and rank<${min_rank} ...${reset}"
 
 disco_filtered=${rawdiscofile_base}_filtered
-cmdFilter="python3 ${EDIR}/fasta_and_cluster_to_filtered_vcf.py -i ${rawdiscofile} -f -o ${disco_filtered}.fa -m ${percent_missing} -r ${min_rank} 2>&1 "
+disco_simpler=${disco_filtered}_simpler
+# Also writes the filtered variants with simplified headers (for dsk purposes) and the index of ${disco_filtered}.fa, in the same pass
+cmdFilter="python3 ${EDIR}/fasta_and_cluster_to_filtered_vcf.py -i ${rawdiscofile} -f -o ${disco_filtered}.fa -m ${percent_missing} -r ${min_rank} --simpler ${disco_simpler}.fa --index ${disco_filtered}.idx 2>&1 "
 echo $green$cmdFilter$cyan
 if [[ "$wraith" == "false" ]]; then
     eval $cmdFilter
@@ -131,16 +133,7 @@ echo "############################################################"
 
 echo "#Clustering variants (sharing at least a ${usedk}-mers)...${reset}"
 
-# Simplify headers (for dsk purposes)
-
-disco_simpler=${disco_filtered}_simpler
-cmdCat="cat ${disco_filtered}.fa | cut -d \"|\" -f 1 | sed -e \"s/^ *//g\""
-echo $green $cmdCat "> ${disco_simpler}.fa$cyan"
-if [[ "$wraith" == "false" ]]; then
-    eval $cmdCat > ${disco_simpler}.fa
-fi
-
- 
+# Headers of ${disco_simpler}.fa were simplified (for dsk purposes) by the filtering step
 #cat ${disco_filtered}.fa | cut -d "|" -f 1 | sed -e "s/^ *//g" > ${disco_simpler}.fa
 cmdLs="ls ${disco_simpler}.fa"
 echo $green$cmdLs "> ${disco_simpler}.fof$cyan"
@@ -188,7 +181,7 @@ echo "${yellow}############################################################"
 echo "###################### OUTPUT VCF ##########################"
 echo "############################################################$reset"
 
-cmdVCF="python3 ${EDIR}/fasta_and_cluster_to_filtered_vcf.py -i ${disco_filtered}.fa -o ${output_file} -c ${disco_simpler}.cluster -s ${max_cluster_size} 2>&1 "
+cmdVCF="python3 ${EDIR}/fasta_and_cluster_to_filtered_vcf.py -i ${disco_filtered}.fa -o ${output_file} -c ${disco_simpler}.cluster -s ${max_cluster_size} --index ${disco_filtered}.idx 2>&1 "
 echo $green$cmdVCF$cyan
 if [[ "$wraith" == "false" ]]; then
     eval $cmdVCF
@@ -205,7 +198,7 @@ echo "#########################  CLEANING  ##################################"
 echo "#######################################################################$reset"
 
 
-rm -f ${disco_simpler}*
+rm -f ${disco_simpler}* ${disco_filtered}.idx
 #rm -f ${disco_filtered}.fa
 
 
@@ -20,9 +20,14 @@ import random
 import re #regular expressions
 import time
 import os
+import mmap
+import struct
+from array import array
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),"../../scripts/"))
 from vcf_formatting_functions import *
+from disco_bubbles import read_bubbles, read_bubble_at, read_bubble_index
+from filter_metrics import FilterMetrics
 
 
 ''' Usages in discoSnp pipeline scripts (RAD/clustering_scripts/discoRAD_clustering.sh):
@@ -32,34 +37,76 @@ from vcf_formatting_functions import *
     end of the pipeline
     
     If clustering:
-    python3 fasta_and_cluster_to_filtered_vcf.py -i disco_bubbles_coherent.fa -f -o disco_bubbles_coherent_filtered.fa_removemeplease -m 0.95 -r 0.4
-    # then clustering with file disco_bubbles_coherent_filtered.fa_removemeplease
-    python3 fasta_and_cluster_to_filtered_vcf.py -i disco_bubbles_coherent_filtered.fa_removemeplease -c disco_bubbles_coherent_filtered_simpler.cluster -o disco_bubbles_coherent_clustered.vcf -s 150
-    rm -f disco_bubbles_coherent_filtered.fa_removemeplease
+    python3 fasta_and_cluster_to_filtered_vcf.py -i disco_bubbles_coherent.fa -f -o disco_bubbles_coherent_filtered.fa_removemeplease -m 0.95 -r 0.4 --simpler disco_bubbles_coherent_filtered_simpler.fa --index disco_bubbles_coherent_filtered.idx
+    # then clustering with file disco_bubbles_coherent_filtered_simpler.fa (headers limited to the bubble name)
+    python3 fasta_and_cluster_to_filtered_vcf.py -i disco_bubbles_coherent_filtered.fa_removemeplease -c disco_bubbles_coherent_filtered_simpler.cluster -o disco_bubbles_coherent_clustered.vcf -s 150 --index disco_bubbles_coherent_filtered.idx
+    # the bubbles of the clusters larger than 150 are not read
+    rm -f disco_bubbles_coherent_filtered.fa_removemeplease disco_bubbles_coherent_filtered.idx
     end of pipeline
     '''
 
-def store_clusters(cluster_file):
+CLUSTER_MAP_HEADER = struct.Struct("=8sqq") # magic, nb of read ids, nb of clusters ; followed by the two int32 arrays
+CLUSTER_MAP_MAGIC = b"DSCLMAP1"
+
+def store_clusters(cluster_file, cluster_map_file=None):
+    '''
+        Read ids are dense integers: returns two int32 arrays, read_id_to_cluster_id (-1 for a read id in no cluster) and cluster_id_to_cluster_size
+        cluster_map_file: binary copy of both arrays, memory mapped instead of parsing cluster_file if it is more recent, written otherwise
+        '''
     if cluster_file==None: return None, None
+    if cluster_map_file and os.path.exists(cluster_map_file) and os.path.getmtime(cluster_map_file) >= os.path.getmtime(cluster_file):
+        return load_cluster_map(cluster_map_file)
     clusters=open(cluster_file,"r")
-    read_id_to_cluster_id={}
-    cluster_id_to_cluster_size={}
+    read_id_to_cluster_id=array('i')
+    cluster_id_to_cluster_size=array('i')
     cluster_id=-1
+    max_read_id=-1
     for cluster in clusters:
         # a line is "70166 70345 70409 70222 70406 70167 70223 69786 70407 69787 70408 70611 70610 70344 "
         cluster_id+=1
-        cluster_id_to_cluster_size[cluster_id]=int(len(cluster.rstrip().split())/2)
-        for read_id in cluster.rstrip().split():
-            read_id_to_cluster_id[int(read_id.split('-')[0])]=cluster_id # A line can be formated as 70166 70345-info_about_similarity
+        read_ids=cluster.split()
+        cluster_id_to_cluster_size.append(int(len(read_ids)/2))
+        for read_id in read_ids:
+            read_id=int(read_id.split('-')[0]) # A line can be formated as 70166 70345-info_about_similarity
+            if read_id > max_read_id:
+                max_read_id=read_id
+                if read_id >= len(read_id_to_cluster_id): # grows by doubling
+                    read_id_to_cluster_id.extend(array('i',[-1])*max(read_id+1-len(read_id_to_cluster_id),len(read_id_to_cluster_id)))
+            read_id_to_cluster_id[read_id]=cluster_id
     clusters.close()
+    del read_id_to_cluster_id[max_read_id+1:] # unused end of the last doubling
+    if cluster_map_file:
+        save_cluster_map(cluster_map_file, read_id_to_cluster_id, cluster_id_to_cluster_size)
     return read_id_to_cluster_id, cluster_id_to_cluster_size
+
+def save_cluster_map(cluster_map_file, read_id_to_cluster_id, cluster_id_to_cluster_size):
+    with open(cluster_map_file,"wb") as cluster_map:
+        cluster_map.write(CLUSTER_MAP_HEADER.pack(CLUSTER_MAP_MAGIC, len(read_id_to_cluster_id), len(cluster_id_to_cluster_size)))
+        read_id_to_cluster_id.tofile(cluster_map)
+        cluster_id_to_cluster_size.tofile(cluster_map)
+
+def load_cluster_map(cluster_map_file):
+    '''
+        Memory maps a file written by save_cluster_map: returns both arrays as int32 memoryviews on the file
+        '''
+    with open(cluster_map_file,"rb") as cluster_map:
+        buffer=mmap.mmap(cluster_map.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, nb_read_ids, nb_clusters = CLUSTER_MAP_HEADER.unpack_from(buffer)
+    if magic != CLUSTER_MAP_MAGIC:
+        print("Error: "+cluster_map_file+" is not a cluster map",file=sys.stderr)
+        sys.exit(2)
+    start=CLUSTER_MAP_HEADER.size
+    middle=start+4*nb_read_ids
+    view=memoryview(buffer)
+    return view[start:middle].cast('i'), view[middle:middle+4*nb_clusters].cast('i')
     
 def get_cluster_id_and_size(sequence_id, read_id_to_cluster_id, cluster_id_to_cluster_size):
     if not read_id_to_cluster_id: return ".", "."
-    if sequence_id not in read_id_to_cluster_id:
+    if sequence_id >= len(read_id_to_cluster_id) or read_id_to_cluster_id[sequence_id] < 0:
         print("Warning, sequence id "+str(sequence_id)+" not in clusters",file=sys.stderr)
         return ".", "."
-    return read_id_to_cluster_id[sequence_id], cluster_id_to_cluster_size[read_id_to_cluster_id[sequence_id]]
+    cluster_id=read_id_to_cluster_id[sequence_id]
+    return cluster_id, cluster_id_to_cluster_size[cluster_id]
     
 
 def usage():
@@ -74,6 +121,12 @@ def usage():
     print("  -o: output vcf file path (default = stdout)")
     print("  -f: output a filtered fasta file instead of a vcf file")
     print("  -c: considers a cluster input file. In this situation, can filter on cluster size and prints the cluster_id and cluster_size in the INFO field of each variant")
+    print("  --cluster_map: with -c, binary copy of the clusters, written by a first run and memory mapped by the next ones (e.g. with other -s values)")
+    print("  --simpler: with -f, also outputs the kept variants in this fasta file, with headers limited to the bubble name (input of the clustering)")
+    print("  --index: with -f, outputs in this file the byte offset of each variant of the filtered fasta file.")
+    print("           Without -f, the input is such a filtered fasta file and its index is used to read only the variants passing the cluster size filter")
+    print("  --progress: writes every this number of seconds a progress line on stderr: bubbles/s, MB/s, ETA, rejected bubbles per filter (default = 0, none)")
+    print("  --metrics: writes at the end the totals (bubbles, kept, rejected per filter, rates) in this JSON file")
     print("  -h: help")
     print("-----------------------------------------------------------------------------")
     sys.exit(2)
@@ -81,7 +134,7 @@ def usage():
 
 def main():
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:r:m:s:o:fc:", ["help", "in=", "rank=", "miss=", "size=", "out=", "fastaout", "cluster"])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:r:m:s:o:fc:", ["help", "in=", "rank=", "miss=", "size=", "out=", "fastaout", "cluster", "simpler=", "index=", "cluster_map=", "progress=", "metrics="])
     except getopt.GetoptError as err:
         # print help information and exit:
         print(str(err))  # will print something like "option -a not recognized"
@@ -98,6 +151,11 @@ def main():
     out_file =      None
     cluster_file =  None
     with_cluster = False
+    simpler_file =  None
+    index_file =    None
+    cluster_map_file = None
+    progress_interval = 0
+    metrics_file = None
     for opt, arg in opts:
         if opt in ("-h", "--help"):
             usage()
@@ -117,6 +175,16 @@ def main():
         elif opt in ("-c"):
             cluster_file = arg
             with_cluster = True
+        elif opt == "--simpler":
+            simpler_file = arg
+        elif opt == "--index":
+            index_file = arg
+        elif opt == "--cluster_map":
+            cluster_map_file = arg
+        elif opt == "--progress":
+            progress_interval = float(arg)
+        elif opt == "--metrics":
+            metrics_file = arg
         else:
             assert False, "unhandled option"
 
@@ -136,94 +204,88 @@ def main():
         nb_fixed_fields = 0 #nb fields before C1_X|C2_Y|... depends if unitig and/or contig lengths have been output
         
         ## LOAD clusters
-        read_id_to_cluster_id, cluster_id_to_cluster_size = store_clusters(cluster_file)
+        read_id_to_cluster_id, cluster_id_to_cluster_size = store_clusters(cluster_file, cluster_map_file)
         
-        with open(fasta_file, 'r') as filin:
-            for line in filin:
-                splitted_1 = line.split("|")
-
-                #nb_samples:
-                tig_type = len(re.findall("left_\w+_length",line))
-                nb_fixed_fields = 4 + 2*tig_type
-                nb_samples = (len(splitted_1) - (nb_fixed_fields + 1))/3
-                if nb_samples % 1 != 0:
-                    print(f"Warning: could not detect the correct nb of samples : {nb_samples}")
-                    sys.exit(2)
-                nb_samples = int(nb_samples)
-                break
+        for bubble in read_bubbles(fasta_file):
+            line = bubble.lines[0]
+            splitted_1 = line.split("|")
+
+            #nb_samples:
+            tig_type = len(re.findall("left_\w+_length",line))
+            nb_fixed_fields = 4 + 2*tig_type
+            nb_samples = (len(splitted_1) - (nb_fixed_fields + 1))/3
+            if nb_samples % 1 != 0:
+                print(f"Warning: could not detect the correct nb of samples : {nb_samples}")
+                sys.exit(2)
+            nb_samples = int(nb_samples)
+            break
 
         sys.stdout.close = lambda: None  #make stdout unclosable, to use with and handle both `with open(…)` and `sys.stdout` nicely. cf. https://stackoverflow.com/questions/17602878/how-to-handle-both-with-open-and-sys-stdout-nicely
         # Now going through all lines
-        with open(fasta_file, 'r') as filin, (open(out_file,'w') if out_file else sys.stdout) as filout:
+        with (open(out_file,'w') if out_file else sys.stdout) as filout:
             if not fasta_only:
                 # Write vcf comment lines
                 filout.write(vcf_header(source,date,fasta_file,nb_samples))
 
-            nb_kept_variants = 0
-            nb_analyzed_variants = 0
-            line_count = 0
-            sequence_id=-1
-            fasta_4lines = ""  ## Remembering 4 consecutive lines for kept variants to write in a fasta file if fasta_only mode
-            keep_variant = False
-            cluster_id=-1
-            cluster_size=0
-            for line in filin:
-                if line_count%2 == 0:   sequence_id+=1  # first sequence is 1, second (lower path of first variant) is 2, ...
-                if line_count ==0:      
-                    fasta_4lines=""                     #back to empty for incoming variant 
-                    cluster_id,cluster_size = get_cluster_id_and_size(sequence_id, read_id_to_cluster_id, cluster_id_to_cluster_size)
-                line_count += 1
-                fasta_4lines += line
-                if line_count == 1:
-                    keep_variant = False
-                    nb_analyzed_variants += 1
-
-                    # Header higher path
-                    line = line.strip()
-                    splitted_1 = line.split("|")
-                    #fasta_4lines = splitted_1[0] + "\n"  #simplified headers for fasta_only and src
-
-                    ## FILTERING
-                    #filter cluster size
-                    if max_cluster_size >0 and cluster_id != ".":
-                        if cluster_size > max_cluster_size:
-                            continue
-                    #filter rank
-                    rank = float(splitted_1[-1].split("rank_")[1])
-                    if rank < min_rank:
+            sequence_id=-2
+            metrics = FilterMetrics(fasta_file, progress_interval)
+            # filter rank and missing genotype ratio on the raw header of the higher path
+            keep = bubble_filter(min_rank, max_miss if max_miss !=1 else None, nb_samples, rejections=metrics.rejections)
+            formatter = VcfFormatter(nb_samples, tig_type)
+            # In fasta_only mode, the simplified fasta file and the index of the output are written in the same pass
+            simpler_out = open(simpler_file,'w') if fasta_only and simpler_file else None
+            index_out = open(index_file,'w') if fasta_only and index_file else None
+            fasta_offset = 0
+            # With an index of the input, the variants are read (at their offset) only if they pass the cluster size filter
+            fasta_in = open(fasta_file,'rb') if index_file and not fasta_only else None
+            if fasta_in:
+                offsets = read_bubble_index(index_file)
+                # the bytes of the variants that are not read are not counted: the progress is given by the variants
+                metrics.total_bytes = None
+                metrics.total_bubbles = len(offsets)
+            for bubble in (offsets if fasta_in else read_bubbles(fasta_file)):
+                sequence_id+=2  # id of the higher path : 0, 2, 4, ... (the lower path of a variant is the next id)
+                cluster_id,cluster_size = get_cluster_id_and_size(sequence_id, read_id_to_cluster_id, cluster_id_to_cluster_size)
+                metrics.add_bubble(None if fasta_in else bubble)
+
+                ## FILTERING
+                #filter cluster size
+                if max_cluster_size >0 and cluster_id != ".":
+                    if cluster_size > max_cluster_size:
+                        metrics.reject("cluster_size")
                         continue
-                    # filter missing genotype ratio
-                    if max_miss !=1:
-                        nb_missing = len(re.findall(r"G\d+_\./\.",line))
-                        missing_ratio = nb_missing / nb_samples
-                        if missing_ratio >= max_miss:
-                            continue
-                    
-                    keep_variant = True  # for fasta_only mode
-                    nb_kept_variants += 1
-                
-                if keep_variant and line_count == 3:
-                    #Header lower path
-                    line = line.strip()
-                    splitted_2 = line.split("|")
-                    #fasta_4lines += splitted_2[0] + "\n"  #simplified headers for fasta_only and src
-
-                if line_count == 4:
-                    line_count = 0
-                    if keep_variant:
-                        if fasta_only:
-                            #fasta_4lines += line   #simplified headers for fasta_only and src
-                            filout.write(fasta_4lines) # TODO: do we writte fasta variants if not in a cluster and a cluster file is provided?
-                        else:
-                            #now format in vcf format
-                            line = line.strip()
-                            filout.write(format_vcf(splitted_1, splitted_2, nb_samples, rank, line, cluster_id, cluster_size, tig_type))
+                if fasta_in:
+                    bubble = read_bubble_at(fasta_in, bubble)
+                    metrics.add_bytes(bubble)
+                rank = keep(bubble.lines[0])
+                if rank is None:
+                    continue
+
+                metrics.keep()
+                if fasta_only:
+                    fasta_4lines = bubble.text
+                    filout.write(fasta_4lines) # TODO: do we writte fasta variants if not in a cluster and a cluster file is provided?
+                    if index_out:
+                        index_out.write(f"{fasta_offset}\n")
+                        fasta_offset += len(fasta_4lines.encode())
+                    if simpler_out:
+                        # same as cut -d "|" -f 1 | sed -e "s/^ *//g"
+                        simpler_out.write("".join([line.split("|")[0].lstrip(" ").rstrip("\n") + "\n" for line in bubble.lines if line]))
+                else:
+                    # Headers of the higher and lower paths, split only for the kept variants
+                    #now format in vcf format
+                    filout.write(formatter.format(bubble.fields_up, bubble.fields_low, rank, bubble.sequence_low, cluster_id, cluster_size))
+            for extra_file in (simpler_out, index_out, fasta_in):
+                if extra_file:
+                    extra_file.close()
                     
 
 
         #print(f"{nb_lost_variants} variant bubbles filtered out")
         #print(f"{nb_kept_variants} variant bubbles output out of {nb_tot_variants} ({nb_analyzed_variants} analyzed)")
-        sys.stderr.write(f"{nb_kept_variants} variant bubbles output out of {nb_analyzed_variants}\n")
+        sys.stderr.write(f"{metrics.nb_kept} variant bubbles output out of {metrics.nb_bubbles}\n")
+        if metrics_file:
+            metrics.write_summary(metrics_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+###############################################
+#BAM input of VCF_creator : the records are decoded from the BGZF blocks into the fields of a sam line
+#Dresscode : class : uppercase
+#            function : begins with a capital
+#            variable : words separated by capital
+import struct
+import zlib
+#############################################################################################
+#INDEX_____________________________________________________________________________________________________________
+#________________class BAMREADER(): reads a BAM file (or stream) block by block________________
+#      NextBlock(self):"""Decompresses the next BGZF block"""
+#      ReadHeader(self):"""Reads the header : sam header text and reference names"""
+#      Read(self,size):"""Returns the next size bytes of the uncompressed stream"""
+#      Records(self,boolSkipSupplementary=True):"""Yields each alignment as the list of the fields of its sam line"""
+#      DecodeRecord(self,record):"""Decodes a record (without its block_size) into the list of the fields of its sam line"""
+#      DecodeTags(data,offset):"""Decodes the optional fields of a record into sam "TAG:TYPE:VALUE" strings"""
+#############################################################################################
+BAM_CIGAR_OPERATIONS="MIDNSHP=X"
+BAM_SEQUENCE_CODE="=ACMGRSVTWYHKDBN"
+BAM_SEQUENCE_PAIR=[BAM_SEQUENCE_CODE[byte>>4]+BAM_SEQUENCE_CODE[byte&15] for byte in range(256)] #Two bases per byte
+BAM_QUALITY=bytes((value+33)&255 for value in range(256)) #Phred score => sam character
+BAM_CORE=struct.Struct("<iiBBHHHiiii") #refID,pos,l_read_name,mapq,bin,n_cigar_op,flag,l_seq,next_refID,next_pos,tlen
+BAM_INTEGER_TAGS={"c":struct.Struct("<b"),"C":struct.Struct("<B"),"s":struct.Struct("<h"),"S":struct.Struct("<H"),"i":struct.Struct("<i"),"I":struct.Struct("<I")}
+BAM_FLOAT_TAG=struct.Struct("<f")
+
+def DecodeTags(data,offset):
+        """Decodes the optional fields of a record into sam "TAG:TYPE:VALUE" strings (all integer types are written as i, as samtools does)"""
+        listTag=[]
+        end=len(data)
+        while offset<end:
+                tag=data[offset:offset+2].decode()
+                valueType=chr(data[offset+2])
+                offset+=3
+                if valueType in BAM_INTEGER_TAGS:
+                        integer=BAM_INTEGER_TAGS[valueType]
+                        listTag.append(tag+":i:"+str(integer.unpack_from(data,offset)[0]))
+                        offset+=integer.size
+                elif valueType=="Z" or valueType=="H":
+                        stop=data.index(b"\0",offset)
+                        listTag.append(tag+":"+valueType+":"+data[offset:stop].decode())
+                        offset=stop+1
+                elif valueType=="A":
+                        listTag.append(tag+":A:"+chr(data[offset]))
+                        offset+=1
+                elif valueType=="f":
+                        listTag.append(tag+":f:%g" % BAM_FLOAT_TAG.unpack_from(data,offset)[0])
+                        offset+=4
+                elif valueType=="B":
+                        subType=chr(data[offset])
+                        count=struct.unpack_from("<i",data,offset+1)[0]
+                        offset+=5
+                        if subType=="f":
+                                values=["%g" % value for value in struct.unpack_from("<%df" % count,data,offset)]
+                                offset+=4*count
+                        else:
+                                integer=BAM_INTEGER_TAGS[subType]
+                                values=[str(value) for value in struct.unpack_from("<%d%s" % (count,integer.format[-1]),data,offset)]
+                                offset+=integer.size*count
+                        listTag.append(tag+":B:"+",".join([subType]+values))
+                else:
+                        raise ValueError("Unknown type of the BAM tag "+tag+" : "+valueType)
+        return listTag
+
+#---------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------------------------------------------------------------------------
+class BAMREADER():
+        """Reads a BAM file (or stream, e.g. sys.stdin.buffer) : BGZF blocks are decompressed one by one"""
+        def __init__(self,stream):
+                self.stream=stream
+                self.data=b""            #uncompressed bytes not read yet
+                self.offset=0
+                self.listHeader=[]       #lines of the sam header
+                self.listReference=[]    #names of the reference sequences (refID => name)
+                self.ReadHeader()
+        def NextBlock(self):
+                """Decompresses the next BGZF block ; returns None at the end of the stream"""
+                header=self.stream.read(18)
+                if len(header)<18:
+                        return None
+                if header[:4]!=b"\x1f\x8b\x08\x04" or header[12:14]!=b"BC":
+                        raise ValueError("The input is not a BGZF (BAM) file")
+                blockSize=struct.unpack_from("<H",header,16)[0]+1
+                rest=self.stream.read(blockSize-18)
+                return zlib.decompress(rest[:-8],-15)
+        def Read(self,size):
+                """Returns the next size bytes of the uncompressed stream (less at the end of the stream)"""
+                if self.offset+size>len(self.data):
+                        listData=[self.data[self.offset:]]
+                        available=len(listData[0])
+                        while available<size:
+                                block=self.NextBlock()
+                                if block is None:
+                                        break
+                                listData.append(block)
+                                available+=len(block)
+                        self.data=b"".join(listData)
+                        self.offset=0
+                chunk=self.data[self.offset:self.offset+size]
+                self.offset+=len(chunk)
+                return chunk
+        def ReadHeader(self):
+                """Reads the header : sam header text and reference names"""
+                if self.Read(4)!=b"BAM\1":
+                        raise ValueError("The input is not a BAM file")
+                textLength=struct.unpack("<i",self.Read(4))[0]
+                text=self.Read(textLength).rstrip(b"\0").decode()
+                self.listHeader=[line+"\n" for line in text.split("\n") if line]
+                nbReference=struct.unpack("<i",self.Read(4))[0]
+                listLength=[]
+                for i in range(nbReference):
+                        nameLength=struct.unpack("<i",self.Read(4))[0]
+                        self.listReference.append(self.Read(nameLength)[:-1].decode())
+                        listLength.append(struct.unpack("<i",self.Read(4))[0])
+                if not any(line.startswith("@SQ") for line in self.listHeader):#BAM without text header
+                        self.listHeader+=["@SQ\tSN:"+name+"\tLN:"+str(length)+"\n" for name,length in zip(self.listReference,listLength)]
+        def Records(self,boolSkipSupplementary=True):
+                """Yields each alignment as the list of the fields of its sam line (supplementary alignments, flag 2048, are skipped without being decoded)"""
+                while True:
+                        size=self.Read(4)
+                        if len(size)<4:
+                                return
+                        record=self.Read(struct.unpack("<i",size)[0])
+                        if boolSkipSupplementary and struct.unpack_from("<H",record,14)[0] & 2048:
+                                continue
+                        yield self.DecodeRecord(record)
+        def DecodeRecord(self,record):
+                """Decodes a record (without its block_size) into the list of the fields of its sam line"""
+                refID,pos,nameLength,mapq,binMapping,nbCigar,flag,seqLength,nextRefID,nextPos,tlen=BAM_CORE.unpack_from(record,0)
+                offset=32
+                name=record[offset:offset+nameLength-1].decode()
+                offset+=nameLength
+                if nbCigar:
+                        listCigar=struct.unpack_from("<%dI" % nbCigar,record,offset)
+                        cigarcode="".join([str(operation>>4)+BAM_CIGAR_OPERATIONS[operation&15] for operation in listCigar])
+                        offset+=4*nbCigar
+                else:
+                        cigarcode="*"
+                if seqLength:
+                        seqBytes=(seqLength+1)>>1
+                        seq="".join(map(BAM_SEQUENCE_PAIR.__getitem__,record[offset:offset+seqBytes]))[:seqLength]
+                        offset+=seqBytes
+                        quality=record[offset:offset+seqLength]
+                        quality="*" if quality[0]==255 else quality.translate(BAM_QUALITY).decode()
+                        offset+=seqLength
+                else:
+                        seq="*"
+                        quality="*"
+                if nextRefID<0:
+                        nextReference="*"
+                elif nextRefID==refID:
+                        nextReference="="
+                else:
+                        nextReference=self.listReference[nextRefID]
+                listSam=[name,str(flag),self.listReference[refID] if refID>=0 else "*",str(pos+1),str(mapq),cigarcode,
+                         nextReference,str(nextPos+1),str(tlen),seq,quality]
+                listSam+=DecodeTags(record,offset)
+                return listSam
@@ -12,6 +12,7 @@ import sys
 import subprocess
 import re
 import time
+import functools
 
 
 #Class and methods_________________________________________________________________________________________________________
@@ -37,10 +38,12 @@ import time
 
 #________________class PATH(): """corresponds to one path"""________________
 #      RetrieveSeq(self,seq):"""Getter for sequence"""
-#      RetrieveDicoMappingPosition(self):"""Retrieves for each path alignment information in a list ; retrieves a dictionary with all the positions of a path and the number of associated mismatch"""
+#      RetrieveDicoMappingPosition(self):"""Retrieves the main mapping position of a path with its number of mismatch and keeps the XA tag (alternative hits) undecoded"""
+#      IterAlternativeHits(self):"""Decodes on demand the alternative hits of the XA tag which are not too close to the main position"""
+#      IterMappingPositions(self):"""Yields all the mapping positions of a path (main position first) with their number of mismatch"""
 #      CheckBitwiseFlag(self):"""Checks if the BitwiseFlag contains the tested value such as : read reverse strand, read unmmaped and so on."""
 #      CigarcodeChecker(self):"""Checks in the cigarcode of the samfile if there is a shift in the alignment between the path and the reference"""
-#      ReferenceChecker(self,shift,posCentraleRef,VCFObject):"""Function which allows to get the MD tag parsing; checks if path nucleotide is identical to the reference nucleotide"""
+#      ReferenceChecker(self,shift,nucleoRef,VCFObject):"""Checks if path nucleotide is identical to the reference nucleotide (nucleotide of the reference given by AlignmentWalk)"""
 #      RetrieveCoverage(self):"""Get the coverage by path in the discosnp++ header"""
 #      GetTag(self):"""Gets the number of mismatch in the samline"""
 #      CheckPosVariantFromRef(self,VCFObject): """Checks if the variant is identical to the reference or not ; defines the nucleotide on the reference"""
@@ -62,52 +65,111 @@ import time
 #      PrintOneLine(self,table,VCF):
     
                      
-def shift_from_cigar_code(cigarcode, pospol):
-        # print ("shift",cigarcode,pospol)
-        parsingCigarCode=re.findall('(\d+|[A-Za-z])',cigarcode) #ParsingCigarCode=['2', 'S', '3', 'M', '1', 'I', '25', 'M']
-        # print (parsingCigarCode)
+COMPLEMENT=str.maketrans("ATCGatcg","TAGCtagc") # for fast reverse complement computations
+
+#Alignment walk engine_________________________________________________________________________________________________
+#CIGAR and MD tags are tokenized with compiled patterns and their walks are cached: the same CIGAR ("61M") or MD tag ("61") comes back for most of the paths
+CIGAR_PATTERN=re.compile(r'(\d+)([A-Za-z=])')                                 #61M => [('61','M')] ; 2S3M1I25M => [('2','S'),('3','M'),('1','I'),('25','M')]
+MD_PATTERN=re.compile(r'(\d+)|\^([A-Za-z]+)|([A-Za-z])')                       #5A10^AC3 => number of identical nucleotides | deletion from the reference | mismatch
+CIGAR_SHIFT={'S':(-1,1),'M':(0,1),'D':(1,0),'I':(-1,1),'H':(-1,1),'P':(1,1),'=':(0,1),'X':(0,1)} #Operation => (effect on the shift with the reference, effect on the position in the query SEQ)
+
+@functools.lru_cache(maxsize=4096)
+def ParseCigar(cigarcode):
+        """Returns, for each operation of the cigarcode, the position in the query SEQ and the shift with the reference after this operation"""
+        listWalk=[]
+        shift=0
+        pos=0
+        for length,operation in CIGAR_PATTERN.findall(cigarcode):
+                effectShift,effectPos=CIGAR_SHIFT.get(operation,(0,0))
+                shift+=effectShift*int(length)
+                pos+=effectPos*int(length)
+                listWalk.append((pos,shift))
+        return tuple(listWalk)
+
+@functools.lru_cache(maxsize=4096)
+def ParseMD(posMut):
+        """Returns the checkpoints of the MD tag walk : (offset on the path, nucleotide of the reference if it is a mismatch else None)"""
+        listCheckpoint=[]
+        offset=0
+        for number,deletion,mismatch in MD_PATTERN.findall(posMut):
+                if number:
+                        offset+=int(number)
+                        listCheckpoint.append((offset,None))
+                elif deletion: #Deletion from the reference : the deleted nucleotides are substracted from the current position (checked with the following number)
+                        offset-=len(deletion)
+                else:
+                        offset+=1
+                        listCheckpoint.append((offset,mismatch))
+        return tuple(listCheckpoint)
+
+@functools.lru_cache(maxsize=4096)
+def WalkCigar(cigarcode,listPos):
+        """Gets the shift with the reference (soft clipping, insertion, deletion...) of every position of listPos (positions of the variants on the path) in one walk of the cigarcode ; returns the positions on the reference and the shifts"""
         listPosRef=[]
         listShift=[]
-        somme=0
+        j=0
+        for pos,shift in ParseCigar(cigarcode):
+                while j<len(listPos) and pos>=listPos[j]: #The position is affected by all the shifts before it
+                        listPosRef.append(listPos[j]+shift)
+                        listShift.append(shift)
+                        j+=1
+                if j==len(listPos):
+                        return(listPosRef,listShift)
+        return(None)
+
+def WalkMD(posMut,listPos):
+        """Gets the nucleotide of the reference at every position of listPos in one walk of the MD tag : None if the path is identical to the reference, the nucleotide of the reference in case of mismatch, "." if the position is out of the alignment (large soft clip)"""
+        listRefNucleotide=["."]*len(listPos)
+        listOrder=sorted(range(len(listPos)),key=lambda k: listPos[k])
+        j=0
+        for offset,nucleotide in ParseMD(posMut):
+                while j<len(listOrder) and listPos[listOrder[j]]<=offset:
+                        if listPos[listOrder[j]]==offset:
+                                listRefNucleotide[listOrder[j]]=nucleotide
+                        else: #The walk went beyond the variant position without mismatch : the nucleotide of the variant is identical to the reference
+                                listRefNucleotide[listOrder[j]]=None
+                        j+=1
+                if j==len(listOrder):
+                        break
+        return(listRefNucleotide)
+
+def AlignmentWalk(cigarcode,posMut,listPos):
+        """Alignment walk engine : from the cigarcode, the MD tag and the positions of the variants on the path, returns the positions on the reference, the shifts and the nucleotides of the reference (see WalkMD) of all the variants"""
+        listPos=tuple(int(pos) for pos in listPos)
+        listPosRef,listShift=WalkCigar(cigarcode,listPos)
+        return(list(listPosRef),list(listShift),WalkMD(posMut,listPos))
+
+def shift_from_cigar_code(cigarcode, pospol):
+        """Returns the position pospol corrected by the shift of the cigarcode before it"""
         shift=0
-        pos=0
-        i=1
-        while i<len(parsingCigarCode):#Goes through the list by twos to get all the letters and to take them into account
-                if parsingCigarCode[i]=="S":
-                        shift-=int(parsingCigarCode[i-1])
-                        pos+=int(parsingCigarCode[i-1])
-                elif parsingCigarCode[i]=="M":
-                        pos+=int(parsingCigarCode[i-1])
-                elif parsingCigarCode[i]=="D":
-                        shift+=int(parsingCigarCode[i-1])
-                elif parsingCigarCode[i]=="I":
-                        shift-=int(parsingCigarCode[i-1])#There is a nucleotide of shift compared to the reference
-                        pos+=int(parsingCigarCode[i-1]) #We advance in the query SEQ
-                #Hard clipping (clipped sequences NOT present in SEQ)
-                elif parsingCigarCode[i]=="H":
-                        shift-=int(parsingCigarCode[i-1]) # It's the shift in the alignment between the reference and the sequence of the variant 
-                        pos+=int(parsingCigarCode[i-1])
-                #Padding (silent deletion from padded reference)
-                elif parsingCigarCode[i]=="P":
-                        shift+=int(parsingCigarCode[i-1])
-                        pos+=int(parsingCigarCode[i-1])
-                elif parsingCigarCode[i]=="=":
-                        pos+=int(parsingCigarCode[i-1])
-                elif parsingCigarCode[i]=="X":
-                        pos+=int(parsingCigarCode[i-1])
+        for pos,shift in ParseCigar(cigarcode):
                 if pos>=pospol:
-                        # print("return", str(pospol+shift))
-                        return pospol+shift#takes into account the shift to add the after the mapping position and the variant position in the sequence                                
-                i+=2
-
-        # print("return", str(pospol+shift))
+                        break
         return pospol+shift#takes into account the shift to add the after the mapping position and the variant position in the sequence
 
 class VARIANT():
         """Object corresponding to a discosnp++ bubble"""
+        __slots__=("upper_path","lower_path","variantID","discoName","unitigLeft","unitigRight","contigLeft","contigRight","rank","nb_pol",
+                   "dicoGeno","dicoAllele","mappingPositionCouple","mappingPosition","dicoIndex")
         def __init__(self,line1,line2):
                 self.upper_path=PATH(line1)#line in the file corresponding to the upper path
                 self.lower_path=PATH(line2)#line in the file corresponding to the lower path
+                self.dicoGeno={}#dictionnary with the information of the genotype dicoGeno[listgeno[0]]=[listgeno[1],listlikelihood]
+                self.dicoAllele={}#dictionnary of all the information from the header of discosnp++ : depending on the variant
+                self.InitFields()
+#---------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------------------------------------------------------------------------                                           
+        def Reset(self,line1,line2):
+                """Reuses the object (and its paths) for a new bubble : the containers are emptied instead of being allocated again"""
+                self.upper_path.Reset(line1)
+                self.lower_path.Reset(line2)
+                self.dicoGeno.clear()
+                self.dicoAllele.clear()
+                self.InitFields()
+#---------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------------------------------------------------------------------------                                           
+        def InitFields(self):
+                """Initializes the fields of the bubble which are not containers"""
                 self.variantID="" #ID of discoSnp++
                 self.discoName=""#name of the variant : SNP_higher_path_99
                 self.unitigLeft=""#length of the unitig left
@@ -116,20 +178,9 @@ class VARIANT():
                 self.contigRight=""#length of the contig right
                 self.rank=""#rank calculated by discosnp++
                 self.nb_pol=""# number of polymorphisme in the disco path 
-                self.dicoGeno={}#dictionnary with the information of the genotype dicoGeno[listgeno[0]]=[listgeno[1],listlikelihood]
-                self.dicoAllele={}#dictionnary of all the information from the header of discosnp++ : depending on the variant
                 self.mappingPositionCouple=0#mapping position of the bubble after correction
-                self.dicoIndex={}#dictionnary with all the index of every items in discoSnp++ header 
-
-                self.char2char = dict() # for fast reverse complement computations
-                self.char2char['A'] = 'T'
-                self.char2char['T'] = 'A'
-                self.char2char['C'] = 'G'
-                self.char2char['G'] = 'C'
-                self.char2char['a'] = 't'
-                self.char2char['t'] = 'a'
-                self.char2char['c'] = 'g'
-                self.char2char['g'] = 'c'
+                self.mappingPosition=None#mapping position of the path chosen as reference (MismatchChecker)
+                self.dicoIndex=None#dictionnary with all the index of every items in discoSnp++ header (see setDicoIndex)
 #---------------------------------------------------------------------------------------------------------------------------
 #---------------------------------------------------------------------------------------------------------------------------                                           
         def setDicoIndex(self,dicoIndex):
@@ -186,7 +237,7 @@ class VARIANT():
         
         def ReverseComplement(self,nucleotide):
                 """Take a sequence or a nucleotide and reverse it"""
-                return ''.join(self.char2char[c] for c in nucleotide)[::-1]
+                return nucleotide.translate(COMPLEMENT)[::-1]
                 # if len(nucleotide)==1:#nucleotide
                 #         if nucleotide=="A": return "T"
                 #         if nucleotide=="T": return "A"
@@ -237,8 +288,8 @@ class VARIANT():
                 nmLow=None
                 #Two paths mapped
                 if self.upper_path.mappingPosition>0 and self.lower_path.mappingPosition>0:             #Checks if both paths are mapped 
-                        nmUp=int(self.upper_path.dicoMappingPos[self.upper_path.mappingPosition][0])    #Distance with the reference for the snpUp
-                        nmLow=int(self.lower_path.dicoMappingPos[self.lower_path.mappingPosition][0])   #Distance with the reference for the snpLow
+                        nmUp=self.upper_path.mainMismatch                                               #Distance with the reference for the snpUp
+                        nmLow=self.lower_path.mainMismatch                                              #Distance with the reference for the snpLow
                         if nmUp<nmLow:                                                                  #Checks if the upper path has a distance with the reference smaller than the lower path
                                 self.lower_path.boolRef=False                                           # Defines the boolean to know which path will be defined as reference
                                 self.upper_path.boolRef=True 
@@ -446,24 +497,37 @@ class VARIANT():
 #############################################################################################
 class PATH():
         """corresponds to one path of a discoSnp prediction"""
+        __slots__=("listCoverage","mainPosition","mainMismatch","listNucleotideReverse","listNucleotideForward","boolReverse","posMut","cigarcode","boolRef","nucleoRef","nucleo",
+                   "listPosVariantOnPathToKeep","listPosReverse","listPosForward","correctedPos","listFQQuality","listSam","discoName","seq","mappingPosition","XA")
         def __init__(self,line):
                 self.listCoverage=[]                                    #list of all the coverage by sample for the path
-                self.dicoMappingPos={}                                  #dictionnary with all the mapping positions associated with their number of mismatches with the reference
                 self.listNucleotideReverse=[]                           #list of all the variant (snp) of the path on the reverse strand
                 self.listNucleotideForward=[]                           #list of all the variant (snp) of the path on the forward strand                
+                self.listPosReverse=[]                                  #mapping position(s) of the variant on the path (if it is mapped on the reverse strand)
+                self.listPosForward=[]                                  #mapping position(s) of the variant on the path (if it is mapped on the forward strand)
+                self.Reset(line)
+
+        def Reset(self,line):
+                """(Re)initializes the path with its line of the file ; the containers are emptied and reused"""
+                self.listCoverage.clear()
+                self.listNucleotideReverse.clear()
+                self.listNucleotideForward.clear()
+                self.listPosReverse.clear()
+                self.listPosForward.clear()
+                self.XA=None                                            #XA tag of the samfile (alternative hits), decoded on demand (see IterAlternativeHits)
+                self.mainPosition=None                                  #main mapping position given by the mapper
+                self.mainMismatch=None                                  #number of mismatches with the reference at the main mapping position (None if unmapped)
                 self.boolReverse=None                                   #Boolean to know if the strand is reverse(-1) or forward(1)
                 self.posMut=None                                        #MD tag of the samfile "MD:Z:5A10A0A25G17" =>  5A10A0A25G17
                 self.cigarcode=None                                     #cigarcode of the samfile "61M"
                 self.boolRef=None                                       #Boolean to know if the path is identical to the reference
                 self.nucleoRef=None                                     #Nucleotide corresponding to the variant on the reference
                 self.nucleo=None                                        #nucleotide corresponding of the variant on the path
-                self.listPosVariantOnPathToKeep=[]                      #list of the positions of all the variant on the in case of Reverse or Forward mapped path
-                self.listPosReverse=[]                                  #mapping position(s) of the variant on the path (if it is mapped on the reverse strand)
-                self.listPosForward=[]                                  #mapping position(s) of the variant on the path (if it is mapped on the forward strand)
+                self.listPosVariantOnPathToKeep=()                      #list of the positions of all the variant on the in case of Reverse or Forward mapped path (listPosReverse or listPosForward)
                 self.correctedPos=0                                     #list or position of the mapping variant by taking into account the shift with the reference
                 self.listFQQuality=[]                                   #string of all the quality scores of every variant
-                if ">" not in line:                                     # Case of samfile
-                        self.listSam=line.rstrip('\r').rstrip('\n').split('\t')
+                if isinstance(line,list) or ">" not in line:            # Case of samfile (or bamfile : the record is already decoded into the fields of a sam line)
+                        self.listSam=line if isinstance(line,list) else line.rstrip('\r').rstrip('\n').split('\t')
                         self.discoName=self.listSam[0]
                         self.seq=self.listSam[9]                        #gets the sequence of the path
                         self.mappingPosition=abs(int(self.listSam[3]))  #mapping position of the path
@@ -479,30 +543,15 @@ class PATH():
                        self.boolReverse="."                             #We need to define the absence of strand           
 
         def RetrieveXA(self,VCFObject):
-                # print ("RetrieveXA",VCFObject.XA)
-
-                # self.filterField=None
-                # self.variantType=None
-                # self.phased=None #phased genotype
-                # self.formatField=None
-                # self.genotypes="" #genotype field =>put it in the vcf
-                # self.chrom=""
-                # self.ref=""
-                # self.alt=""
-                # self.qual=""
-                # self.nucleoRef=None
-                # self.reverse=""
-                # self.XA=None
-                
+                """Fills the XA field of the VCF object with the alternative hits of the path : only needed (and decoded) for MULTIPLE variants"""
                 VCFObject.XA=""
-                # print ("self.dicoMappingPos.items()",self.dicoMappingPos.items())
-                # print ("self.listPosVariantOnPathToKeep", self.listPosVariantOnPathToKeep)
-                for position,(NM,cigarcode) in self.dicoMappingPos.items():
-                       if cigarcode!="":
-                                VCFObject.XA+=position.split('_')[0]+'_'+str(shift_from_cigar_code(cigarcode,abs(int(position.split('_')[-1]))+self.listPosVariantOnPathToKeep[0]-1))+"," # todo: sens + décalage du variant.
+                if VCFObject.filterField!="MULTIPLE" or self.XA is None:
+                        return
+                alternativeHits={position:cigarcode for position,nbMismatch,cigarcode in self.IterAlternativeHits()}
+                for position,cigarcode in alternativeHits.items():
+                        VCFObject.XA+=position.split('_')[0]+'_'+str(shift_from_cigar_code(cigarcode,abs(int(position.split('_')[-1]))+self.listPosVariantOnPathToKeep[0]-1))+"," # todo: sens + décalage du variant.
                 if VCFObject.XA:
                         VCFObject.XA=VCFObject.XA.rstrip(',')
-                # print ("And now RetrieveXA",VCFObject.XA)
                 
                             
 #---------------------------------------------------------------------------------------------------------------------------
@@ -513,46 +562,44 @@ class PATH():
                 
                 
         def RetrieveDicoMappingPosition(self):
-                """Retrieves for each path alignment information in a list ; retrieves a dictionary with all the positions of a path and the number of associated mismatch"""
+                """Retrieves the main mapping position of the path with its number of mismatch ; the XA tag is only kept, its alternative hits are decoded on demand"""
                 variant=self.listSam
-                listXA=None
-                strXA=None
-                alternative_positions=None
-                nbMismatch=None
-                variant_position = abs(int(variant[3]))
-                variant_chromosome = variant[2]
-                #Error list with mapping positions very close to the first position given by bwa
-                # listerreur=set([(int(variant[3])-1),(int(variant[3])+1),(int(variant[3])+2),(int(variant[3])+3),(int(variant[3])-3),(int(variant[3])-2),int(variant[3])])
-                #Creation of a dict with mapping position associated with number of mismatch
-                
-                if 'XA:Z' in ''.join(variant): # XA: tag for multiple mapping : Checks if the upper path is multiple mapped : XA Alternative hits; format: (chr,pos,CIGAR,NM;)*
-                        # print ("hohoho", variant)
+                if 'XA:Z' in ''.join(variant): # XA: tag for multiple mapping : Checks if the path is multiple mapped : XA Alternative hits; format: (chr,pos,CIGAR,NM;)*
                         for item in variant:
                                 if "XA" in item:
-                                        #Parsing XA tag
-                                        listXA=item.split(":")[2].split(';')
-                                        strXA = ','.join(listXA)
-                                        listXA = strXA.split(',')
-                                        listXA.pop()
-                                        alternative_positions=listXA     #position=[chrom1,pos1,cigarcode1,number of mismatch1 , chrom2,pos2,cigarcode2,number of mismatch2,...]. pos_i may be negative, in case of revcomp mapping.
                                         self.XA=item
                                         break                #no need to search for XA in other fields
-                        i=1
-                        while i<len(alternative_positions): #Runs through the list 4 by 4 to get all the positions 
-                                # print (alternative_positions)
-                                if alternative_positions[i-1]==variant_chromosome and abs(int(alternative_positions[i])) > variant_position-4 and abs(int(alternative_positions[i]))<variant_position+4: 
-                                    i+=4
-                                    continue #Checks if the position is not too close to the main one
-                                # if abs(int(position[i])) not in listerreur : #Checks if the position is not too close to the main one
-                                self.dicoMappingPos[alternative_positions[i-1]+"_"+alternative_positions[i]]=[int(alternative_positions[i+2]), alternative_positions[i+1]]#the position is associated to the number of mismatch in a dictionary
-                                # print ("self.dicoMappingPos["+alternative_positions[i-1]+"_"+alternative_positions[i],"=",int(alternative_positions[i+2]), alternative_positions[i+1])
-                                i+=4
-                                
-
-                if variant_position>0:#adds the main mapping position to the dictionary of all mapping positions
+                variant_position = abs(int(variant[3]))
+                if variant_position>0:#keeps the main mapping position with its number of mismatch
                       posMut,nbMismatch=self.GetTag()
                       #In case of mapped variant without MD TAG :
-                      self.dicoMappingPos[abs(int(variant[3]))]=[int(nbMismatch),""]
+                      self.mainPosition=variant_position
+                      self.mainMismatch=int(nbMismatch)
+#---------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------------------------------------------------------------------------
+        def IterAlternativeHits(self):
+                """Decodes on demand the alternative hits of the XA tag : yields (position,number of mismatch,cigarcode) for each hit which is not too close to the main position.
+                position is "chromosome_pos" where pos may be negative, in case of revcomp mapping."""
+                if self.XA is None:
+                        return
+                variant_position = abs(int(self.listSam[3]))
+                variant_chromosome = self.listSam[2]
+                for hit in self.XA.split(":")[2].split(';'):
+                        if not hit:
+                                continue
+                        chromosome,position,cigarcode,nbMismatch=hit.split(',')
+                        #Checks if the position is not too close to the main one
+                        if chromosome==variant_chromosome and abs(int(position)) > variant_position-4 and abs(int(position))<variant_position+4:
+                                continue
+                        yield (chromosome+"_"+position,int(nbMismatch),cigarcode)
+#---------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------------------------------------------------------------------------
+        def IterMappingPositions(self):
+                """Yields (position,number of mismatch) for the main mapping position (if any) then for the alternative hits, decoded on demand"""
+                if self.mainMismatch is not None:
+                        yield (self.mainPosition,self.mainMismatch)
+                for position,nbMismatch,cigarcode in self.IterAlternativeHits():
+                        yield (position,nbMismatch)
 #---------------------------------------------------------------------------------------------------------------------------
 #
 #FLAG = field to test
@@ -588,55 +635,8 @@ class PATH():
 #---------------------------------------------------------------------------------------------------------------------------          
         def CigarcodeChecker(self):
                 """Checks in the cigarcode of the samfile if there is a shift in the alignment between the path and the reference"""
-                cigarcode=self.listSam[5]               
-                parsingCigarCode=re.findall('(\d+|[A-Za-z])',cigarcode) #ParsingCigarCode=['2', 'S', '3', 'M', '1', 'I', '25', 'M']
-                listPosRef=[]
-                listShift=[]
-                somme=0
-                shift=0
-                pos=0
-                i=1
-                j=0
-                listpol=self.listPosVariantOnPathToKeep
-                while i<len(parsingCigarCode):#Goes through the list by twos to get all the letters and to take them into account
-                        if parsingCigarCode[i]=="S":
-                                shift-=int(parsingCigarCode[i-1])
-                                pos+=int(parsingCigarCode[i-1])
-                        elif parsingCigarCode[i]=="M":
-                                pos+=int(parsingCigarCode[i-1])
-                        elif parsingCigarCode[i]=="D":
-                                shift+=int(parsingCigarCode[i-1])
-                        elif parsingCigarCode[i]=="I":
-                                shift-=int(parsingCigarCode[i-1])#There is a nucleotide of shift compared to the reference
-                                pos+=int(parsingCigarCode[i-1]) #We advance in the query SEQ
-                        #Hard clipping (clipped sequences NOT present in SEQ)
-                        elif parsingCigarCode[i]=="H":
-                                shift-=int(parsingCigarCode[i-1]) # It's the shift in the alignment between the reference and the sequence of the variant 
-                                pos+=int(parsingCigarCode[i-1])
-                        #Padding (silent deletion from padded reference)
-                        elif parsingCigarCode[i]=="P":
-                                shift+=int(parsingCigarCode[i-1])
-                                pos+=int(parsingCigarCode[i-1])
-                        elif parsingCigarCode[i]=="=":
-                                pos+=int(parsingCigarCode[i-1])
-                        elif parsingCigarCode[i]=="X":
-                                pos+=int(parsingCigarCode[i-1])
-                        if len(listpol)==1:#Simple SNP and INDEL
-                                if pos>=int(listpol[0]):
-                                        posRef=int(listpol[0])+shift#takes into account the shift to add the after the mapping position and the variant position in the sequence                                
-                                        listShift.append(shift)
-                                        listPosRef.append(posRef)
-                                        return(listPosRef,listShift)
-                        elif len(listpol)>1:#Close SNPs
-                                while int(pos)>=int(listpol[j]):#Goes through the list of position (close snps) and see if the position is affected by the shift (means shift before the position)self.listNucleotideForward
-                                        posRef=int(listpol[j])+shift #Add the shift to the position (to get the real position of the snp on the reference)
-                                        listPosRef.append(posRef) #Add the position to the list by taking into account the shift only if the current position 
-                                        listShift.append(shift)
-                                        if j<(len(listpol)-1):
-                                                j+=1
-                                        else:
-                                                return(listPosRef,listShift)
-                        i+=2                
+                listPosRef,listShift=WalkCigar(self.listSam[5],tuple(int(pos) for pos in self.listPosVariantOnPathToKeep))
+                return(list(listPosRef),list(listShift))
 #---------------------------------------------------------------------------------------------------------------------------
 #Example of unmmaped variant : soft clipping of the variant
 #['SNP_higher_path_146392|P_1:30_A/G,P_2:45_C/T,P_3:48_T/G|high|nb_pol_3|left_unitig_length_157|right_unitig_length_564|C1_13|C2_1|G1_0/1:389,20,170|G2_1/1:828,117,10|rank_0.43053', '0', 'gi|224384768|gb|CM000663.1|', '229146041', '52', '79M', '*', '0', '0', 'CTTTCTATCTCAAAAGCAGCCACAGACCACATGTAAACAAATAAGCGGTGCCATGTTCCAATAAAACTTTATTTACAGA', '*', 'NM:i:5', 'MD:Z:15T23G1G4T23G8', 'AS:i:54', 'XS:i:30']
@@ -646,59 +646,20 @@ class PATH():
 #SNP_higher_path_215581|P_1:30_C/G|low|nb_pol_1|left_unitig_length_8|right_unitig_length_1|C1_7|C2_17|G1_0/1:554,48,75|G2_0/1:268,13,248|rank_0.32064	0	gi|224384768|gb|CM000663.1|	232979913	7	31S30M	*	0	0	TCAAGACCAGCCTAGGCAACATAGAGATACCATGTCTCTACAAAAAATTAAAAAAAAAAAA	*	NM:i:0	MD:Z:30	AS:i:30	XS:i:28	XA:Z:gi|224384768|gb|CM000663.1|,-241321283,29M32S,1;gi|224384768|gb|CM000663.1|,-114672467,28M33S,0;
 #SNP_lower_path_215581|P_1:30_C/G|low|nb_pol_1|left_unitig_length_8|right_unitig_length_1|C1_31|C2_18|G1_0/1:554,48,75|G2_0/1:268,13,248|rank_0.32064	16	gi|224384768|gb|CM000663.1|	65214684	37	59M2S	*	0	0	TTTTTTTTTTTTAATTTTTTGTAGAGACATCGTATCTCTATGTTGCCTAGGCTGGTCTTGA	*	NM:i:3	MD:Z:16A23A5A12	AS:i:44	XS:i:30
 #---------------------------------------------------------------------------------------------------------------------------                               
-        def ReferenceChecker(self,shift,posCentraleRef,VCFObject,PosVariant):
-                """Function which allows to get the MD tag parsing; checks if path nucleotide is identical to the reference nucleotide"""
-                i=0
-                posMut,nbMismatch=self.GetTag()
-                boolDel=True
-                pos=shift
+        def ReferenceChecker(self,shift,nucleoRef,VCFObject):
+                """Checks if path nucleotide is identical to the reference nucleotide, from the nucleotide of the reference given by the MD tag walk (see AlignmentWalk)"""
                 #Allows or disallows soft clip in BWA
                 #if int(shift)<=-(int(PosVariant)):#Test if the variant is really mapped (soft clipping > variant position => unmmaped variant)
                 if int(shift)<=-2:#we allow 2 soft clip (for bwa mem)
                       self.boolRef=False
                       self.mappingPosition=0#It is considered that the path is unmapped
                       return()  
-                nucleoRef=None
-                boolEgalRef=None
-                matchInt=None
-                parsingPosMut=re.findall('(\d+|[A-Za-z]|\^)',posMut)
-                while i<len(parsingPosMut):#Converts the number into integer 
-                        matchInt=re.match(r'\d+',parsingPosMut[i]) #Integer motif
-                        if matchInt:
-                                parsingPosMut[i]=int(parsingPosMut[i])
-                        i+=1
-                i=0
-                while i<len(parsingPosMut): #Goes through the list to know if the variant is identical to the reference
-                        if isinstance(parsingPosMut[i],int): #Checks if it's a number of nucleotide or a letter
-                                pos+=parsingPosMut[i] #Adds to pos the current number of the list
-                        elif parsingPosMut[i]=="^":#In case of deletion from the reference we have to substract the deletion from the current position  
-                                i+=1
-                                while boolDel: #Checks if it is still a letter in the deletion to substract it from the current position
-                                        if isinstance(parsingPosMut[i],int): #If it is an integer we achieved to take into account the deletion : adds the integer to the current position
-                                                boolDel=False
-                                                pos+=parsingPosMut[i]
-                                        else:
-                                                pos-=1 #Substracts the nucleotide from the current position
-                                                i+=1
-                                boolDel=True
-                        else:
-                                pos+=1
-                        if pos==posCentraleRef: # Checks if the current position pos is identical to the position of the variant 
-                                if isinstance(parsingPosMut[i],str): #=> it means that the nucleotide is different in the variant and in the reference
-                                        self.boolRef=False
-                                        self.nucleoRef=parsingPosMut[i]
-                                        break
-                                else: #If the last item of the list of the MD tag is an integer => it means that the nucleotide of the allele is identical to the reference
-                                        self.boolRef=True
-                                        break
-                        if pos>posCentraleRef: #If the current position is bigger than the variant position it means that the nucleotide of the variant is identical to the reference
-                                self.boolRef=True
-                                break
-                        i+=1
-                if pos<posCentraleRef:#Case of large soft clip
+                if nucleoRef==None: #The nucleotide of the allele is identical to the reference
+                        self.boolRef=True
+                else: #=> it means that the nucleotide is different in the variant and in the reference ("." in case of large soft clip)
                         self.boolRef=False
-                        self.nucleoRef="." 
-                VCFObject.nucleoRef=nucleoRef  
+                        self.nucleoRef=nucleoRef
+                VCFObject.nucleoRef=None
     # boolEgalRef : boolean if TRUE the nucleotide in the variant is equal to the reference
     # nucleoRef : if the nucleotide is different from the reference return the nucleotide of reference
 #---------------------------------------------------------------------------------------------------------------------------
@@ -754,13 +715,14 @@ class PATH():
                 boolRef=None
                 nucleoRef=None
                 if int(self.mappingPosition)>0:
-                        #Gets the shift by positions (insertion,deletion,sofclipping) and update of the position on the path
-                        listCorrectedPos,listShift=self.CigarcodeChecker()
+                        #Gets the shift by positions (insertion,deletion,sofclipping), update of the position on the path and nucleotide of the reference, in one walk of the cigarcode and of the MD tag
+                        posMut,nbMismatch=self.GetTag()
+                        listCorrectedPos,listShift,listNucleoRef=AlignmentWalk(self.listSam[5],posMut,self.listPosVariantOnPathToKeep)
                         self.correctedPos=listCorrectedPos
                         #Defines if the path is identical to the reference and what is the nucleotide on the reference
                         i=0
                         for i in range(len(listCorrectedPos)):#Loops on the list of corrected positions
-                                self.ReferenceChecker(listShift[i],listCorrectedPos[i],VCFObject,self.listPosVariantOnPathToKeep[i])#Checks if the path is identical to the reference genome
+                                self.ReferenceChecker(listShift[i],listNucleoRef[i],VCFObject)#Checks if the path is identical to the reference genome
                                 if int(self.mappingPosition)<=0:# Case => variant considered as unmapped because of soft clipping so we have to check again if the mapping position
                                         break
                                 if self.boolReverse=="1" and self.listNucleotideForward!=[]:#If we are on the forward strand => defines the nucleotide for the current snp or indel.
@@ -807,6 +769,7 @@ class PATH():
 #############################################################################################
 #############################################################################################
 class SNP(VARIANT):
+        __slots__=()
         def __init__(self,line1,line2):
                 VARIANT.__init__(self,line1,line2)
 #---------------------------------------------------------------------------------------------------------------------------
@@ -891,8 +854,12 @@ class SNP(VARIANT):
 #############################################################################################
 #############################################################################################
 class INDEL(VARIANT):
+        __slots__=("insertForward","insertReverse","ntStartForward","ntStartReverse","smallestSequence","longestSequenceForward","longestSequenceReverse")
         def __init__(self,line1,line2):
                 VARIANT.__init__(self,line1,line2)
+
+        def InitFields(self):
+                VARIANT.InitFields(self)
                 self.insertForward=None
                 self.insertReverse=None
                 self.ntStartForward=None
@@ -1040,10 +1007,14 @@ class INDEL(VARIANT):
 #############################################################################################
 #############################################################################################
 class SNPSCLOSE(VARIANT):
+        __slots__=("dicoCloseSNPUp","dicoCloseSNPLow")
         def __init__(self,line1,line2):
                 VARIANT.__init__(self,line1,line2)        
-                self.dicoCloseSNPUp={} #dictionnary with all the informations for close snps : boolean to know if the allele is identical to the reference,position on the variant, reverse nucleotide for the allele, if the path is reverse or not, mapping position
-                self.dicoCloseSNPLow={}
+
+        def InitFields(self):
+                VARIANT.InitFields(self)
+                self.dicoCloseSNPUp=None #dictionnary with all the informations for close snps : boolean to know if the allele is identical to the reference,position on the variant, reverse nucleotide for the allele, if the path is reverse or not, mapping position (see RetrieveDicoClose)
+                self.dicoCloseSNPLow=None
                 
 #---------------------------------------------------------------------------------------------------------------------------
 #---------------------------------------------------------------------------------------------------------------------------                   
@@ -1233,7 +1204,12 @@ class SNPSCLOSE(VARIANT):
 #############################################################################################
 #############################################################################################        
 class VCFFIELD():
+        __slots__=("filterField","variantType","phased","formatField","genotypes","chrom","ref","alt","qual","nucleoRef","reverse","XA")
         def __init__(self):
+                self.Reset()
+
+        def Reset(self):
+                """(Re)initializes the VCF fields : the object can be reused for a new bubble"""
                 ##VCF Fields
                 self.filterField=None
                 self.variantType=None
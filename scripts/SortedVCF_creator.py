@@ -0,0 +1,205 @@
+#!/bin/python
+# -*- coding: utf-8 -*-
+###############################################
+#Sorted, bgzip compressed and tabix indexed output of VCF_creator
+#Dresscode : class : uppercase
+#            function : begins with a capital
+#            variable : words separated by capital
+import os
+import sys
+import struct
+import zlib
+import heapq
+import tempfile
+#############################################################################################
+#INDEX_____________________________________________________________________________________________________________
+#________________class BGZFWRITER(): writes a BGZF file (blocked gzip, readable by gzip/zcat, bgzip and tabix)________________
+#      write(self,data):"""Writes bytes ; full blocks are compressed on the fly"""
+#      Tell(self):"""Virtual offset of the next byte (compressed offset of the block << 16 | offset in the block)"""
+#      close(self):"""Writes the last block and the EOF marker"""
+#________________class TABIXINDEX(): binning and linear index of a sorted VCF (.tbi)________________
+#      AddRecord(self,chrom,beg,end,startOffset,endOffset):"""Indexes a record from its interval (0-based, end excluded) and its virtual offsets"""
+#      Write(self,indexFileName):"""Writes the .tbi file"""
+#________________class SORTEDVCFWRITER(): file-like object given to VCF_creator instead of the VCF file________________
+#      write(self,text):"""Receives the text of the VCF ; the records are sorted by (CHROM,POS) by bounded runs"""
+#      close(self):"""Merges the runs, writes the bgzip VCF and its tabix index"""
+#      Reg2bin(beg,end):"""Bin of the interval [beg,end[ in the UCSC/tabix binning scheme"""
+#      RecordKey(line):"""Sort key of a VCF record : (CHROM,POS)"""
+#############################################################################################
+BGZF_BLOCK_SIZE=0xff00 #Maximal number of uncompressed bytes in a block (as in htslib)
+BGZF_EOF=b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+TBI_MIN_SHIFT=14 #Size of the windows of the linear index : 16kb
+TBI_META_BIN=37450 #Pseudo-bin holding the offsets and the number of records of a sequence
+SORT_BUFFER_LINES=500000 #Number of VCF records sorted in memory before being written in a temporary run
+
+def Reg2bin(beg,end):
+        """Bin of the interval [beg,end[ in the UCSC/tabix binning scheme"""
+        end-=1
+        if beg>>14==end>>14: return ((1<<15)-1)//7+(beg>>14)
+        if beg>>17==end>>17: return ((1<<12)-1)//7+(beg>>17)
+        if beg>>20==end>>20: return ((1<<9)-1)//7+(beg>>20)
+        if beg>>23==end>>23: return ((1<<6)-1)//7+(beg>>23)
+        if beg>>26==end>>26: return ((1<<3)-1)//7+(beg>>26)
+        return 0
+
+def RecordKey(line):
+        """Sort key of a VCF record : (CHROM,POS)"""
+        fields=line.split('\t',2)
+        try:
+                return (fields[0],int(fields[1]))
+        except (IndexError,ValueError):
+                return (fields[0],0)
+
+#---------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------------------------------------------------------------------------
+class BGZFWRITER():
+        """Writes a BGZF file : gzip members of at most 64kb, each of them storing its compressed size (BC extra field)"""
+        def __init__(self,fileName):
+                self.file=open(fileName,'wb')
+                self.buffer=bytearray()
+                self.blockAddress=0 #Compressed offset of the block being filled
+        def write(self,data):
+                """Writes bytes ; full blocks are compressed on the fly"""
+                self.buffer+=data
+                while len(self.buffer)>=BGZF_BLOCK_SIZE:
+                        self.FlushBlock(BGZF_BLOCK_SIZE)
+        def Tell(self):
+                """Virtual offset of the next byte (compressed offset of the block << 16 | offset in the block)"""
+                return (self.blockAddress<<16)|len(self.buffer)
+        def FlushBlock(self,size):
+                data=bytes(self.buffer[:size])
+                del self.buffer[:size]
+                compressor=zlib.compressobj(6,zlib.DEFLATED,-15)
+                cdata=compressor.compress(data)+compressor.flush()
+                block=b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00"+struct.pack("<H",len(cdata)+25)+cdata+struct.pack("<II",zlib.crc32(data)&0xffffffff,len(data))
+                self.file.write(block)
+                self.blockAddress+=len(block)
+        def close(self):
+                """Writes the last block and the EOF marker"""
+                if self.buffer:
+                        self.FlushBlock(len(self.buffer))
+                self.file.write(BGZF_EOF)
+                self.file.close()
+
+#---------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------------------------------------------------------------------------
+class TABIXINDEX():
+        """Binning and linear index of a bgzip VCF sorted by (CHROM,POS), in the tabix (.tbi) format"""
+        def __init__(self):
+                self.listChrom=[]       #sequences in the order of the file
+                self.dicoBins={}        #dicoBins[chrom][bin]=[[startOffset,endOffset],...] chunks of records
+                self.dicoLinear={}      #dicoLinear[chrom]=[smallest offset of the records overlapping each 16kb window]
+                self.dicoMeta={}        #dicoMeta[chrom]=[first offset,last offset,number of records]
+        def AddRecord(self,chrom,beg,end,startOffset,endOffset):
+                """Indexes a record from its interval (0-based, end excluded) and its virtual offsets"""
+                if chrom not in self.dicoBins:
+                        self.listChrom.append(chrom)
+                        self.dicoBins[chrom]={}
+                        self.dicoLinear[chrom]=[]
+                        self.dicoMeta[chrom]=[startOffset,endOffset,0]
+                meta=self.dicoMeta[chrom]
+                meta[1]=endOffset
+                meta[2]+=1
+                chunks=self.dicoBins[chrom].setdefault(Reg2bin(beg,end),[])
+                if chunks and chunks[-1][1]==startOffset: #Contiguous with the previous record of the bin
+                        chunks[-1][1]=endOffset
+                else:
+                        chunks.append([startOffset,endOffset])
+                linear=self.dicoLinear[chrom]
+                lastWindow=(end-1)>>TBI_MIN_SHIFT
+                while len(linear)<=lastWindow:
+                        linear.append(None)
+                for window in range(beg>>TBI_MIN_SHIFT,lastWindow+1):
+                        if linear[window] is None:
+                                linear[window]=startOffset
+        def Write(self,indexFileName):
+                """Writes the .tbi file (itself bgzip compressed)"""
+                names=b"".join(chrom.encode()+b"\0" for chrom in self.listChrom)
+                #format 2 (VCF), columns of the sequence name, start and end (0 : end deduced from REF), meta character '#', no skipped line
+                data=[b"TBI\1",struct.pack("<8i",len(self.listChrom),2,1,2,0,ord('#'),0,len(names)),names]
+                for chrom in self.listChrom:
+                        bins=self.dicoBins[chrom]
+                        firstOffset,lastOffset,nbRecords=self.dicoMeta[chrom]
+                        data.append(struct.pack("<i",len(bins)+1))
+                        for binNumber in sorted(bins):
+                                chunks=bins[binNumber]
+                                data.append(struct.pack("<Ii",binNumber,len(chunks)))
+                                for startOffset,endOffset in chunks:
+                                        data.append(struct.pack("<QQ",startOffset,endOffset))
+                        data.append(struct.pack("<IiQQQQ",TBI_META_BIN,2,firstOffset,lastOffset,nbRecords,0))
+                        linear=self.dicoLinear[chrom]
+                        previous=firstOffset
+                        for window in range(len(linear)): #Empty windows take the offset of the previous one
+                                if linear[window] is None:
+                                        linear[window]=previous
+                                previous=linear[window]
+                        data.append(struct.pack("<i",len(linear)))
+                        data.append(struct.pack("<%dQ" % len(linear),*linear))
+                data.append(struct.pack("<Q",0)) #no record without coordinate
+                indexFile=BGZFWRITER(indexFileName)
+                indexFile.write(b"".join(data))
+                indexFile.close()
+
+#---------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------------------------------------------------------------------------
+class SORTEDVCFWRITER():
+        """File-like object replacing the VCF file of VCF_creator : the header is kept as it is, the records are sorted by (CHROM,POS)
+        (input order kept for equal keys) with runs of at most bufferLines records in memory, then written bgzip compressed with a tabix index (<fileName>.tbi)"""
+        def __init__(self,fileName,bufferLines=SORT_BUFFER_LINES):
+                self.fileName=fileName
+                self.bufferLines=bufferLines
+                self.listHeader=[]      #lines of the header
+                self.listRecord=[]      #records of the current run
+                self.listRun=[]         #temporary files of the sorted runs
+                self.pending=[]         #text received after the last end of line
+                self.tempDir=os.path.dirname(os.path.abspath(fileName))
+        def write(self,text):
+                """Receives the text of the VCF (any piece of it)"""
+                if '\n' not in text:
+                        self.pending.append(text)
+                        return
+                if self.pending:
+                        self.pending.append(text)
+                        text=''.join(self.pending)
+                        self.pending=[]
+                lines=text.split('\n')
+                last=lines.pop()
+                if last:
+                        self.pending.append(last)
+                for line in lines:
+                        if line.startswith('#'):
+                                self.listHeader.append(line)
+                        else:
+                                self.listRecord.append(line)
+                if len(self.listRecord)>=self.bufferLines:
+                        self.WriteRun()
+        def WriteRun(self):
+                """Sorts the records in memory and writes them in a temporary file"""
+                self.listRecord.sort(key=RecordKey)
+                run=tempfile.TemporaryFile(mode='w+',dir=self.tempDir)
+                for line in self.listRecord:
+                        run.write(line+'\n')
+                run.seek(0)
+                self.listRun.append(run)
+                self.listRecord=[]
+        def close(self):
+                """Merges the runs, writes the bgzip VCF and its tabix index"""
+                if self.pending:
+                        self.write('\n')
+                self.listRecord.sort(key=RecordKey)
+                #Runs are given in the input order : heapq.merge keeps the input order of the records with the same key
+                records=heapq.merge(*[(line.rstrip('\n') for line in run) for run in self.listRun],iter(self.listRecord),key=RecordKey)
+                VCF=BGZFWRITER(self.fileName)
+                index=TABIXINDEX()
+                VCF.write(''.join(line+'\n' for line in self.listHeader).encode())
+                for line in records:
+                        startOffset=VCF.Tell()
+                        VCF.write((line+'\n').encode())
+                        fields=line.split('\t',4)
+                        chrom,pos=RecordKey(line)
+                        beg=max(pos-1,0)
+                        index.AddRecord(chrom,beg,beg+max(len(fields[3]) if len(fields)>3 else 1,1),startOffset,VCF.Tell())
+                VCF.close()
+                index.Write(self.fileName+".tbi")
+                for run in self.listRun:
+                        run.close()
@@ -24,12 +24,32 @@ import subprocess
 import re
 import time
 import getopt
+import itertools
+import collections
+import multiprocessing
+import cProfile
 from functionObjectVCF_creator import *
 from ClassVCF_creator import *
+from SortedVCF_creator import SORTEDVCFWRITER
+from BamVCF_creator import BAMREADER
 
+BATCH_SIZE=2000 #Number of couples of paths sent at once to a process in --threads mode
 
 
 
+#---------------------------------------------------------------------------------------------------------------------------
+#---------------------------------------------------------------------------------------------------------------------------
+def WriteBatch(pendingBatch,VCFFile,filtered_sam_file):
+    """Writes the results of a batch treated by the pool (waits for it if needed)"""
+    batch,asyncResult=pendingBatch
+    VCFText,listFilter=asyncResult.get()
+    VCFFile.write(VCFText)
+    if filtered_sam_file:
+        for couple,filterField in zip(batch,listFilter):
+            if filterField!=".":
+                filtered_sam_file.write(SamText(couple[0]))
+                filtered_sam_file.write(SamText(couple[1]))
+
 #Help
 def usage():
     usage= """
@@ -38,9 +58,16 @@ def usage():
     ################################
     
     -h --help : print this message
-    -s --sam_file : <file>.sam of the alignment
+    -s --sam_file : <file>.sam or <file>.bam of the alignment (or the discoSnp++ <file>.fa in ghost mode). "-" reads the standard input
+       --stdin : reads the input from the standard input (same as "-s -" or a lone "-" argument)
+       --format : sam, bam or fasta. Format of the input; mandatory when reading the standard input, otherwise deduced from the file name
+                  e.g. bwa mem <ref> <disco_file> | python VCF_creator.py - --format sam -o <file>.vcf
 
     -o --output : vcf file 
+    -z --bgzip : the vcf file is sorted by (CHROM,POS), bgzip compressed and indexed by tabix (<output>.tbi) ; use a .vcf.gz output name
+    -t --threads : number of processes treating the bubbles (default 1). The output is identical whatever the number of processes
+       --profile : prints on the standard error the wall time and number of calls of each stage of the treatment (serial mode)
+       --profile_output : with --profile, also writes a cProfile dump in this file (readable with pstats)
     -f --output_filtered_SAM : if provided, a SAM file in which uncorrectly mapped prediction (corresponding to filter '.' in the provided VCF) are removed is output in this file.
     
     """
@@ -53,9 +80,17 @@ def main():
     nbGeno=0 #number of genotype for every path
     filtered_sam=False
     filtered_sam_file=""
+    fileName=None
+    fileFormat=None
+    boolmyname=False
+    nbThreads=1
+    VCFFileName=None
+    boolBgzip=False
+    boolProfile=False
+    profileFileName=None
     ###OPTIONS 
     try:
-        opts, args = getopt.getopt(sys.argv[1:],"h:s:o:f:",["help","sam_file=","output=","output_filtered_SAM="])
+        opts, args = getopt.gnu_getopt(sys.argv[1:],"h:s:o:f:t:z",["help","sam_file=","output=","output_filtered_SAM=","stdin","format=","threads=","bgzip","profile","profile_output="])
         if not opts:
             usage()
             sys.exit(2)
@@ -63,14 +98,24 @@ def main():
         print(e)
         usage()
         sys.exit(2)
+    if "-" in args: #a lone "-" argument reads the standard input
+        opts.append(("--stdin",""))
     for opt, arg in opts : 
         if opt in ("-h", "--help"):
             usage()
             sys.exit(2)
+        elif opt=="--stdin" or (opt in ("-s","--sam_file") and arg=="-"):
+            fileName="stdin"
+            stream_file=sys.stdin
+        elif opt=="--format":
+            if arg in ("sam","bam","fasta"):
+                fileFormat=arg
+            else:
+                print("!! Unknown format :" +str(arg)+" (sam, bam or fasta) !!")
+                sys.exit(2)
         elif opt in ("-s","--sam_file"):
-            boolmyname=False
             fileName=arg
-            if os.path.isfile(fileName):#checks if the file exists
+            if os.path.exists(fileName):#checks if the file exists (it may also be a named pipe)
                    listNameFile=fileName.split(".")
                    if "BWA_OPT" in listNameFile[0]: #When the stream_file is created by run_VCF_creator.sh ; it adds BWA_OPT to separate the name of the file and the BWA options
                            boolmyname=True #Boolean to know if the file name contains the option of BWA
@@ -80,16 +125,24 @@ def main():
             else : 
                   print("!! No file :" +str(arg)+"!!")
                   sys.exit(2)  
+        elif opt in ("-t","--threads"):
+            try:
+                nbThreads=int(arg)
+            except ValueError:
+                print("!! Number of threads must be an integer :" +str(arg)+"!!")
+                sys.exit(2)
         elif opt in ("-o","--output"):
-            if arg!=None:
-                    VCFFile = open(arg,'w')
-            else :
-                    print("!! No output !!")
-                    sys.exit(2)      
+            VCFFileName=arg
+        elif opt in ("-z","--bgzip"):
+            boolBgzip=True
+        elif opt=="--profile":
+            boolProfile=True
+        elif opt=="--profile_output":
+            profileFileName=arg
         elif opt in ("-f","--output_filtered_SAM"):
             if arg!=None:
                 filtered_sam = True
-                filtered_sam_file = open(arg,'w')
+                filtered_sam_file = arg #opened once the options are checked
             else:
                 print("!! No filtered sam output !!")
                 sys.exit(2)      
@@ -98,71 +151,101 @@ def main():
             usage()
             sys.exit(2)
 
+    if fileName==None:
+        print("!! No input file !!")
+        usage()
+        sys.exit(2)
+    if VCFFileName==None:
+        print("!! No output !!")
+        sys.exit(2)
+    if fileFormat==None: #Without --format, the format is deduced from the file name
+        if fileName=="stdin":
+            print("!! --format sam|bam|fasta is mandatory when reading the standard input !!")
+            sys.exit(2)
+        if fileName.endswith(".bam"):
+            fileFormat="bam"
+        elif ".sam" in fileName:
+            fileFormat="sam"
+        elif ".fa" in fileName:
+            fileFormat="fasta"
+        else:
+            print("!! Unable to deduce the format of "+str(fileName)+" : use --format sam|bam|fasta !!")
+            sys.exit(2)
+    #The outputs are created once the options are checked, so that an error leaves no empty output
+    if boolBgzip: #The records are sorted and compressed when the file is closed
+        VCFFile=SORTEDVCFWRITER(VCFFileName)
+    else:
+        VCFFile=open(VCFFileName,'w')
+    if filtered_sam:
+        filtered_sam_file=open(filtered_sam_file,'w')
+
+    if boolProfile:
+        if nbThreads>1:
+            print("--profile : the stages are measured in serial mode, --threads is ignored",file=sys.stderr)
+            nbThreads=1
+        EnableProfiling()
+        profiler=cProfile.Profile() if profileFileName else None
+        startTime=time.perf_counter()
+        if profiler:
+            profiler.enable()
+    #Reads the input once until the first record to get the number of genotypes, the Q fields and the field index (first occurrence of "contig", and so on)
+    boolSam=fileFormat!="fasta" #Alignment of the bubbles (sam or bam) or ghost mode (fasta)
+    if fileFormat=="bam": #The records are decoded from the binary stream into the fields of their sam line
+        bamReader=BAMREADER(stream_file.buffer)
+        if filtered_sam:
+            filtered_sam_file.writelines(bamReader.listHeader)
+        records=bamReader.Records()
+        nbGeno,boolQuality,fieldIndex,bufferedRecords=SniffBamSchema(records)
+        lines=itertools.chain(bufferedRecords,records)
+    else:
+        nbGeno,boolQuality,fieldIndex,bufferedLines=SniffSchema(stream_file,boolSam)
+        lines=itertools.chain(bufferedLines,stream_file) #the lines read by SniffSchema are given back before the rest of the stream
     #Creates the VCF file and prints the header into it 
-    PrintVCFHeader(VCFFile,listName,fileName,boolmyname)
-    nbGeno=CounterGenotype(fileName)
-    #---------------------------------------------------------------------------------------------------------------------------
-    #---------------------------------------------------------------------------------------------------------------------------
-    #Generates the field index (first occurrence of "contig", and so on)
-    fieldIndex=GetIndex(fileName)
+    PrintVCFHeader(VCFFile,listName,fileName,boolmyname,nbGeno,boolQuality)
 
 
     #---------------------------------------------------------------------------------------------------------------------------
     #---------------------------------------------------------------------------------------------------------------------------
-    #Start to read the file two lines by two lines
-    if ".sam" in fileName: #Checks if it's a stream_file
-            while True:
-                    line1=stream_file.readline()   
-                    if not line1: break #End of file
-                    if line1.startswith('@'):
-                            if filtered_sam:
-                                    filtered_sam_file.write(line1) 
-                            continue #We do not read headers                
-                    while True:
-                            listline1=line1.split("\t")  
-                            if int(listline1[1]) & 2048 :#checks if it's not a secondary alignment => means splitted aligned sequence 
-                                    line1=stream_file.readline()
-                            else:break
-                    line2=stream_file.readline() #Read couple of lines
-                    while True:
-                            listline2=line2.split("\t") 
-                            if int(listline2[1]) & 2048 :#checks if it's not a secondary alignment => means splitted aligned sequence 
-                                    line2=stream_file.readline()
-                            else:break       
-                    #Initializes variant object with the samline
-                    #if InitVariant(line1,line2)[0]==1:
-                    #        continue
-                    variant_object, vcf_field_object=InitVariant(line1,line2,fileName, fieldIndex) #Fills the object with the line of the stream_file        
-                    if variant_object.CheckCoupleVariantID()==1: #Checks whether the two lines are from the same path
-                            sys.exit(1)
-                    #Checks the mapping on reference and determines the shift with the reference, which path is the reference ...
-                    table=MappingTreatement(variant_object,vcf_field_object,nbGeno)
+    #Start to read the file two lines by two lines (sam) or four lines by four lines (fasta)
+    if fileFormat=="bam":
+            couples=ReadBamCouples(lines)
+    elif boolSam: #Checks if it's a stream_file
+            couples=ReadSamCouples(lines,filtered_sam_file if filtered_sam else None)
+    else: #Treatement of the fasta file (no mapping information)
+            couples=ReadFastaCouples(lines)
+    if nbThreads<=1:
+            for couple in couples:
+                    filterField=TreatCouple(couple,boolSam,fileName,fieldIndex,nbGeno,VCFFile)
                     #Added by Pierre Peterlongo, Sept 2015. Outputs a new SAM file corresponding to mapped sequences (PASS or MULTIPLE)
-                    if(filtered_sam and vcf_field_object.filterField!="."):
-                        filtered_sam_file.write(line1)
-                        filtered_sam_file.write(line2)
-                
-                    #Fills the VCF file
-                    variant_object.FillVCF(VCFFile,nbGeno,table,vcf_field_object)
-                  
-
-            
-
-    elif ".fa" in fileName: #Treatement of the fasta file (no mapping information)
-            while True:
-                    line1=stream_file.readline()
-                    if not line1: break #End of file
-                    seq1=stream_file.readline() #Reads the seq associate to the variant
-                    line2=stream_file.readline() #Reads a couple of line
-                    seq2=stream_file.readline()
-                    #Initializes variant object with the samline
-                    variant_object, vcf_field_object=InitVariant(line1,line2,fileName, fieldIndex)
-                    table=UnmappedTreatement(variant_object,vcf_field_object,nbGeno,seq1,seq2)
-                    variant_object.FillVCF(VCFFile,nbGeno,table,vcf_field_object)
-
-
-    VCFFile.close()
-    stream_file.close()
+                    if(filtered_sam and filterField!="."):
+                        filtered_sam_file.write(SamText(couple[0]))
+                        filtered_sam_file.write(SamText(couple[1]))
+    else:
+            #Batches of couples are treated by a pool of processes ; results are written in the input order so that the output is identical to the one of the serial mode
+            pool=multiprocessing.Pool(nbThreads)
+            pending=collections.deque()
+            for batch in ReadBatches(couples,BATCH_SIZE):
+                    pending.append((batch,pool.apply_async(TreatBatch,(batch,boolSam,fileName,fieldIndex,nbGeno))))
+                    if len(pending)>=2*nbThreads: #Bounds the number of batches in memory
+                            WriteBatch(pending.popleft(),VCFFile,filtered_sam_file if filtered_sam else None)
+            while pending:
+                    WriteBatch(pending.popleft(),VCFFile,filtered_sam_file if filtered_sam else None)
+            pool.close()
+            pool.join()
+
+
+    if boolProfile:
+        closeTime=time.perf_counter()
+        VCFFile.close()
+        AddProfileTime("Output writing",time.perf_counter()-closeTime)
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profileFileName)
+        PrintProfile(time.perf_counter()-startTime,sys.stderr)
+    else:
+        VCFFile.close()
+    if stream_file is not sys.stdin:
+        stream_file.close()
     if filtered_sam:
         filtered_sam_file.close()
 
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+
+
+''' ***********************************************
+
+    Throughput benchmark of VCF_creator
+
+    Generates a synthetic bwa-style SAM file (simulate_disco_sam.py), then measures
+      - end to end : VCF_creator.main run in a child process (wall time, records/s, peak RSS of this process)
+      - per stage : InitVariant, MappingTreatement and FillVCF timed on every couple of paths, in a new process (with its peak RSS)
+    and reports the results as JSON.
+    With --compare, the records/s are compared to a previous report and the exit status is 1
+    if one of them dropped by more than the tolerance.
+
+    *********************************************** '''
+
+import os
+import sys
+import io
+import json
+import time
+import getopt
+import inspect
+import platform
+import resource
+import tempfile
+import itertools
+import subprocess
+import multiprocessing
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+
+from simulate_disco_sam import DiscoSamSimulator
+from functionObjectVCF_creator import SniffSchema, ReadSamCouples, InitVariant, MappingTreatement, RECYCLED
+
+STAGES = ["InitVariant", "MappingTreatement", "FillVCF"]
+
+# VCF_creator.main run in the child process ; when it exits, it writes its peak RSS in the file given as first argument
+END_TO_END = '''
+import sys
+rss_file_name = sys.argv.pop(1)
+sys.argv[0] = 'VCF_creator.py'
+try:
+    import VCF_creator
+    VCF_creator.main()
+finally:
+    sys.path.insert(0, %r)
+    from benchmark_VCF_creator import peak_rss_kb
+    with open(rss_file_name, "w") as rss_file:
+        rss_file.write(str(peak_rss_kb()))
+''' % BENCHMARK_DIR
+
+
+def peak_rss_kb():
+    '''
+        Peak RSS (kB) of the current process: VmHWM is the peak of its own memory, whereas the maximum given by getrusage
+        is inherited through fork and exec (the one of a child process would include the benchmark process)
+        '''
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:  # not Linux
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_end_to_end(sam_file_name, vcf_file_name, nb_records, extra_arguments):
+    '''
+        Runs VCF_creator.main in a child process ; returns its wall time, records/s and peak RSS (kB, the one of
+        the VCF_creator process, not of its worker processes with --threads)
+        '''
+    rss_file_name = vcf_file_name + ".rss"
+    command = [sys.executable, "-c", END_TO_END, rss_file_name, "-s", sam_file_name, "-o", vcf_file_name] + extra_arguments
+    start = time.perf_counter()
+    returncode = subprocess.call(command, cwd=SCRIPTS_DIR, stdout=subprocess.DEVNULL)
+    seconds = time.perf_counter() - start
+    if returncode != 0:
+        print("!! VCF_creator failed on " + sam_file_name + " !!")
+        sys.exit(1)
+    with open(rss_file_name) as rss_file:
+        peak_rss = int(rss_file.read())
+    os.remove(rss_file_name)
+    os.remove(vcf_file_name)
+    return {"seconds": round(seconds, 4), "records_per_s": round(nb_records / seconds, 1), "peak_rss_kb": peak_rss}
+
+
+def run_stages(sam_file_name):
+    '''
+        Treats every couple of paths of the sam file as VCF_creator does, timing each stage ; returns the number of couples, the timings
+        and the peak RSS (kB) of the process
+        '''
+    seconds = dict.fromkeys(STAGES, 0.0)
+    nb_records = 0
+    clock = time.perf_counter
+    vcf_buffer = io.StringIO()
+    with open(sam_file_name) as stream_file:
+        nb_geno, bool_quality, field_index, buffered_lines = SniffSchema(stream_file, True)
+        for line1, line2 in ReadSamCouples(itertools.chain(buffered_lines, stream_file), None):
+            start = clock()
+            variant_object, vcf_field_object = InitVariant(line1, line2, sam_file_name, field_index, RECYCLED)
+            middle = clock()
+            table = MappingTreatement(variant_object, vcf_field_object, nb_geno)
+            end = clock()
+            variant_object.FillVCF(vcf_buffer, nb_geno, table, vcf_field_object)
+            seconds["InitVariant"] += middle - start
+            seconds["MappingTreatement"] += end - middle
+            seconds["FillVCF"] += clock() - end
+            nb_records += 1
+            if vcf_buffer.tell() > 1 << 24:  # the VCF lines are not kept
+                vcf_buffer.seek(0)
+                vcf_buffer.truncate()
+    stages = {}
+    for stage in STAGES:
+        stages[stage] = {"seconds": round(seconds[stage], 4),
+                         "records_per_s": round(nb_records / seconds[stage], 1) if seconds[stage] else None}
+    return nb_records, stages, peak_rss_kb()
+
+
+def run_stages_process(sam_file_name):
+    '''
+        run_stages in a new process (spawned, it does not share the memory of the benchmark) ; returns the number of couples,
+        the timings and the peak RSS (kB) of this process
+        '''
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_stages, (sam_file_name,))
+
+
+def simulation_parameters(parameters):
+    '''
+        Parameters of the DiscoSamSimulator, the given ones and the default values of the other ones
+        '''
+    effective = {name: parameter.default for name, parameter in inspect.signature(DiscoSamSimulator).parameters.items()}
+    effective.update(parameters)
+    return effective
+
+
+def compare(report, previous_report, tolerance):
+    '''
+        Prints the relative change of every records/s with respect to a previous report ; returns the list of regressions
+        '''
+    regressions = []
+    if report["input"] != previous_report.get("input"):
+        print("!! The inputs of the reports differ, the records/s may not be comparable !!", file=sys.stderr)
+    measures = [("end_to_end", report["end_to_end"], previous_report.get("end_to_end"))]
+    measures += [(stage, report["stages"][stage], previous_report.get("stages", {}).get(stage)) for stage in STAGES]
+    for name, current, previous in measures:
+        if not previous or not previous.get("records_per_s") or not current.get("records_per_s"):
+            continue
+        change = current["records_per_s"] / previous["records_per_s"] - 1
+        print("%-18s %10.1f records/s  (%+.1f%%)" % (name, current["records_per_s"], 100 * change), file=sys.stderr)
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def usage():
+    print('''
+    ################################
+        Benchmark of VCF_creator
+    ################################
+
+    -n --bubbles : number of simulated bubbles (default 20000)
+    -i --input : benchmarks this sam file instead of a simulated one
+    -r --repeat : number of end to end runs, the fastest is reported (default 3)
+    -o --output : writes the JSON report in this file (default : standard output)
+    -c --compare : previous JSON report ; exit status 1 if a records/s dropped by more than the tolerance
+       --tolerance : tolerated slowdown for --compare (default 0.1, i.e. 10%)
+       --threads : number of processes given to VCF_creator for the end to end runs (default 1)
+       --samples, --snp, --close, --indel, --softclip, --xa, --xa_hits, --unmapped, --seed : parameters of the simulation
+                  (see simulate_disco_sam.py)
+    -h --help : print this message
+    ''')
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:i:r:o:c:", ["help", "bubbles=", "input=", "repeat=", "output=", "compare=", "tolerance=",
+                                                                "threads=", "samples=", "snp=", "close=", "indel=", "softclip=", "xa=",
+                                                                "xa_hits=", "unmapped=", "seed="])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    nb_bubbles = 20000
+    input_file_name = None
+    repeat = 3
+    output_file_name = None
+    previous_report_name = None
+    tolerance = 0.1
+    vcf_creator_arguments = []
+    parameters = {}
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif opt in ("-n", "--bubbles"):
+            nb_bubbles = int(arg)
+        elif opt in ("-i", "--input"):
+            input_file_name = arg
+        elif opt in ("-r", "--repeat"):
+            repeat = max(1, int(arg))
+        elif opt in ("-o", "--output"):
+            output_file_name = arg
+        elif opt in ("-c", "--compare"):
+            previous_report_name = arg
+        elif opt == "--tolerance":
+            tolerance = float(arg)
+        elif opt == "--threads":
+            vcf_creator_arguments = ["-t", arg]
+        elif opt == "--samples":
+            parameters["nb_samples"] = int(arg)
+        elif opt == "--xa_hits":
+            parameters["max_xa_hits"] = int(arg)
+        elif opt == "--seed":
+            parameters["seed"] = int(arg)
+        else:
+            parameters["p_" + opt[2:]] = float(arg)
+
+    temporary_dir = tempfile.TemporaryDirectory()
+    vcf_file_name = os.path.join(temporary_dir.name, "benchmark.vcf")
+    if input_file_name:
+        sam_file_name = os.path.abspath(input_file_name)
+    else:
+        sam_file_name = os.path.join(temporary_dir.name, "benchmark.sam")
+        with open(sam_file_name, "w") as sam_file:
+            DiscoSamSimulator(**parameters).write(sam_file, nb_bubbles)
+
+    nb_records, stages, stages_peak_rss = run_stages_process(sam_file_name)
+    runs = [run_end_to_end(sam_file_name, vcf_file_name, nb_records, vcf_creator_arguments) for _ in range(repeat)]
+    report = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "input": input_file_name if input_file_name else {"bubbles": nb_bubbles, "simulation": simulation_parameters(parameters)},
+        "records": nb_records,
+        "end_to_end": min(runs, key=lambda run: run["seconds"]),
+        "stages": stages,
+        "stages_peak_rss_kb": stages_peak_rss,
+    }
+    temporary_dir.cleanup()
+
+    text = json.dumps(report, indent=2)
+    if output_file_name:
+        with open(output_file_name, "w") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
+    if previous_report_name:
+        with open(previous_report_name) as previous_file:
+            regressions = compare(report, json.load(previous_file), tolerance)
+        if regressions:
+            print("!! Performance regression : " + ", ".join(regressions) + " !!", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+
+
+''' ***********************************************
+
+    Synthetic data generator for VCF_creator benchmarks
+
+    Simulates a random genome and discoSnp++ bubbles (SNP, close SNPs and INDEL) taken from it,
+    and writes them as bwa-style SAM pairs (input of VCF_creator) and, optionally, as the
+    discoSnp++ fasta file (ghost mode input).
+    The proportions of each type of bubble, of soft-clipped, unmapped and reverse paths,
+    of paths with XA alternative hits and the number of samples are tunable.
+
+    Used by benchmark_VCF_creator.py
+
+    *********************************************** '''
+
+import sys
+import getopt
+import random
+
+COMPLEMENT = str.maketrans("ACGTacgt", "TGCAtgca")
+
+
+def reverse_complement(sequence):
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def random_sequence(rng, length):
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+
+def other_base(rng, base):
+    return rng.choice([b for b in "ACGT" if b != base])
+
+
+def md_and_nm(query, reference, cigar, start):
+    '''
+        Returns the MD tag and the edit distance (NM) of query aligned on reference[start:]
+        cigar:  list of (length, operation)
+        '''
+    md = []
+    run = 0
+    nm = 0
+    q = 0
+    r = start
+    for length, operation in cigar:
+        if operation == "S":
+            q += length
+        elif operation == "M":
+            for _ in range(length):
+                if query[q] == reference[r]:
+                    run += 1
+                else:
+                    md.append(str(run))
+                    md.append(reference[r])
+                    run = 0
+                    nm += 1
+                q += 1
+                r += 1
+        elif operation == "I":
+            q += length
+            nm += length
+        elif operation == "D":
+            md.append(str(run))
+            md.append("^" + reference[r:r + length])
+            run = 0
+            r += length
+            nm += length
+    md.append(str(run))
+    return "".join(md), nm
+
+
+def cigar_string(cigar):
+    return "".join(str(length) + operation for length, operation in cigar)
+
+
+class DiscoSamSimulator:
+    '''
+        Random genome and discoSnp++ bubbles aligned on it.
+        p_snp, p_close, p_indel:    proportions of isolated SNPs, close SNPs (nb_pol 2 to 4) and indels
+        p_softclip:                 proportion of SNP paths with a soft-clipped start
+        p_xa, max_xa_hits:          proportion of paths with an XA tag, and maximal number of alternative hits
+        p_unmapped, p_reverse:      proportions of unmapped paths and of bubbles taken on the reverse strand
+        p_supplementary:            proportion of paths followed by a supplementary alignment (flag 2048)
+        quality:                    if True, the headers have Q fields
+        '''
+
+    def __init__(self, seed=1, nb_samples=2, nb_chrom=3, chrom_length=200000, p_snp=0.5, p_close=0.25, p_indel=0.25,
+                 p_softclip=0.1, p_xa=0.2, max_xa_hits=5, p_unmapped=0.1, p_reverse=0.5, p_supplementary=0.02, quality=True):
+        self.rng = random.Random(seed)
+        self.nb_samples = nb_samples
+        self.chromosomes = [("chr" + str(i + 1), random_sequence(self.rng, chrom_length)) for i in range(nb_chrom)]
+        self.genome = dict(self.chromosomes)
+        total = float(p_snp + p_close + p_indel)
+        self.p_snp = p_snp / total
+        self.p_close = p_close / total
+        self.p_softclip = p_softclip
+        self.p_xa = p_xa
+        self.max_xa_hits = max_xa_hits
+        self.p_unmapped = p_unmapped
+        self.p_reverse = p_reverse
+        self.p_supplementary = p_supplementary
+        self.quality = quality
+
+    def header_fields(self):
+        '''
+            Returns the extension fields, the coverage fields of each path, the fields common to both paths
+            and the left and right contig lengths (at least the unitig ones)
+            '''
+        rng = self.rng
+        lengths = [rng.randint(0, 300), rng.randint(0, 300), rng.randint(300, 900), rng.randint(300, 900)]
+        extensions = ["%s_length_%d" % (name, length) for name, length in zip(["left_unitig", "right_unitig", "left_contig", "right_contig"], lengths)]
+        coverage_up = ["C%d_%d" % (i + 1, rng.randint(0, 200)) for i in range(self.nb_samples)]
+        coverage_low = ["C%d_%d" % (i + 1, rng.randint(0, 200)) for i in range(self.nb_samples)]
+        common = []
+        if self.quality:
+            common += ["Q%d_%d" % (i + 1, rng.randint(0, 40)) for i in range(self.nb_samples)]
+        for i in range(self.nb_samples):
+            genotype = rng.choice(["0/0", "0/1", "1/1", "./."])
+            common.append("G%d_%s:%d,%d,%d" % (i + 1, genotype, rng.randint(0, 3000), rng.randint(0, 500), rng.randint(0, 3000)))
+        common.append("rank_%.5f" % rng.random())
+        return extensions, coverage_up, coverage_low, common, lengths[2:]
+
+    def template(self, sequence, start, length, reverse):
+        window = sequence[start:start + length]
+        return reverse_complement(window) if reverse else window
+
+    def flanks(self, sequence, start, length, reverse, contig_lengths):
+        '''
+            Returns the left and right contig extensions of the path template(sequence, start, length, reverse) in the fasta file,
+            taken from the chromosome around it (as a circular one, near its ends)
+            '''
+        left_length, right_length = contig_lengths
+        if reverse:  # the left extension of the path is on the right of the window
+            left_length, right_length = right_length, left_length
+        double = sequence + sequence
+        left = double[(start - left_length) % len(sequence):][:left_length]
+        right = double[(start + length) % len(sequence):][:right_length]
+        if reverse:
+            return reverse_complement(right), reverse_complement(left)
+        return left, right
+
+    def bubble(self, bubble_id):
+        '''
+            Returns (type, upper name, upper path, lower name, lower path, chromosome, start, indel information, reverse,
+            contig extensions of the paths)
+            '''
+        rng = self.rng
+        draw = rng.random()
+        reverse = rng.random() < self.p_reverse
+        chromosome, sequence = rng.choice(self.chromosomes)
+        extensions, coverage_up, coverage_low, common, contig_lengths = self.header_fields()
+        if draw < self.p_snp + self.p_close:
+            nb_pol = 1 if draw < self.p_snp else rng.randint(2, 4)
+            offsets = [30]
+            while len(offsets) < nb_pol:
+                offsets.append(offsets[-1] + rng.randint(1, 8))
+            length = offsets[-1] + 31
+            start = rng.randint(10, len(sequence) - length - 10)
+            reference = self.template(sequence, start, length, reverse)
+            path_up = list(reference)
+            path_low = list(reference)
+            alleles = []
+            for offset in offsets:
+                alternative = other_base(rng, reference[offset])
+                if rng.random() < 0.5:
+                    path_low[offset] = alternative
+                else:
+                    path_up[offset] = alternative
+                if rng.random() < 0.1:  # neither path is identical to the reference
+                    path_up[offset] = other_base(rng, reference[offset])
+                    path_low[offset] = other_base(rng, path_up[offset])
+                alleles.append("P_%d:%d_%s/%s" % (len(alleles) + 1, offset, path_up[offset], path_low[offset]))
+            head = [",".join(alleles), rng.choice(["high", "low"]), "nb_pol_%d" % nb_pol]
+            name_up = "|".join(["SNP_higher_path_%d" % bubble_id] + head + extensions + coverage_up + common)
+            name_low = "|".join(["SNP_lower_path_%d" % bubble_id] + head + extensions + coverage_low + common)
+            return ("SNP", name_up, "".join(path_up), name_low, "".join(path_low), chromosome, start, None, reverse,
+                    self.flanks(sequence, start, length, reverse, contig_lengths))
+        indel_length = rng.randint(1, 6)
+        ambiguity = rng.randint(0, 3)
+        left_length = 30 - ambiguity
+        start = rng.randint(10, len(sequence) - 200)
+        short_length = 61
+        head = ["P_1:30_%d_%d" % (indel_length, ambiguity), rng.choice(["high", "low"]), "nb_pol_1"]
+        insertion = random_sequence(rng, indel_length)
+        reference_has_insertion = rng.random() < 0.5
+        if reference_has_insertion:
+            reference = self.template(sequence, start, short_length + indel_length, reverse)
+            longer = reference
+            shorter = reference[:left_length] + reference[left_length + indel_length:]
+        else:
+            reference = self.template(sequence, start, short_length, reverse)
+            shorter = reference
+            longer = reference[:left_length] + insertion + reference[left_length:]
+        upper_is_short = rng.random() < 0.5
+        path_up, path_low = (shorter, longer) if upper_is_short else (longer, shorter)
+        name_up = "|".join(["INDEL_higher_path_%d" % bubble_id] + head + extensions + coverage_up + common)
+        name_low = "|".join(["INDEL_lower_path_%d" % bubble_id] + head + extensions + coverage_low + common)
+        return ("INDEL", name_up, path_up, name_low, path_low, chromosome, start,
+                (left_length, indel_length, reference_has_insertion, upper_is_short), reverse,
+                self.flanks(sequence, start, len(reference), reverse, contig_lengths))
+
+    def alternative_hits(self, chromosome, start, length):
+        '''
+            Returns a random XA tag value : (chr,pos,CIGAR,NM;)*
+            '''
+        rng = self.rng
+        hits = []
+        for _ in range(rng.randint(1, self.max_xa_hits)):
+            if rng.random() < 0.2:  # too close to the main position : ignored by VCF_creator
+                hit_chromosome, position = chromosome, start + 1 + rng.randint(-3, 3)
+            else:
+                hit_chromosome, position = rng.choice(self.chromosomes)[0], rng.randint(1, 100000)
+            cigar = rng.choice([str(length) + "M", "2S%dM" % (length - 2), "%dM3S" % (length - 3)])
+            hits.append("%s,%s%d,%s,%d;" % (hit_chromosome, rng.choice("+-"), position, cigar, rng.randint(0, 3)))
+        return "".join(hits)
+
+    def path_cigar(self, bubble_type, indel, is_upper, length):
+        if bubble_type == "SNP":
+            return [(length, "M")]
+        left_length, indel_length, reference_has_insertion, upper_is_short = indel
+        is_short = (is_upper == upper_is_short)
+        if reference_has_insertion and is_short:
+            return [(left_length, "M"), (indel_length, "D"), (length - left_length, "M")]
+        if not reference_has_insertion and not is_short:
+            return [(left_length, "M"), (indel_length, "I"), (length - left_length - indel_length, "M")]
+        return [(length, "M")]
+
+    def sam_line(self, name, path, chromosome, start, cigar, reverse, unmapped, xa):
+        if unmapped:
+            return "\t".join([name, "4", "*", "0", "0", "*", "*", "0", "0", path, "*", "AS:i:0", "XS:i:0"])
+        query = reverse_complement(path) if reverse else path
+        md, nm = md_and_nm(query, self.genome[chromosome], cigar, start)
+        fields = [name, "16" if reverse else "0", chromosome, str(start + 1), str(self.rng.randint(0, 60)), cigar_string(cigar),
+                  "*", "0", "0", query, "*", "NM:i:%d" % nm, "MD:Z:" + md, "AS:i:%d" % (len(path) - nm), "XS:i:0"]
+        if xa:
+            fields.append("XA:Z:" + xa)
+        return "\t".join(fields)
+
+    def bubble_records(self, bubble_id):
+        '''
+            Returns the sam lines of a bubble and its (upper name, upper path, lower name, lower path, contig extensions)
+            The sam paths are the bubble paths only, the fasta paths have the contig extensions
+            '''
+        rng = self.rng
+        bubble_type, name_up, path_up, name_low, path_low, chromosome, start, indel, reverse, flanks = self.bubble(bubble_id)
+        lines = []
+        for is_upper, name, path in ((True, name_up, path_up), (False, name_low, path_low)):
+            unmapped = rng.random() < self.p_unmapped
+            cigar = self.path_cigar(bubble_type, indel, is_upper, len(path))
+            path_start = start
+            if bubble_type == "SNP" and rng.random() < self.p_softclip:
+                clip = rng.randint(1, 3)
+                cigar = [(clip, "S"), (cigar[0][0] - clip, "M")]
+                if not reverse:
+                    path_start = start + clip
+            if reverse:
+                cigar = cigar[::-1]
+            xa = self.alternative_hits(chromosome, start, len(path)) if rng.random() < self.p_xa else None
+            lines.append(self.sam_line(name, path, chromosome, path_start, cigar, reverse, unmapped, xa))
+            if not unmapped and rng.random() < self.p_supplementary:
+                hit_chromosome = rng.choice(self.chromosomes)[0]
+                lines.append("\t".join([name, "2048", hit_chromosome, str(rng.randint(1, 1000)), "0", "20H%dM" % (len(path) - 20),
+                                        "*", "0", "0", path[20:], "*", "NM:i:0", "MD:Z:%d" % (len(path) - 20), "AS:i:0", "XS:i:0"]))
+        return lines, (name_up, path_up, name_low, path_low, flanks)
+
+    def write(self, sam_file, nb_bubbles, fasta_file=None):
+        '''
+            Writes nb_bubbles bubbles in sam_file (with its @SQ/@PG header) and, if given, in fasta_file
+            '''
+        for chromosome, sequence in self.chromosomes:
+            sam_file.write("@SQ\tSN:%s\tLN:%d\n" % (chromosome, len(sequence)))
+        sam_file.write("@PG\tID:bwa\tPN:bwa\tVN:0.7.17\n")
+        for bubble_id in range(1, nb_bubbles + 1):
+            lines, (name_up, path_up, name_low, path_low, (left, right)) = self.bubble_records(bubble_id)
+            for line in lines:
+                sam_file.write(line + "\n")
+            if fasta_file:  # discoSnp++ writes the extensions in lower case
+                left, right = left.lower(), right.lower()
+                fasta_file.write(">%s\n%s\n>%s\n%s\n" % (name_up, left + path_up + right, name_low, left + path_low + right))
+
+
+def usage():
+    print('''
+    ################################
+        Simulates discoSnp++ bubbles aligned by bwa
+    ################################
+
+    -n --bubbles : number of bubbles (default 10000)
+    -o --output : output sam file
+    -f --fasta : also writes the bubbles in this discoSnp++ fasta file (ghost mode input)
+       --samples : number of samples (default 2)
+       --snp, --close, --indel : proportions of isolated SNPs, close SNPs and indels (default 0.5, 0.25, 0.25)
+       --softclip : proportion of soft-clipped SNP paths (default 0.1)
+       --xa : proportion of paths with an XA tag (default 0.2)
+       --xa_hits : maximal number of alternative hits in an XA tag (default 5)
+       --unmapped : proportion of unmapped paths (default 0.1)
+       --no_quality : no Q fields in the headers
+       --seed : random seed (default 1)
+    -h --help : print this message
+    ''')
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:o:f:", ["help", "bubbles=", "output=", "fasta=", "samples=", "snp=", "close=", "indel=",
+                                                            "softclip=", "xa=", "xa_hits=", "unmapped=", "no_quality", "seed="])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    nb_bubbles = 10000
+    sam_file_name = None
+    fasta_file_name = None
+    parameters = {}
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif opt in ("-n", "--bubbles"):
+            nb_bubbles = int(arg)
+        elif opt in ("-o", "--output"):
+            sam_file_name = arg
+        elif opt in ("-f", "--fasta"):
+            fasta_file_name = arg
+        elif opt == "--samples":
+            parameters["nb_samples"] = int(arg)
+        elif opt == "--xa_hits":
+            parameters["max_xa_hits"] = int(arg)
+        elif opt == "--seed":
+            parameters["seed"] = int(arg)
+        elif opt == "--no_quality":
+            parameters["quality"] = False
+        else:
+            parameters["p_" + opt[2:]] = float(arg)
+    if sam_file_name is None:
+        print("!! No output !!")
+        usage()
+        sys.exit(2)
+    simulator = DiscoSamSimulator(**parameters)
+    with open(sam_file_name, "w") as sam_file:
+        if fasta_file_name:
+            with open(fasta_file_name, "w") as fasta_file:
+                simulator.write(sam_file, nb_bubbles, fasta_file)
+        else:
+            simulator.write(sam_file, nb_bubbles)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+
+
+''' ***********************************************
+
+    Bubble store: binary copy of a discoSnp++ bubble file (.fa), memory mapped by the tools reading it many times
+
+    The numeric values of the headers are stored in fixed-width columns (one value, or a fixed number of values,
+    per bubble): id, type, nb_pol, unitig/contig lengths, rank, and per sample coverage, quality and genotype.
+    The headers (as text) and the 2-bit packed sequences of each bubble are stored in a record, found through an
+    offset index. A bubble is found from its id in O(1) (id_to_row column) and the store gives back the exact
+    lines of the fasta file (see the Bubble class of disco_bubbles.py), so that read_bubbles also reads stores.
+
+    Conversion:
+        python bubble_store.py -i discoRes_k_31_c_2_D_0_P_3_b_2_coherent.fa [-o discoRes_k_31_c_2_D_0_P_3_b_2_coherent.fa.bst]
+
+    *********************************************** '''
+
+import re
+import sys
+import mmap
+import shutil
+import struct
+import getopt
+import tempfile
+from array import array
+
+from disco_bubbles import Bubble, read_bubbles
+
+STORE_MAGIC = b"DSBSTOR1"
+STORE_HEADER = struct.Struct("=8sqqqq") # magic, nb of bubbles, nb of samples, tig type, quality fields (0/1) ; followed by the (offset, size) of each section
+SECTION_ALIGNMENT = 8
+
+# Sections of a store, in the order of the file: name, typecode of its array
+SECTIONS = (("id", "q"),                # bubble id: 9 for SNP_higher_path_9
+            ("type", "b"),              # index in BUBBLE_TYPES, -1 for another type
+            ("nb_pol", "i"),
+            ("lengths", "i"),           # left unitig, right unitig, left contig, right contig length (-1 if absent): 4 per bubble
+            ("rank", "d"),
+            ("coverage", "i"),          # C of each sample for the higher path, then for the lower path: 2*nb_samples per bubble
+            ("quality", "i"),           # Q, idem (empty if the headers have no Q fields)
+            ("genotype", "b"),          # index in GENOTYPES of the genotype of each sample (-1 if other): nb_samples per bubble
+            ("header_length", "i"),     # bytes of the higher and lower path headers: 2 per bubble
+            ("sequence_length", "i"),   # length of the higher and lower path sequences: 2 per bubble
+            ("record_offset", "q"),     # offset of the record of each bubble in records, followed by the end of the last one
+            ("id_to_row", "i"),         # row of each bubble id, -1 if absent: max id + 1 values
+            ("records", "B"))           # per bubble: both headers, then the higher path sequence followed by the lower one, encoded at once (see encode_sequence)
+SECTION_NAMES = [name for name, typecode in SECTIONS]
+
+BUBBLE_TYPES = ("SNP", "INDEL")
+GENOTYPES = ("0/0", "0/1", "1/1", "./.")
+GENOTYPE_CODES = {genotype: code for code, genotype in enumerate(GENOTYPES)}
+
+# 2-bit encoding of the sequences: A C G T => 0 1 2 3, 4 bases per byte (the first one in the 2 highest bits)
+BASE_CODES = bytes.maketrans(b"ACGT", b"\x00\x01\x02\x03")
+CODE_BASES = bytes.maketrans(b"\x00\x01\x02\x03", b"ACGT")
+NON_ACGT = re.compile(rb"[^ACGT]+")
+LOWER_CASE = re.compile(rb"[a-z]+")
+RUN = struct.Struct("=ii")   # start and length of a run of lower case letters or of non ACGT characters
+COUNT = struct.Struct("=i")
+
+
+def is_bubble_store(file_name):
+    with open(file_name, "rb") as store_file:
+        return store_file.read(len(STORE_MAGIC)) == STORE_MAGIC
+
+
+def pack_codes(codes):
+    '''
+        Packs a sequence of codes 0..3 (bytes) 4 by 4, the length of codes being a multiple of 4
+        Each code is shifted inside its own byte of a big integer, so that the bytes are combined at once
+        '''
+    packed = 0
+    for shift, start in ((6, 0), (4, 1), (2, 2), (0, 3)):
+        packed |= int.from_bytes(codes[start::4], "big") << shift
+    return packed.to_bytes(len(codes) // 4, "big")
+
+
+def unpack_codes(packed):
+    '''
+        Reverse of pack_codes: returns a bytearray of 4*len(packed) codes 0..3
+        '''
+    nb_bytes = len(packed)
+    value = int.from_bytes(packed, "big")
+    mask = int.from_bytes(b"\x03" * nb_bytes, "big")
+    codes = bytearray(4 * nb_bytes)
+    for shift, start in ((6, 0), (4, 1), (2, 2), (0, 3)):
+        codes[start::4] = ((value >> shift) & mask).to_bytes(nb_bytes, "big")
+    return codes
+
+
+def encode_sequence(sequence):
+    '''
+        Encodes a sequence (bytes): its 2-bit packed bases, then the runs of non ACGT characters (packed as A) and the runs
+        of lower case letters. Each list of runs is a count followed by the (start, length) of each run ; the non ACGT
+        characters follow their runs
+        '''
+    upper = sequence.upper()
+    codes = NON_ACGT.sub(lambda run: b"A" * len(run.group()), upper).translate(BASE_CODES) + b"\x00" * (-len(upper) % 4)
+    other_runs = list(NON_ACGT.finditer(upper))
+    lower_runs = list(LOWER_CASE.finditer(sequence))
+    encoded = [pack_codes(codes), COUNT.pack(len(other_runs))]
+    encoded += [RUN.pack(run.start(), run.end() - run.start()) for run in other_runs]
+    encoded += [run.group() for run in other_runs]
+    encoded.append(COUNT.pack(len(lower_runs)))
+    encoded += [RUN.pack(run.start(), run.end() - run.start()) for run in lower_runs]
+    return b"".join(encoded)
+
+
+def read_runs(buffer, offset):
+    ''' Returns the list of the (start, length) of the runs written by encode_sequence at offset, and the offset following them '''
+    nb_runs = COUNT.unpack_from(buffer, offset)[0]
+    offset += COUNT.size
+    return [RUN.unpack_from(buffer, offset + i * RUN.size) for i in range(nb_runs)], offset + nb_runs * RUN.size
+
+
+def decode_sequence(buffer, offset, length):
+    '''
+        Decodes a sequence of length bases written by encode_sequence at offset in buffer
+        Returns the sequence (str) and the offset following its encoding
+        '''
+    nb_packed = (length + 3) // 4
+    sequence = unpack_codes(buffer[offset:offset + nb_packed]).translate(CODE_BASES)
+    del sequence[length:]
+    other_runs, offset = read_runs(buffer, offset + nb_packed)
+    for start, run_length in other_runs:
+        sequence[start:start + run_length] = buffer[offset:offset + run_length]
+        offset += run_length
+    lower_runs, offset = read_runs(buffer, offset)
+    for start, run_length in lower_runs:
+        sequence[start:start + run_length] = sequence[start:start + run_length].lower()
+    return sequence.decode(), offset
+
+
+class BubbleStoreWriter:
+    '''
+        Writes a bubble store from Bubble objects. The columns are written in temporary files while the bubbles are added,
+        then concatenated in the store by close
+        The layout of the headers (nb of samples, unitig/contig length fields, Q fields) is the one of the first bubble.
+        '''
+
+    def __init__(self, store_file_name):
+        self.store_file_name = store_file_name
+        self.columns = {name: tempfile.TemporaryFile() for name in SECTION_NAMES if name != "id_to_row"}
+        self.ids = array("q")
+        self.record_offset = 0
+        self.nb_samples = None
+        self.tig_type = 0
+        self.has_quality = False
+        self.length_fields = []
+
+    def set_layout(self, fields):
+        ''' Positions of the fields of the headers, from the first higher path header '''
+        self.length_fields = [i for i, field in enumerate(fields[:8]) if re.match(r"(left|right)_(unitig|contig)_length_", field)]
+        self.tig_type = len(self.length_fields) // 2
+        nb_fixed_fields = 4 + len(self.length_fields)
+        self.nb_samples = sum(1 for field in fields[nb_fixed_fields:] if re.match(r"C\d+_", field))
+        self.has_quality = fields[nb_fixed_fields + self.nb_samples].startswith("Q")
+        self.start_c = nb_fixed_fields
+        self.start_q = self.start_c + self.nb_samples
+        self.start_g = self.start_q + (self.nb_samples if self.has_quality else 0)
+
+    def write_column(self, name, typecode, values):
+        array(typecode, values).tofile(self.columns[name])
+
+    def add(self, bubble):
+        if bubble.lines[3] == "":
+            raise ValueError("Truncated bubble: " + bubble.lines[0].rstrip())
+        fields_up = bubble.fields_up
+        fields_low = bubble.fields_low
+        if self.nb_samples is None:
+            self.set_layout(fields_up)
+        name = fields_up[0].lstrip(">")
+        bubble_type = name[:name.rfind("_higher_path")]
+        self.ids.append(int(name.split("_")[-1]))
+        self.write_column("type", "b", [BUBBLE_TYPES.index(bubble_type) if bubble_type in BUBBLE_TYPES else -1])
+        self.write_column("nb_pol", "i", [int(fields_up[3].split("_")[-1])])
+        lengths = [int(fields_up[i].split("_")[-1]) for i in self.length_fields]
+        self.write_column("lengths", "i", lengths + [-1] * (4 - len(lengths)))
+        self.write_column("rank", "d", [float(fields_up[-1].split("_")[-1])])
+        end_c = self.start_c + self.nb_samples
+        self.write_column("coverage", "i", [int(field.split("_")[1]) for field in fields_up[self.start_c:end_c] + fields_low[self.start_c:end_c]])
+        if self.has_quality:
+            end_q = self.start_q + self.nb_samples
+            self.write_column("quality", "i", [int(field.split("_")[1]) for field in fields_up[self.start_q:end_q] + fields_low[self.start_q:end_q]])
+        genotypes = [field.split("_")[1].split(":")[0] for field in fields_up[self.start_g:self.start_g + self.nb_samples]]
+        self.write_column("genotype", "b", [GENOTYPE_CODES.get(genotype, -1) for genotype in genotypes])
+
+        headers = [bubble.header_up.encode(), bubble.header_low.encode()]
+        sequences = [bubble.sequence_up.encode(), bubble.sequence_low.encode()]
+        self.write_column("header_length", "i", [len(header) for header in headers])
+        self.write_column("sequence_length", "i", [len(sequence) for sequence in sequences])
+        self.write_column("record_offset", "q", [self.record_offset])
+        record = b"".join(headers) + encode_sequence(b"".join(sequences))
+        self.columns["records"].write(record)
+        self.record_offset += len(record)
+
+    def close(self):
+        self.write_column("record_offset", "q", [self.record_offset])
+        id_to_row = array("i", [-1]) * (max(self.ids) + 1 if self.ids else 0)
+        for row, bubble_id in enumerate(self.ids):
+            id_to_row[bubble_id] = row
+        self.columns["id_to_row"] = tempfile.TemporaryFile()
+        id_to_row.tofile(self.columns["id_to_row"])
+        self.columns["id"] = tempfile.TemporaryFile()
+        self.ids.tofile(self.columns["id"])
+
+        table_size = STORE_HEADER.size + 16 * len(SECTIONS)
+        offset = table_size
+        table = []
+        for name in SECTION_NAMES:
+            offset += -offset % SECTION_ALIGNMENT
+            size = self.columns[name].tell()
+            table += [offset, size]
+            offset += size
+        with open(self.store_file_name, "wb") as store_file:
+            store_file.write(STORE_HEADER.pack(STORE_MAGIC, len(self.ids), self.nb_samples or 0, self.tig_type, int(self.has_quality)))
+            store_file.write(struct.pack("=%dq" % len(table), *table))
+            for name, section_offset in zip(SECTION_NAMES, table[::2]):
+                store_file.write(b"\x00" * (section_offset - store_file.tell()))
+                column = self.columns[name]
+                column.seek(0)
+                shutil.copyfileobj(column, store_file)
+                column.close()
+        return len(self.ids)
+
+
+def write_bubble_store(fasta_file_name, store_file_name):
+    '''
+        Converts a discoSnp++ fasta file (plain or gzipped) into a bubble store ; returns the nb of bubbles
+        '''
+    writer = BubbleStoreWriter(store_file_name)
+    for bubble in read_bubbles(fasta_file_name):
+        writer.add(bubble)
+    return writer.close()
+
+
+class BubbleStore:
+    '''
+        Memory mapped bubble store. Each section is an array (memoryview) on the file: store.column("rank")[row]
+        The columns with several values per bubble are indexed by row * width + i (see SECTIONS)
+        '''
+
+    def __init__(self, store_file_name):
+        with open(store_file_name, "rb") as store_file:
+            self.buffer = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.nb_bubbles, self.nb_samples, self.tig_type, self.has_quality = STORE_HEADER.unpack_from(self.buffer)
+        if magic != STORE_MAGIC:
+            raise ValueError(store_file_name + " is not a bubble store")
+        table = struct.unpack_from("=%dq" % (2 * len(SECTIONS)), self.buffer, STORE_HEADER.size)
+        self.view = memoryview(self.buffer)
+        self.columns = {}
+        for (name, typecode), offset, size in zip(SECTIONS, table[::2], table[1::2]):
+            self.columns[name] = self.view[offset:offset + size].cast(typecode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        '''
+            Unmaps the file. The views given by column() remain valid: if the caller still holds one, the file is
+            unmapped when the last of them is dropped
+            '''
+        self.columns = {}
+        self.view.release()
+        try:
+            self.buffer.close()
+        except BufferError:  # views exported by column()
+            pass
+
+    def __len__(self):
+        return self.nb_bubbles
+
+    def __iter__(self):
+        return (self.bubble(row) for row in range(self.nb_bubbles))
+
+    def column(self, name):
+        ''' Array (memoryview) of a section, e.g. column("rank")[row] '''
+        return self.columns[name]
+
+    def row(self, bubble_id):
+        ''' Row of the bubble of id bubble_id (int), -1 if absent '''
+        id_to_row = self.columns["id_to_row"]
+        if 0 <= bubble_id < len(id_to_row):
+            return id_to_row[bubble_id]
+        return -1
+
+    def get(self, bubble_id):
+        ''' Bubble of id bubble_id (int), None if absent '''
+        row = self.row(bubble_id)
+        return self.bubble(row) if row >= 0 else None
+
+    def bubble_type(self, row):
+        ''' "SNP", "INDEL" or None '''
+        code = self.columns["type"][row]
+        return BUBBLE_TYPES[code] if code >= 0 else None
+
+    def unitig_lengths(self, row):
+        ''' Left and right unitig lengths (-1 if absent) '''
+        lengths = self.columns["lengths"]
+        return lengths[4 * row], lengths[4 * row + 1]
+
+    def coverage(self, row, sample, upper=True):
+        ''' Coverage of a sample (1-based, as in C1_) for the higher (upper) or lower path '''
+        return self.columns["coverage"][(2 * row + (0 if upper else 1)) * self.nb_samples + sample - 1]
+
+    def genotype(self, row, sample):
+        ''' Genotype of a sample (1-based): "0/1", ..., None for another value '''
+        code = self.columns["genotype"][row * self.nb_samples + sample - 1]
+        return GENOTYPES[code] if code >= 0 else None
+
+    def headers(self, row):
+        ''' Higher and lower path headers '''
+        records = self.columns["records"]
+        offset = self.columns["record_offset"][row]
+        length_up, length_low = self.columns["header_length"][2 * row:2 * row + 2]
+        return (bytes(records[offset:offset + length_up]).decode(),
+                bytes(records[offset + length_up:offset + length_up + length_low]).decode())
+
+    def sequences(self, row):
+        ''' Higher and lower path sequences '''
+        records = self.columns["records"]
+        offset = self.columns["record_offset"][row] + sum(self.columns["header_length"][2 * row:2 * row + 2])
+        length_up, length_low = self.columns["sequence_length"][2 * row:2 * row + 2]
+        sequences, offset = decode_sequence(records, offset, length_up + length_low)
+        return sequences[:length_up], sequences[length_up:]
+
+    def bubble(self, row):
+        ''' Bubble of a row, with the lines of the fasta file '''
+        header_up, header_low = self.headers(row)
+        sequence_up, sequence_low = self.sequences(row)
+        return Bubble((header_up + "\n", sequence_up + "\n", header_low + "\n", sequence_low + "\n"))
+
+
+def usage():
+    print(f'''-----------------------------------------------------------------------------
+{sys.argv[0]}  : conversion of a discoSnp++ fasta file into a bubble store
+-----------------------------------------------------------------------------
+usage:  {sys.argv[0]}  -i disco_bubbles.fa
+  -o: output bubble store (default = input file name + .bst)
+  -h: help
+-----------------------------------------------------------------------------''')
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hi:o:")
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    fasta_file = None
+    store_file = None
+    for opt, arg in opts:
+        if opt == "-h":
+            usage()
+            sys.exit()
+        elif opt == "-i":
+            fasta_file = arg
+        elif opt == "-o":
+            store_file = arg
+    if not fasta_file:
+        print("Error: option -i is mandatory")
+        usage()
+        sys.exit(2)
+    if not store_file:
+        store_file = fasta_file + ".bst"
+    nb_bubbles = write_bubble_store(fasta_file, store_file)
+    sys.stderr.write(f"{nb_bubbles} bubbles written in {store_file}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,17 +9,25 @@
     Author - Claire Lemaitre
     
     Usage:
-    python3 create_filtered_vcf.py -i disco_bubbles_coherent.fa [-o disco_bubbles_coherent.vcf -m 0.95 -r 0.4]
+    python3 create_filtered_vcf.py -i disco_bubbles_coherent.fa [-o disco_bubbles_coherent.vcf -m 0.95 -r 0.4 -t 8 --samples 1-10,15 --bubble_ids ids.txt --progress 60 --metrics metrics.json]
     
     *********************************************** '''
 
 
+import os
 import sys
 import getopt
 import random
 import re #regular expressions
 import time
+import shutil
+import tempfile
+import multiprocessing
 from vcf_formatting_functions import *
+from disco_bubbles import read_bubbles, bubble_ranges, is_gzipped
+from filter_metrics import FilterMetrics
+
+RANGES_PER_THREAD = 4 # with --threads, the fasta file is split in RANGES_PER_THREAD*threads parts, formatted in temporary vcf files
 
 def usage():
     '''Usage'''
@@ -30,14 +38,80 @@ def usage():
     print("  -r: min rank value filter (default = 0)")
     print("  -m: max missing value filter (default = 1)")
     print("  -o: output vcf file path (default = stdout)")
+    print("  -t: number of processes (default = 1). The output is identical whatever the number of processes")
+    print("  --samples: outputs only these samples, in this order: numbers (as in C3 or G3) and ranges separated by commas (eg. 1-10,15), or a file of such values")
+    print("             the missing value filter (-m) is computed on these samples")
+    print("  --bubble_ids: outputs only the bubbles of these ids (3 for SNP_higher_path_3): ids and ranges separated by commas, or a file of such values")
+    print("  --progress: writes every this number of seconds a progress line on stderr: bubbles/s, MB/s, ETA, rejected bubbles per filter (default = 0, none)")
+    print("  --metrics: writes at the end the totals (bubbles, kept, rejected per filter, rates) in this JSON file")
     print("  -h: help")
     print("-----------------------------------------------------------------------------")
     sys.exit(2)
 
 
+def read_id_list(argument):
+    '''
+        Returns the list of the numbers given by --samples or --bubble_ids, without duplicates and in their order
+        argument: numbers and ranges separated by commas (eg. 1-10,15), or a file containing such values (separated by commas, spaces or lines)
+        A "G" before a number is ignored (G3 is sample 3, as in the vcf header)
+        '''
+    if os.path.isfile(argument):
+        with open(argument) as id_file:
+            argument = id_file.read()
+    ids = {}
+    for value in re.split(r"[,\s]+", argument.strip()):
+        if not value:
+            continue
+        first, _, last = value.lstrip("G").partition("-")
+        try:
+            ids.update(dict.fromkeys(range(int(first), int(last or first) + 1)))
+        except ValueError:
+            print(f"Error: {value} is not a number or a range of numbers")
+            sys.exit(2)
+    return list(ids)
+
+
+def format_bubbles(bubbles, nb_samples, tig_type, min_rank, max_miss, filout, metrics, samples = None, bubble_ids = None):
+    '''
+        Filters the bubbles and writes the vcf lines of the kept ones in filout
+        metrics: FilterMetrics counting the analyzed, kept and rejected variants
+        samples, bubble_ids: output samples and set of the ids of the output bubbles (see bubble_filter), None for all
+        '''
+    ## FILTERING on the raw header of the higher path: bubble id, rank and missing genotype ratio
+    keep = bubble_filter(min_rank, max_miss, nb_samples, samples, bubble_ids, metrics.rejections)
+    # Field positions and INFO layout, the same for all the bubbles of the file
+    formatter = VcfFormatter(nb_samples, tig_type, samples)
+    for bubble in bubbles:
+        metrics.add_bubble(bubble)
+        rank = keep(bubble.lines[0])
+        if rank is None:
+            continue
+        
+        metrics.keep()
+
+        # Headers of the higher and lower paths, split only for the kept variants
+        splitted_1 = bubble.fields_up
+        splitted_2 = bubble.fields_low
+
+        #now format in vcf format
+        filout.write(formatter.format(splitted_1, splitted_2, rank, bubble.sequence_low, ".", "."))
+
+
+def format_range(arguments):
+    '''
+        Formats a part of the fasta file (given by bubble_ranges) into a temporary vcf file, in a worker process (--threads)
+        Returns the name of this file and the counters of its metrics (see FilterMetrics.merge)
+        '''
+    fasta_file, start, nb_bubbles, range_file_name, nb_samples, tig_type, min_rank, max_miss, samples, bubble_ids = arguments
+    metrics = FilterMetrics()
+    with open(range_file_name, 'w') as filout:
+        format_bubbles(read_bubbles(fasta_file, start, nb_bubbles), nb_samples, tig_type, min_rank, max_miss, filout, metrics, samples, bubble_ids)
+    return range_file_name, metrics.counters()
+
+
 def main():
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:r:m:o:", ["help", "in=", "rank=", "miss=", "out="])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:r:m:o:t:", ["help", "in=", "rank=", "miss=", "out=", "threads=", "samples=", "bubble_ids=", "progress=", "metrics="])
     except getopt.GetoptError as err:
         # print help information and exit:
         print(str(err))  # will print something like "option -a not recognized"
@@ -50,6 +124,11 @@ def main():
     max_miss = 1
     k = 31
     out_file = None
+    nb_threads = 1
+    samples = None
+    bubble_ids = None
+    progress_interval = 0
+    metrics_file = None
     for opt, arg in opts:
         if opt in ("-h", "--help"):
             usage()
@@ -62,6 +141,16 @@ def main():
             max_miss = float(arg)
         elif opt in ("-o", "--out"):
             out_file = arg
+        elif opt in ("-t", "--threads"):
+            nb_threads = int(arg)
+        elif opt == "--samples":
+            samples = read_id_list(arg)
+        elif opt == "--bubble_ids":
+            bubble_ids = {str(bubble_id) for bubble_id in read_id_list(arg)}
+        elif opt == "--progress":
+            progress_interval = float(arg)
+        elif opt == "--metrics":
+            metrics_file = arg
         else:
             assert False, "unhandled option"
 
@@ -80,75 +169,61 @@ def main():
         nb_samples = 0
         nb_fixed_fields = 0 #nb fields before C1_X|C2_Y|... depends if unitig and/or contig lengths have been output
         with_cluster = False
-        with open(fasta_file, 'r') as filin:
-            for line in filin:
-                splitted_1 = line.split("|")
-                #cluster :
-                if re.match(">cluster_",splitted_1[0]):
-                    with_cluster = True
-                #nb_samples:
-                tig_type = len(re.findall("left_\w+_length",line))
-                nb_fixed_fields = 4 + 2*tig_type
-                nb_samples = (len(splitted_1) - (nb_fixed_fields + 1))/3
-                if nb_samples % 1 != 0:
-                    print(f"Warning: could not detect the correct nb of samples : {nb_samples}")
-                    sys.exit(2)
-                nb_samples = int(nb_samples)
-                break
+        for bubble in read_bubbles(fasta_file):
+            line = bubble.lines[0]
+            splitted_1 = line.split("|")
+            #cluster :
+            if re.match(">cluster_",splitted_1[0]):
+                with_cluster = True
+            #nb_samples:
+            tig_type = len(re.findall("left_\w+_length",line))
+            nb_fixed_fields = 4 + 2*tig_type
+            nb_samples = (len(splitted_1) - (nb_fixed_fields + 1))/3
+            if nb_samples % 1 != 0:
+                print(f"Warning: could not detect the correct nb of samples : {nb_samples}")
+                sys.exit(2)
+            nb_samples = int(nb_samples)
+            break
+
+        if samples is not None:
+            if not samples or min(samples) < 1 or max(samples) > nb_samples:
+                print(f"Error: --samples must be numbers between 1 and {nb_samples}")
+                sys.exit(2)
+            if samples == list(range(1, nb_samples + 1)):
+                samples = None
 
         sys.stdout.close = lambda: None  #make stdout unclosable, to use with and handle both `with open(…)` and `sys.stdout` nicely. cf. https://stackoverflow.com/questions/17602878/how-to-handle-both-with-open-and-sys-stdout-nicely
         # Now going through all lines
-        with open(fasta_file, 'r') as filin, (open(out_file,'w') if out_file else sys.stdout) as filout:
+        with (open(out_file,'w') if out_file else sys.stdout) as filout:
 
             # Writing Comments and Header
-            filout.write(vcf_header(source,date,fasta_file,nb_samples))
-
-            nb_kept_variants = 0
-            nb_analyzed_variants = 0
-            line_count = 0
-            keep_variant = False
-            for line in filin:
-                line_count += 1
-                
-                if line_count == 1:
-                    keep_variant = False
-                    nb_analyzed_variants += 1
-
-                    # Header higher path
-                    line = line.strip()
-                    splitted_1 = line.split("|")
-                    #fasta_4lines = splitted_1[0] + "\n"  #simplified headers for fasta_only and src
-
-                    ## FILTERING
-                    #filter rank
-                    rank = float(splitted_1[-1].split("rank_")[1])
-                    if rank < min_rank:
-                        continue
-                    # filter missing genotype ratio
-                    nb_missing = len(re.findall(r"G\d+_\./\.",line))
-                    missing_ratio = nb_missing / nb_samples
-                    if missing_ratio >= max_miss:
-                        continue
-                    
-                    keep_variant = True  # for fasta_only mode
-                    nb_kept_variants += 1
-            
-                if keep_variant and line_count == 3:
-                    #Header lower path
-                    line = line.strip()
-                    splitted_2 = line.split("|")
-
-                if line_count == 4:
-                    line_count = 0
-                    if keep_variant:
-                        #now format in vcf format
-                        line = line.strip()
-                        filout.write(format_vcf(splitted_1, splitted_2, nb_samples, rank, line, ".", ".", tig_type))
+            filout.write(vcf_header(source,date,fasta_file,nb_samples,samples))
+
+            if nb_threads > 1 and is_gzipped(fasta_file):
+                sys.stderr.write("A gzipped fasta file is read by a single process, option -t ignored\n")
+                nb_threads = 1
+            metrics = FilterMetrics(fasta_file, progress_interval)
+            if nb_threads <= 1:
+                format_bubbles(read_bubbles(fasta_file), nb_samples, tig_type, min_rank, max_miss, filout, metrics, samples, bubble_ids)
+            else:
+                # The parts of the fasta file are formatted by a pool of processes in temporary files, concatenated in the input order
+                # (their metrics are merged, and the progress reported, when each part is done)
+                with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_file)) if out_file else None) as range_dir:
+                    ranges = [(fasta_file, start, nb_bubbles, os.path.join(range_dir, f"range_{i}.vcf"), nb_samples, tig_type, min_rank, max_miss, samples, bubble_ids)
+                              for i, (start, nb_bubbles) in enumerate(bubble_ranges(fasta_file, RANGES_PER_THREAD*nb_threads))]
+                    with multiprocessing.Pool(nb_threads) as pool:
+                        for range_file_name, counters in pool.imap(format_range, ranges):
+                            with open(range_file_name, 'r') as range_file:
+                                shutil.copyfileobj(range_file, filout)
+                            os.remove(range_file_name)
+                            metrics.merge(counters)
 
 
         #print(f"{nb_lost_variants} variant bubbles filtered out")
         #print(f"{nb_kept_variants} variant bubbles output out of {nb_tot_variants} ({nb_analyzed_variants} analyzed)")
-        sys.stderr.write(f"{nb_kept_variants} variant bubbles output out of {nb_analyzed_variants}\n")
+        sys.stderr.write(f"{metrics.nb_kept} variant bubbles output out of {metrics.nb_bubbles}\n")
+        if metrics_file:
+            metrics.write_summary(metrics_file)
 
 
 if __name__ == "__main__":
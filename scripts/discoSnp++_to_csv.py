@@ -1,26 +1,15 @@
 #!/usr/bin/env python
 import sys
+from disco_bubbles import read_bubbles
 if len(sys.argv) !=2:
     sys.stdout.write("Mandatory: python discoSnp_to_csv.py prefix_coherent_k_kval_c_cval.fa\n")
     sys.stdout.write("This program formats the .fa to .csv format by puting each couple of .fa sequence (4 lines = 2 comments + 2 nucleotide sequences) into one line, replacing the '|' character by spaces and removing the CX_ formating")
     sys.exit(1)
 
-f=open(sys.argv[1], "r")
-
-
-while 1:
-    com1_1=f.readline()
-    if not com1_1:
-        break
-    data1_1=f.readline()
-    if not data1_1:
-        break
-    com1_2=f.readline()
-    if not com1_2:
-        break
-    data1_2=f.readline()
-    if not data1_2:
+for bubble in read_bubbles(sys.argv[1]):
+    if "" in bubble.lines: # truncated last bubble
         break
+    com1_1,data1_1,com1_2,data1_2=bubble.lines
     
     com1_tab=com1_1.split("|")
     
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+
+
+''' ***********************************************
+
+    Shared reader of the discoSnp++ bubble files (.fa, e.g. prefix_coherent.fa), plain or gzipped
+
+    A bubble is 4 lines: header and sequence of the higher path, header and sequence of the lower path
+    >SNP_higher_path_3|P_1:30_C/G|high|nb_pol_1|left_unitig_length_86|right_unitig_length_261|C1_124|C2_0|Q1_0|Q2_0|G1_0/0:10,378,2484|G2_1/1:2684,408,10|rank_1
+    The file is read through a buffered stream (decompressed on the fly when gzipped), 4 lines at a time,
+    so that the memory used does not depend on the size of the file.
+    The headers of a bubble are split on '|' only when its fields are accessed.
+    A bubble store (binary copy of a bubble file, see bubble_store.py) is read in the same way.
+
+    Used by create_filtered_vcf.py, fasta_and_cluster_to_filtered_vcf.py, redundancy_removal_discosnp.py,
+    split_multiple_snps.py, discoSnp++_to_csv.py, format_phased_variants_for_haplotyping.py and the k3000 scripts
+
+    *********************************************** '''
+
+import io
+import os
+import gzip
+import itertools
+
+GZIP_MAGIC = b"\x1f\x8b"
+BLOCK_SIZE = 1 << 22  # bytes read at once by bubble_ranges
+
+
+class Bubble:
+    '''
+        The 4 lines of a bubble ; headers, sequences and fields are computed on first access.
+        '''
+    __slots__ = ("lines", "_fields_up", "_fields_low")
+
+    def __init__(self, lines):
+        self.lines = lines  # as in the file, with their end of line. Missing lines of a truncated last bubble are empty
+        self._fields_up = None
+        self._fields_low = None
+
+    @property
+    def text(self):
+        return "".join(self.lines)
+
+    @property
+    def header_up(self):
+        return self.lines[0].rstrip()
+
+    @property
+    def sequence_up(self):
+        return self.lines[1].rstrip()
+
+    @property
+    def header_low(self):
+        return self.lines[2].rstrip()
+
+    @property
+    def sequence_low(self):
+        return self.lines[3].rstrip()
+
+    @property
+    def fields_up(self):
+        ''' Header of the higher path split on '|' : ['>SNP_higher_path_3', 'P_1:30_C/G', 'high', 'nb_pol_1', ...] '''
+        if self._fields_up is None:
+            self._fields_up = self.lines[0].rstrip().split("|")
+        return self._fields_up
+
+    @property
+    def fields_low(self):
+        if self._fields_low is None:
+            self._fields_low = self.lines[2].rstrip().split("|")
+        return self._fields_low
+
+    @property
+    def name(self):
+        ''' SNP_higher_path_3 '''
+        return self.fields_up[0].lstrip(">")
+
+    @property
+    def id(self):
+        ''' Bubble id (string) : 3 for SNP_higher_path_3 '''
+        return self.fields_up[0].split("_")[-1]
+
+    @property
+    def is_snp(self):
+        return self.lines[0].startswith(">SNP")
+
+    def field(self, prefix, upper=True):
+        '''
+            Returns the first field of the header (higher path by default) starting with prefix (eg. "C1_", "rank_"), None if absent
+            '''
+        for field in (self.fields_up if upper else self.fields_low):
+            if field.startswith(prefix):
+                return field
+        return None
+
+
+def is_gzipped(file_name):
+    with open(file_name, "rb") as bubble_file:
+        return bubble_file.read(2) == GZIP_MAGIC
+
+
+def open_bubble_file(file_name, start=0):
+    '''
+        Opens a discoSnp++ fasta file in text mode, plain or gzipped (detected from its first bytes)
+        start: byte offset of the first line to read (plain files only, see bubble_ranges)
+        '''
+    if is_gzipped(file_name):
+        if start:
+            raise ValueError("A gzipped bubble file can only be read from its beginning: " + file_name)
+        return gzip.open(file_name, "rt")
+    if not start:
+        return open(file_name, "r")
+    bubble_file = open(file_name, "rb")
+    bubble_file.seek(start)
+    return io.TextIOWrapper(bubble_file)
+
+
+def read_bubbles(file_name, start=0, nb_bubbles=None):
+    '''
+        Yields a Bubble for each variant of a discoSnp++ fasta file (plain or gzipped) or of a bubble store
+        start, nb_bubbles: reads only nb_bubbles bubbles from the byte offset start (a part given by bubble_ranges) ;
+        for a bubble store, start is the row of the first bubble
+        '''
+    import bubble_store # imports this module
+    if bubble_store.is_bubble_store(file_name):
+        with bubble_store.BubbleStore(file_name) as store:
+            stop = len(store) if nb_bubbles is None else min(len(store), start + nb_bubbles)
+            for row in range(start, stop):
+                yield store.bubble(row)
+        return
+    with open_bubble_file(file_name, start) as bubble_file:
+        groups = itertools.zip_longest(bubble_file, bubble_file, bubble_file, bubble_file, fillvalue="")
+        for lines in itertools.islice(groups, nb_bubbles):
+            yield Bubble(lines)
+
+
+def read_bubble_at(bubble_file, offset):
+    '''
+        Returns the Bubble starting at a byte offset of a plain discoSnp++ fasta file opened in binary mode (offsets of a bubble index)
+        '''
+    bubble_file.seek(offset)
+    return Bubble(tuple(bubble_file.readline().decode().replace("\r\n", "\n") for _ in range(4)))
+
+
+def read_bubble_index(index_file_name):
+    '''
+        Returns the list of the byte offsets of a bubble index : one line per bubble of a fasta file, giving the offset of its first line
+        '''
+    with open(index_file_name, "r") as index_file:
+        return [int(line) for line in index_file]
+
+
+def bubble_ranges(file_name, nb_ranges):
+    '''
+        Splits a plain discoSnp++ fasta file in at most nb_ranges parts of about the same size, made of whole bubbles
+        Returns the list of the (start, nb_bubbles) of each part, to be given to read_bubbles: byte offset of its first
+        bubble and number of bubbles (None for the last part, that goes to the end of the file)
+        The file is read once by blocks, its lines are counted but not decoded
+        For a bubble store, the parts are given by the row of their first bubble
+        '''
+    import bubble_store # imports this module
+    if bubble_store.is_bubble_store(file_name):
+        with bubble_store.BubbleStore(file_name) as store:
+            nb_bubbles = len(store)
+        part = max(1, -(-nb_bubbles // nb_ranges))
+        ranges = [(start, part) for start in range(0, nb_bubbles, part)] or [(0, None)]
+        ranges[-1] = (ranges[-1][0], None)
+        return ranges
+    size = os.path.getsize(file_name)
+    starts = [0]            # byte offset of the first bubble of each part
+    first_bubbles = [0]     # index of this bubble in the file
+    nb_newlines = 0         # in the blocks before the current one
+    offset = 0              # of the current block in the file
+    previous_byte = 10      # last byte of the previous block ("\n" before the file)
+    need = None             # newlines to pass to reach the start of the next part, once its approximate offset is reached
+    with open(file_name, "rb") as bubble_file:
+        while len(starts) < nb_ranges:
+            block = bubble_file.read(BLOCK_SIZE)
+            if not block:
+                break
+            position = 0
+            while len(starts) < nb_ranges:
+                if need is None:
+                    target = size * len(starts) // nb_ranges - offset
+                    if target >= len(block):
+                        break
+                    position = max(position, target)
+                    nb_lines = nb_newlines + block.count(b"\n", 0, position)     # lines ended before position
+                    at_line_start = (block[position - 1] if position else previous_byte) == 10
+                    if at_line_start and nb_lines % 4 == 0:
+                        starts.append(offset + position)
+                        first_bubbles.append(nb_lines // 4)
+                        continue
+                    need = 4 - nb_lines % 4
+                    next_bubble = (nb_lines + need) // 4
+                while need:
+                    end_of_line = block.find(b"\n", position)
+                    if end_of_line < 0:
+                        position = len(block)
+                        break
+                    position = end_of_line + 1
+                    need -= 1
+                if need:
+                    break
+                starts.append(offset + position)
+                first_bubbles.append(next_bubble)
+                need = None
+            nb_newlines += block.count(b"\n")
+            offset += len(block)
+            previous_byte = block[-1]
+    if len(starts) > 1 and starts[-1] >= size:  # the last boundary is the end of the file
+        starts.pop()
+        first_bubbles.pop()
+    ranges = [(start, next_first - first) for start, first, next_first in zip(starts, first_bubbles, first_bubbles[1:])]
+    ranges.append((starts[-1], None))
+    return ranges
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+
+
+''' ***********************************************
+
+    Progress and throughput metrics of the scripts filtering a discoSnp++ bubble file
+    (create_filtered_vcf.py, fasta_and_cluster_to_filtered_vcf.py)
+
+    Every interval seconds (--progress), a line is written on stderr:
+    [progress] 0:20:00 | 1200000 bubbles (35.2%) | 1012 bubbles/s | 1.2 MB/s | ETA 0:36:48 | kept 1100000 | rejected rank 80000 missing 20000
+    The rates are the ones of the last interval, so that a stall shows at once. The percentage and the ETA (from the mean
+    rate since the start) use the offset in the input file, or the number of bubbles when their total is known instead
+    (bubble store, index of the variants) ; they are not given for a gzipped file.
+    At the end, the totals can be written as JSON (--metrics).
+
+    *********************************************** '''
+
+import os
+import sys
+import json
+import time
+import datetime
+
+from disco_bubbles import is_gzipped
+from bubble_store import BubbleStore, is_bubble_store
+
+REJECTION_REASONS = ("bubble_id", "rank", "missing", "cluster_size") # see bubble_filter of vcf_formatting_functions.py
+
+
+class FilterMetrics:
+    '''
+        Counts the bubbles read, their bytes, the kept bubbles and the rejected ones per filter
+        input_file: to get the total nb of bytes (plain fasta) or of bubbles (bubble store), None: unknown
+        interval:   seconds between two progress lines, 0: no progress line
+        '''
+
+    def __init__(self, input_file = None, interval = 0, stream = None):
+        self.input_file = input_file
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.nb_bubbles = 0
+        self.nb_bytes = 0
+        self.nb_kept = 0
+        self.rejections = dict.fromkeys(REJECTION_REASONS, 0) # incremented by the filters
+        self.total_bytes = None
+        self.total_bubbles = None
+        if input_file:
+            if is_bubble_store(input_file):
+                with BubbleStore(input_file) as store:
+                    self.total_bubbles = len(store)
+            elif not is_gzipped(input_file):
+                self.total_bytes = os.path.getsize(input_file)
+        self.start = time.monotonic()
+        self.last_time = self.start
+        self.last_bubbles = 0
+        self.last_bytes = 0
+
+    def add_bubble(self, bubble = None):
+        ''' A bubble is analyzed (its bytes are counted if given) ; writes a progress line if it is time to '''
+        self.nb_bubbles += 1
+        if bubble is not None:
+            self.add_bytes(bubble)
+        if self.interval and time.monotonic() - self.last_time >= self.interval:
+            self.report()
+
+    def add_bytes(self, bubble):
+        ''' The bytes of a bubble counted by add_bubble, but read later '''
+        self.nb_bytes += sum(map(len, bubble.lines))
+
+    def keep(self):
+        self.nb_kept += 1
+
+    def reject(self, reason):
+        self.rejections[reason] += 1
+
+    def counters(self):
+        ''' Counters, to be merged in the metrics of the main process by merge (e.g. from a worker process) '''
+        return {"bubbles": self.nb_bubbles, "bytes": self.nb_bytes, "kept": self.nb_kept, "rejected": dict(self.rejections)}
+
+    def merge(self, counters):
+        self.nb_bubbles += counters["bubbles"]
+        self.nb_bytes += counters["bytes"]
+        self.nb_kept += counters["kept"]
+        for reason, nb in counters["rejected"].items():
+            self.rejections[reason] += nb
+        if self.interval and time.monotonic() - self.last_time >= self.interval:
+            self.report()
+
+    def done(self):
+        ''' Fraction of the input already read, None if unknown '''
+        if self.total_bytes:
+            return min(1, self.nb_bytes / self.total_bytes)
+        if self.total_bubbles:
+            return min(1, self.nb_bubbles / self.total_bubbles)
+        return None
+
+    def report(self):
+        ''' Writes a progress line '''
+        now = time.monotonic()
+        elapsed = now - self.start
+        seconds = max(now - self.last_time, 1e-9)
+        line = [f"[progress] {datetime.timedelta(seconds=int(elapsed))}"]
+        done = self.done()
+        line.append(f"{self.nb_bubbles} bubbles" + (f" ({100 * done:.1f}%)" if done is not None else ""))
+        line.append(f"{(self.nb_bubbles - self.last_bubbles) / seconds:.0f} bubbles/s")
+        line.append(f"{(self.nb_bytes - self.last_bytes) / seconds / 1e6:.1f} MB/s")
+        if done:
+            line.append(f"ETA {datetime.timedelta(seconds=int(elapsed * (1 - done) / done))}")
+        line.append(f"kept {self.nb_kept}")
+        rejected = [f"{reason} {nb}" for reason, nb in self.rejections.items() if nb]
+        if rejected:
+            line.append("rejected " + " ".join(rejected))
+        self.stream.write(" | ".join(line) + "\n")
+        self.stream.flush()
+        self.last_time = now
+        self.last_bubbles = self.nb_bubbles
+        self.last_bytes = self.nb_bytes
+
+    def summary(self):
+        ''' Totals and mean rates, as a dict '''
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        return {"input": self.input_file,
+                "seconds": round(elapsed, 3),
+                "bubbles": self.nb_bubbles,
+                "bytes": self.nb_bytes,
+                "kept": self.nb_kept,
+                "rejected": dict(self.rejections),
+                "bubbles_per_s": round(self.nb_bubbles / elapsed, 1),
+                "bytes_per_s": round(self.nb_bytes / elapsed, 1)}
+
+    def write_summary(self, file_name):
+        with open(file_name, "w") as summary_file:
+            summary_file.write(json.dumps(self.summary(), indent=2) + "\n")
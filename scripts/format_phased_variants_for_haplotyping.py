@@ -1,4 +1,5 @@
 import sys
+from disco_bubbles import read_bubbles
 #usage: 
 ### first create connected components from disco (-A option)
 #sh from_phased_alleles_to_clusters.sh phased_alleles_read_set_id_1.txt # creates file connected_components_phased_alleles_read_set_id_1.txt
@@ -14,34 +15,33 @@ if not len(sys.argv)==5:
     print (" * phased_alleles_read_set_id_1.txt: file generated by discoSnp (with the hidden -A option. The value 1 here shoud correspond to \"id number\"")
     sys.exit(0)
 
-coherent_fa_file = open(sys.argv[1])
+coherent_fa_file_name = sys.argv[1]
 set_id = sys.argv[2]
 cc_file = open(sys.argv[3])
 phased_alleles_file = open(sys.argv[4])
 
 
 
-def store_abundances(coherent_fa_file,set_id):
+def store_abundances(coherent_fa_file_name,set_id):
     pos_coverage_determined=False
     pos_coverage=-1
     coverages={}
-    for oline in coherent_fa_file: #>SNP_higher_path_991|P_1:30_C/G|high|nb_pol_1|C1_38|C2_0|Q1_0|Q2_0|G1_0/0:6,119,764|G2_1/1:664,104,6|rank_1
-        if oline[0] != '>': continue
-        line=oline.rstrip().split('|')
-        id=line[0].split('_')[-1]    #here 991
-        id+=line[0].split('_')[1][0] #'h' or 'l'
-        if not pos_coverage_determined:
-            for pos_coverage in range(len(line)):
-                if line[pos_coverage][0]=='C':
-                    value=line[pos_coverage][1:].split('_')[0]
-                    if value==set_id:
-                        pos_coverage_determined=True
-                        break
+    for bubble in read_bubbles(coherent_fa_file_name):
+        for line in (bubble.fields_up, bubble.fields_low): #>SNP_higher_path_991|P_1:30_C/G|high|nb_pol_1|C1_38|C2_0|Q1_0|Q2_0|G1_0/0:6,119,764|G2_1/1:664,104,6|rank_1
+            id=line[0].split('_')[-1]    #here 991
+            id+=line[0].split('_')[1][0] #'h' or 'l'
             if not pos_coverage_determined:
-                print ("Set id", set_id, "not findable in header like ", oline.rstrip())
-                print ("ciao")
-                sys.exit(0)
-        coverages[id]=line[pos_coverage].split('_')[1] # get the right coverage corresponding to the searche read set
+                for pos_coverage in range(len(line)):
+                    if line[pos_coverage][0]=='C':
+                        value=line[pos_coverage][1:].split('_')[0]
+                        if value==set_id:
+                            pos_coverage_determined=True
+                            break
+                if not pos_coverage_determined:
+                    print ("Set id", set_id, "not findable in header like ", "|".join(line))
+                    print ("ciao")
+                    sys.exit(0)
+            coverages[id]=line[pos_coverage].split('_')[1] # get the right coverage corresponding to the searche read set
     return coverages
     
 
@@ -115,7 +115,7 @@ def print_djack_formated_phased_variants(coverages,cc,phased_alleles):
         
             
 
-coverages=store_abundances(coherent_fa_file,set_id)
+coverages=store_abundances(coherent_fa_file_name,set_id)
 
 cc=store_cc(cc_file)
 phased_alleles=store_phased_alleles(phased_alleles_file)
@@ -6,35 +6,68 @@ import sys
 import subprocess
 import re
 import time
+import io
+import functools
 from ClassVCF_creator import *
 #############################################################################################
 #Function_________________________________________________________________________________________________________
 #INDEX_____________________________________________________________________________________________________________
-#      InitVariant(line1,line2):"""Initialization of the variant by taking into accoutn its type"""
+#      InitVariant(line1,line2,fileName,dicoIndex,recycled=None):"""Initialization of the variant by taking into accoutn its type (reusing the objects of recycled if given)"""
 #      MappingTreatement(variant_object,vcf_field_object,nbGeno):
 #      UnmappedTreatement(variant_object,vcf_field_object,nbGeno,seq1,seq2):"""Fills VCFfile in ghost mode (from a fasta file)"""
-#      CounterGenotype(fileToRead)
+#      CounterGenotype(line)
+#      GetIndex(line,boolSam):"""Generates the field index from the discoSnp++ header of a record"""
+#      SniffSchema(stream_file,boolSam):"""Reads the stream once until the first record : number of genotypes, Q fields, field index"""
+#      SniffBamSchema(records):"""Same as SniffSchema for the records of a bam file"""
+#      ReadSamCouples(lines,filtered_sam_file):"""Yields the couples of sam lines (upper path, lower path)"""
+#      ReadBamCouples(records):"""Yields the couples of bam records (upper path, lower path)"""
+#      SamText(record):"""Sam line of a record (sam line or decoded bam record)"""
+#      ReadFastaCouples(lines):"""Yields the couples of fasta records (header and sequence of the upper path, header and sequence of the lower path)"""
+#      ReadBatches(couples,batchSize):"""Groups the couples by batches"""
+#      TreatCouple(couple,boolSam,fileName,dicoIndex,nbGeno,VCFFile):"""Treats a couple of paths and writes its line(s) in the VCF"""
+#      TreatBatch(batch,boolSam,fileName,dicoIndex,nbGeno):"""Treats a batch of couples in a worker process"""
 #      CheckAtDistanceXBestHits(upper_path,lower_path):"""Prediction validation : check if the couple is validated with only one mapping position """
-#      PrintVCFHeader(VCF,listName,fileName,boolmyname):    
+#      AddBestHits(path,position_set):"""Adds the mapping position(s) of the path with the best mapping distance to position_set"""
+#      PrintVCFHeader(VCF,listName,fileName,boolmyname,nbGeno,boolQuality):    
+#      ProfileStage(stage,function):"""Wraps function so that its calls and wall time are added to the stage"""
+#      EnableProfiling():"""Wraps the stages of the treatment (--profile) : nothing is measured as long as it is not called"""
+#      AddProfileTime(stage,seconds):"""Adds a measure to a stage"""
+#      PrintProfile(totalTime,output):"""Prints the breakdown of the time by stage"""
 #############################################################################################
-def InitVariant(line1,line2,fileName,dicoIndex):
-        """Initialization of the variant by taking into account its type"""
+def InitVariant(line1,line2,fileName,dicoIndex,recycled=None):
+        """Initialization of the variant by taking into account its type.
+        recycled : optional dictionnary {class : object} of objects of a previous bubble which are reset instead of being allocated again
+        (the objects of the previous bubble must not be used anymore)"""
+        header=line1[0] if isinstance(line1,list) else line1 #Record of a bam file : the discoSnp++ header is the name of the record
         #Object Creation    
-        if "SNP" in line1 and "|nb_pol_1|" in line1:
-                variant_object=SNP(line1,line2)
-        elif "SNP" in line1 and "|nb_pol_1|" not in line1:
-                variant_object=SNPSCLOSE(line1,line2)
-        elif "INDEL" in line1:
+        if "SNP" in header and "|nb_pol_1|" in header:
+                variantClass=SNP
+        elif "SNP" in header and "|nb_pol_1|" not in header:
+                variantClass=SNPSCLOSE
+        elif "INDEL" in header:
                 #Supression of indel when the ambiguity is greater than 20
                 #if int(line1.split("\t")[0].split("|")[1].split("_")[3])>=20:
                 #        return 1,1
-                variant_object=INDEL(line1,line2)
+                variantClass=INDEL
         else :
                 print("!!!!Undefined Variant!!!!")
                 return (1,1)                
+        if recycled is None:
+                variant_object=variantClass(line1,line2)
+                vcf_field_object=VCFFIELD()
+        else:
+                variant_object=recycled.get(variantClass)
+                if variant_object is None:
+                        variant_object=recycled[variantClass]=variantClass(line1,line2)
+                else:
+                        variant_object.Reset(line1,line2)
+                vcf_field_object=recycled.get(VCFFIELD)
+                if vcf_field_object is None:
+                        vcf_field_object=recycled[VCFFIELD]=VCFFIELD()
+                else:
+                        vcf_field_object.Reset()
         variant_object.setDicoIndex(dicoIndex)                
-        #VCF object Creation and filling variant's attribut   
-        vcf_field_object=VCFFIELD()
+        #VCF object filling variant's attribut   
         variant_object.FillInformationFromHeader(vcf_field_object)
         return (variant_object, vcf_field_object)   
         
@@ -103,145 +136,230 @@ def UnmappedTreatement(variant_object,vcf_field_object,nbGeno,seq1,seq2):
         return(table)         
 #############################################################################################
 #############################################################################################
-def CounterGenotype(fileName):
-        samfile=open(fileName,'r')
+def CounterGenotype(line):
+        """Counts the genotypes (G<i>_ fields) of the discoSnp++ header of a record"""
+        #>SNP_higher_path_3|P_1:30_C/G|high|nb_pol_1|left_unitig_length_86|right_unitig_length_261|left_contig_length_166|right_contig_length_761|C1_124|C2_0|Q1_0|Q2_0|G1_0/0:10,378,2484|G2_1/1:2684,408,10|rank_1
         nbGeno=0
+        nomDisco=line.rstrip('\r').rstrip('\n').split('\t')[0].split('|')
+        for k in nomDisco:
+                if k[0]=='G':
+                        nbGeno+=1
+        return(nbGeno)
+#############################################################################################
+#############################################################################################
+def GetIndex(line,boolSam):
+        """Generates the field index (first occurrence of "contig", and so on) from the discoSnp++ header of a record"""
+        if not boolSam:
+                line=line.strip('>')
+                listLine=line.split("|")
+        else:
+                listLine=line.split("\t")[0].split("|")
+        #Init dictionnary
+        dicoIndex={}
+        if "C1_" in line:
+                dicoIndex["C"]=[]
+        if "G1_" in line:
+                dicoIndex["G"]=[]
+        if "Q1_" in line:
+                dicoIndex["Q"]=[]
+        if "unitig" in line:
+               dicoIndex["unitig"]=[]
+        if "contig" in line :
+               dicoIndex["contig"]=[]     
+        for i in range(len(listLine)):
+                if 'P_1' in listLine[i]:#P_1:30_A/G => {'P_1': ['30', 'A', 'G']} or P_1:30_A/G,P_2:31_G/A
+                        dicoIndex["P_"]=int(i)                         
+                elif "unitig" in listLine[i]:                                
+                        if "left" in listLine[i]:
+                                dicoIndex["unitig"].append(int(i))
+                        if "right" in listLine[i]:
+                                dicoIndex["unitig"].append(int(i))                                     
+                elif "contig" in listLine[i]:
+                        if "left" in listLine[i]:
+                               dicoIndex["contig"].append(int(i)) 
+                        if "right" in listLine[i]:
+                               dicoIndex["contig"].append(int(i)) 
+                elif "rank" in listLine[i]:
+                        dicoIndex["rank"]=int(i)
+                elif "nb_pol" in listLine[i]:
+                        dicoIndex["nb_pol"]=int(i)                                                             
+                elif "G" in listLine[i]: #Gets the genotype and likelihood by samples
+                       matchG=re.match(r'^G',listLine[i])# finds the genotype in the item of the dicoSnp++ header
+                       if matchG:
+                               dicoIndex["G"].append(int(i))
+                elif "C" in listLine[i]:                                
+                        matchC=re.match(r'^C',listLine[i])
+                        if matchC:
+                               dicoIndex["C"].append(int(i))
+                               
+                elif "Q" in listLine[i]:
+                      matchQ=re.match(r'^Q',listLine[i])
+                      if matchQ:
+                        dicoIndex["Q"].append(int(i))  
+        return(dicoIndex)
+
+#############################################################################################
+#############################################################################################
+def SniffSchema(stream_file,boolSam):
+        """Reads the stream until the first record (the stream is read only once: works on stdin or a fifo).
+        Returns the number of genotypes, the presence of the Q fields, the field index and the lines already read"""
+        bufferedLines=[]
         while True:
-                line=samfile.readline()
-                if not line: break #End of file
-                if line.startswith('@'): continue #We do not read headers
-                #>SNP_higher_path_3|P_1:30_C/G|high|nb_pol_1|left_unitig_length_86|right_unitig_length_261|left_contig_length_166|right_contig_length_761|C1_124|C2_0|Q1_0|Q2_0|G1_0/0:10,378,2484|G2_1/1:2684,408,10|rank_1
-                if nbGeno==0:
-                        line=line.rstrip('\r').rstrip('\n').split('\t')
-                        for i in line:
-                                if 'SNP' or 'INDEL' in i:
-                                        nomDisco=i.split('|')
-                                        for k in nomDisco:
-                                                if k[0]=='G':
-                                                        nbGeno+=1
-                                        samfile.close()
-                                        return(nbGeno)
-#############################################################################################
-#############################################################################################
-def GetIndex(fileName):
-       stream_file=open(fileName,'r')
-       while True:                
                 line=stream_file.readline()
                 if not line: break #End of file
+                bufferedLines.append(line)
                 if line.startswith('@'): continue #We do not read headers
-                if ".fa" in fileName:
-                        line=line.strip('>')
-                        listLine=line.split("|")
-                elif ".sam" in fileName:
-                        listLine=line.split("\t")[0].split("|")
-                #Init dictionnary
-                dicoIndex={}
-                if "C1_" in line:
-                        dicoIndex["C"]=[]
-                if "G1_" in line:
-                        dicoIndex["G"]=[]
-                if "Q1_" in line:
-                        dicoIndex["Q"]=[]
-                if "unitig" in line:
-                       dicoIndex["unitig"]=[]
-                if "contig" in line :
-                       dicoIndex["contig"]=[]     
-                for i in range(len(listLine)):
-                        if 'P_1' in listLine[i]:#P_1:30_A/G => {'P_1': ['30', 'A', 'G']} or P_1:30_A/G,P_2:31_G/A
-                                dicoIndex["P_"]=int(i)                         
-                        elif "unitig" in listLine[i]:                                
-                                if "left" in listLine[i]:
-                                        dicoIndex["unitig"].append(int(i))
-                                if "right" in listLine[i]:
-                                        dicoIndex["unitig"].append(int(i))                                     
-                        elif "contig" in listLine[i]:
-                                if "left" in listLine[i]:
-                                       dicoIndex["contig"].append(int(i)) 
-                                if "right" in listLine[i]:
-                                       dicoIndex["contig"].append(int(i)) 
-                        elif "rank" in listLine[i]:
-                                dicoIndex["rank"]=int(i)
-                        elif "nb_pol" in listLine[i]:
-                                dicoIndex["nb_pol"]=int(i)                                                             
-                        elif "G" in listLine[i]: #Gets the genotype and likelihood by samples
-                               matchG=re.match(r'^G',listLine[i])# finds the genotype in the item of the dicoSnp++ header
-                               if matchG:
-                                       dicoIndex["G"].append(int(i))
-                        elif "C" in listLine[i]:                                
-                                matchC=re.match(r'^C',listLine[i])
-                                if matchC:
-                                       dicoIndex["C"].append(int(i))
-                                       
-                        elif "Q" in listLine[i]:
-                              matchQ=re.match(r'^Q',listLine[i])
-                              if matchQ:
-                                dicoIndex["Q"].append(int(i))  
-                break
-       stream_file.close()                              
-       return(dicoIndex)                     
+                return(CounterGenotype(line),"Q1_" in line,GetIndex(line,boolSam),bufferedLines)
+        return(0,False,{},bufferedLines)
 
 #############################################################################################
 #############################################################################################
+def SniffBamSchema(records):
+        """Same as SniffSchema for the records of a bam file (the discoSnp++ header is the name of the record).
+        Returns the number of genotypes, the presence of the Q fields, the field index and the records already read"""
+        record=next(records,None)
+        if record is None:
+                return(0,False,{},[])
+        return(CounterGenotype(record[0]),"Q1_" in record[0],GetIndex(record[0],True),[record])
+#############################################################################################
+#############################################################################################
+def ReadSamCouples(lines,filtered_sam_file):
+        """Yields the couples of sam lines (upper path, lower path) ; supplementary alignments are skipped and headers are copied to filtered_sam_file (if any)"""
+        while True:
+                line1=next(lines,"")
+                if not line1: break #End of file
+                if line1.startswith('@'):
+                        if filtered_sam_file:
+                                filtered_sam_file.write(line1) 
+                        continue #We do not read headers                
+                while True:
+                        listline1=line1.split("\t")  
+                        if int(listline1[1]) & 2048 :#checks if it's not a secondary alignment => means splitted aligned sequence 
+                                line1=next(lines,"")
+                        else:break
+                line2=next(lines,"") #Read couple of lines
+                while True:
+                        listline2=line2.split("\t") 
+                        if int(listline2[1]) & 2048 :#checks if it's not a secondary alignment => means splitted aligned sequence 
+                                line2=next(lines,"")
+                        else:break       
+                yield (line1,line2)
+#############################################################################################
+#############################################################################################
+def ReadBamCouples(records):
+        """Yields the couples of bam records (upper path, lower path) : each record is the list of the fields of its sam line (supplementary alignments are already skipped by BAMREADER.Records)"""
+        for record1 in records:
+                record2=next(records,None)
+                if record2 is None: break
+                yield (record1,record2)
+#############################################################################################
+#############################################################################################
+def SamText(record):
+        """Sam line of a record (sam line or decoded bam record)"""
+        if isinstance(record,list):
+                return '\t'.join(record)+'\n'
+        return record
+#############################################################################################
+#############################################################################################
+def ReadFastaCouples(lines):
+        """Yields the couples of fasta records (header and sequence of the upper path, header and sequence of the lower path)"""
+        while True:
+                line1=next(lines,"")
+                if not line1: break #End of file
+                seq1=next(lines,"") #Reads the seq associate to the variant
+                line2=next(lines,"") #Reads a couple of line
+                seq2=next(lines,"")
+                yield (line1,line2,seq1,seq2)
+#############################################################################################
+#############################################################################################
+def ReadBatches(couples,batchSize):
+        """Groups the couples by batches of batchSize couples"""
+        batch=[]
+        for couple in couples:
+                batch.append(couple)
+                if len(batch)==batchSize:
+                        yield batch
+                        batch=[]
+        if batch:
+                yield batch
+#############################################################################################
+#############################################################################################
+RECYCLED={} #objects of the previous couple reused by TreatCouple (nothing outlives the treatment of a couple)
+def TreatCouple(couple,boolSam,fileName,dicoIndex,nbGeno,VCFFile):
+        """Treats a couple of paths and writes its line(s) in VCFFile ; returns the filter field of the couple"""
+        if boolSam:
+                line1,line2=couple
+                #Initializes variant object with the samline
+                variant_object, vcf_field_object=InitVariant(line1,line2,fileName,dicoIndex,RECYCLED) #Fills the object with the line of the stream_file        
+                if variant_object.CheckCoupleVariantID()==1: #Checks whether the two lines are from the same path
+                        sys.exit(1)
+                #Checks the mapping on reference and determines the shift with the reference, which path is the reference ...
+                table=MappingTreatement(variant_object,vcf_field_object,nbGeno)
+        else:
+                line1,line2,seq1,seq2=couple
+                variant_object, vcf_field_object=InitVariant(line1,line2,fileName,dicoIndex,RECYCLED)
+                table=UnmappedTreatement(variant_object,vcf_field_object,nbGeno,seq1,seq2)
+        #Fills the VCF file
+        variant_object.FillVCF(VCFFile,nbGeno,table,vcf_field_object)
+        return(vcf_field_object.filterField)
+#############################################################################################
+#############################################################################################
+def TreatBatch(batch,boolSam,fileName,dicoIndex,nbGeno):
+        """Treats a batch of couples in a worker process ; returns the VCF lines of the batch and the filter field of each couple"""
+        VCFBuffer=io.StringIO()
+        listFilter=[]
+        for couple in batch:
+                listFilter.append(TreatCouple(couple,boolSam,fileName,dicoIndex,nbGeno,VCFBuffer))
+        return(VCFBuffer.getvalue(),listFilter)
+#############################################################################################
+#############################################################################################
 def CheckAtDistanceXBestHits(upper_path,lower_path):
-        """Prediction validation : checks if the couple is validated with only one mapping position """
-        
-        posUp=upper_path.dicoMappingPos
-        posLow=lower_path.dicoMappingPos
-        # get the best mapping distance for upper path 
-        best_up=1024
+        """Prediction validation : checks if the couple is validated with only one mapping position.
+        The alternative hits (XA tags) are decoded lazily : not at all if none of the paths has one, and the decoding stops as soon as the couple is known to be MULTIPLE"""
         if int(upper_path.mappingPosition)==0 and int(lower_path.mappingPosition)==0:#Checks if paths are unmappped
                 return(".")
-        for position,(nbMismatch,cigarcode) in posUp.items(): 
-                if nbMismatch<best_up:
-                        best_up=nbMismatch
-
-        # get the best mapping distance for lower path 
-        best_low=1024
-        for position,(nbMismatch,cigarcode) in posLow.items(): 
-                if nbMismatch<best_low:
-                        best_low=nbMismatch
-    
-        # get the union of the mapping position at the best mapping positions
         position_set = set()
-        for position,(nbMismatch,cigarcode) in posUp.items():
-                if nbMismatch == best_up:
-                        position_set.add(position)
-                if len(position_set) > 1: 
-                        return("MULTIPLE")
-
-        for position,(nbMismatch,cigarcode) in posLow.items():
-                if nbMismatch == best_low:
-                        position_set.add(position)
-                if len(position_set) > 1: 
-                        return("MULTIPLE")
-    
+        if upper_path.XA is None and lower_path.XA is None:#Only the main positions : nothing to decode
+                if upper_path.mainMismatch is not None:
+                        position_set.add(upper_path.mainPosition)
+                if lower_path.mainMismatch is not None:
+                        position_set.add(lower_path.mainPosition)
+        else:
+                # get the union of the mapping positions at the best mapping distance of each path
+                for path in (upper_path,lower_path):
+                        if not AddBestHits(path,position_set):
+                                return("MULTIPLE")
+        if len(position_set) > 1: 
+                return("MULTIPLE")
         if len(position_set) == 1: 
                 return("PASS")
-    
         return(".")
-
 #############################################################################################
 #############################################################################################
-def PrintVCFHeader(VCF,listName,fileName,boolmyname):
+def AddBestHits(path,position_set):
+        """Adds to position_set the mapping position(s) of the path with the best mapping distance ;
+        returns False (without decoding the remaining hits) as soon as position_set is sure to hold more than one position"""
+        best=1024
+        best_positions=set()
+        for position,nbMismatch in path.IterMappingPositions():
+                if nbMismatch<best:
+                        best=nbMismatch
+                        best_positions={position}
+                elif nbMismatch==best:
+                        best_positions.add(position)
+                if best==0 and len(position_set|best_positions)>1: #No hit can be better : the couple is multiply mapped
+                        return False
+        position_set|=best_positions
+        return True
+#############################################################################################
+#############################################################################################
+def PrintVCFHeader(VCF,listName,fileName,boolmyname,nbGeno,boolQuality):
         ###Header of the VCF file 
-        samfile=open(fileName,'r')
-        boolQuality=False
-        while True:                
-                line=samfile.readline()
-                if not line: break #End of file
-                if line.startswith('@'): continue #We do not read headers
-                if "Q1_" in line : 
-                        boolQuality=True
-                        break
-                else: break 
         today=time.localtime()
         date=str(today.tm_year)+str(today.tm_mon)+str(today.tm_mday)
         VCF.write('##fileformat=VCFv4.1\n')
         VCF.write('##filedate='+str(date)+'\n')
         VCF.write('##source=VCF_creator\n')
-        nbGeno=0
-        nbSnp=0
-        nbGeno = CounterGenotype(fileName)
         VCF.write('##SAMPLE=file://'+str(fileName)+'\n')
         VCF.write('##REF=<ID=REF,Number=1,Type=String,Description="Allele of the path Disco aligned with the least mismatches">\n')
         VCF.write('##FILTER=<ID=MULTIPLE,Description="Mapping type : PASS or MULTIPLE or .">\n')
@@ -276,7 +394,6 @@ def PrintVCFHeader(VCF,listName,fileName,boolmyname):
                         VCF.write("\t" )# Adds a \t except if this is the last genotype
                 if i==int(nbGeno)-1:
                     VCF.write("\n")
-        samfile.close()
 
 #############################################################################################
 #############################################################################################
@@ -284,6 +401,59 @@ def PrintVCFHeader(VCF,listName,fileName,boolmyname):
 
         
         
-
-
-
+#############################################################################################
+#############################################################################################
+#Profiling of the stages (--profile option) : the methods are wrapped only when EnableProfiling is called
+PROFILE_STAGES=["RetrievePolymorphismFromHeader","CheckPosVariantFromRef","WhichPathIsTheRef","RetrieveGenotypes","CheckAtDistanceXBestHits","Output writing"]
+PROFILE_STATS={} #PROFILE_STATS[stage]=[number of calls,cumulative wall time]
+def ProfileStage(stage,function):
+        """Wraps function so that its calls and wall time are added to the stage (nested calls of the same stage are counted once)"""
+        stats=PROFILE_STATS.setdefault(stage,[0,0.0,0]) #calls, seconds, depth
+        clock=time.perf_counter
+        @functools.wraps(function)
+        def ProfiledFunction(*args):
+                if stats[2]: #Called from the same stage (e.g. SNP.FillVCF calls VARIANT.FillVCF)
+                        return function(*args)
+                stats[2]=1
+                start=clock()
+                try:
+                        return function(*args)
+                finally:
+                        stats[0]+=1
+                        stats[1]+=clock()-start
+                        stats[2]=0
+        return ProfiledFunction
+#############################################################################################
+#############################################################################################
+def EnableProfiling():
+        """Wraps the stages of the treatment (--profile) : nothing is measured as long as it is not called"""
+        global CheckAtDistanceXBestHits
+        for stage in PROFILE_STAGES:
+                PROFILE_STATS[stage]=[0,0.0,0]
+        listMethods=[("RetrievePolymorphismFromHeader","RetrievePolymorphismFromHeader"),("CheckPosVariantFromRef","CheckPosVariantFromRef"),
+                     ("WhichPathIsTheRef","WhichPathIsTheRef"),("RetrieveGenotypes","RetrieveGenotypes"),("Output writing","FillVCF")]
+        for stage,methodName in listMethods:
+                for variantClass in (VARIANT,SNP,INDEL,SNPSCLOSE,PATH):
+                        if methodName in variantClass.__dict__:#Only the classes defining (or overriding) the method
+                                setattr(variantClass,methodName,ProfileStage(stage,variantClass.__dict__[methodName]))
+        CheckAtDistanceXBestHits=ProfileStage("CheckAtDistanceXBestHits",CheckAtDistanceXBestHits)
+#############################################################################################
+#############################################################################################
+def AddProfileTime(stage,seconds):
+        """Adds a measure to a stage (e.g. the closing of the output file)"""
+        stats=PROFILE_STATS.setdefault(stage,[0,0.0,0])
+        stats[0]+=1
+        stats[1]+=seconds
+#############################################################################################
+#############################################################################################
+def PrintProfile(totalTime,output):
+        """Prints the breakdown of the time by stage"""
+        output.write("#Profile of VCF_creator : "+str(round(totalTime,3))+"s\n")
+        output.write("#%-32s%12s%12s%8s\n" % ("stage","calls","seconds","%"))
+        measured=0.0
+        for stage in PROFILE_STAGES:
+                calls,seconds=PROFILE_STATS[stage][:2]
+                measured+=seconds
+                output.write(" %-32s%12d%12.3f%8.1f\n" % (stage,calls,seconds,100*seconds/totalTime if totalTime else 0))
+        other=totalTime-measured
+        output.write(" %-32s%12s%12.3f%8.1f\n" % ("other (parsing, init, ...)","",other,100*other/totalTime if totalTime else 0))
@@ -7,81 +7,102 @@ Resulting super reads are called MSR for Maximal Super Reads
 @author  pierre peterlongo pierre.peterlongo@inria.fr
 '''
 
+import os
 import sys
+import bisect
+import time
 # import getopt
 import K3000_common as kc
-# import sorted_list
+import prefix_index
 import argparse
+import multiprocessing
+
+SR_PER_TASK = 10000     # super reads of the components given at once to a process (-t)
 
 
 
 def is_subsequence(x,y,position_suffix):
-    pos_on_x = position_suffix
-    pos_on_y = 0
-    len_x = len(x)
-    len_y = len(y)
-    while True:
-        if pos_on_y == len_y: 
-            return True  # All y was read, it is included in x 
-        if pos_on_x == len_x: 
-            return False # All x was read, thus y is not included in x
-        if kc.allele_value(x[pos_on_x]) == kc.allele_value(y[pos_on_y]): 
-            pos_on_x += 1
-            pos_on_y += 1
-        else:
-            pos_on_x += 1
+    ''' True if the alleles of y are a subsequence of the alleles of x read from position_suffix '''
+    x_alleles = iter(x[0][position_suffix:])
+    return all(allele in x_alleles for allele in y[0])   # each allele of y is searched in x after the previous one
             
 
-def remove_y_subsequence_of_x(x_ref,SR):
+def remove_y_subsequence_of_x(x_ref,SR,removed=None):
     ''' remove all y that are subsequence of x
     Do not care about distances. 
     Exemple 3_0,4_1,5_10 is a subsequence of 0_0,1_12,2_13,3_13,4_12,5_123,6_1
+    The removed y (not their reverse) are appended to removed if given.
     '''
-    if len(x_ref) == 1: return # as we removed strict equalities, no read can be included in a read of size one.
-    n = len(x_ref)
+    if len(x_ref[0]) == 1: return # as we removed strict equalities, no read can be included in a read of size one.
+    n = len(x_ref[0])
     # print ("x",x)
 
     for x in [x_ref, kc.get_reverse_sr(x_ref)]:
         for position_suffix in range(0,n):
-            u = x[position_suffix]
-            Y = SR.get_lists_starting_with_given_prefix([u])
+            u = kc.sr_slice(x, position_suffix, position_suffix+1)
+            Y = SR.get_lists_starting_with_given_prefix(u)
 
             if x in Y: Y.remove(x)
 
             for y in Y:
-                if len(y)+position_suffix <= n and is_subsequence(x,y,position_suffix):
+                if len(y[0])+position_suffix <= n and is_subsequence(x,y,position_suffix):
                     SR.remove(y)
+                    if removed is not None: removed.append(y)
                     if not kc.is_palindromic(y): 
                         SR.remove(kc.get_reverse_sr(y))
 
-def remove_strict_inclusions(SR):
-    ''' remove all super reads strictly included in any other '''
-    n = len(SR)
-    # to_remove=[False for i in range(n)]
+def included_super_reads(SR):
+    ''' return the super reads of SR that are a subsequence (see is_subsequence) of another super read of SR, in the order of
+    SR.traverse(). As SR contains the reverse of each super read, those are the ones included in another super read or in
+    its reverse, and the reverse of an included super read is included as well.
+    An inverted index gives, for each allele, the super reads containing it by decreasing length: the super reads
+    including y are among the ones longer than y containing its rarest allele, only those are checked.
+    '''
+    super_reads = list(SR.traverse())
+    by_length = sorted(super_reads, key=lambda sr: len(sr[0]), reverse=True)
+    longer = {}                                         # length -> number of super reads longer than it = their positions in by_length
+    occurrences = {}                                    # allele -> positions in by_length of the super reads containing it, increasing
+    for position, sr in enumerate(by_length):
+        longer.setdefault(len(sr[0]), position)
+        for allele in set(sr[0]):
+            occurrences.setdefault(allele, []).append(position)
+    included = []
     checked = 0
-
-    for sr in SR.traverse():
-        if checked%100 == 0: sys.stderr.write("      Removing inclusions, "+str(checked)+" checked. Size SR "+str(len(SR))+" %.2f"%(100*checked/n)+"%\r")
+    for y in super_reads:
+        if checked%1000 == 0: sys.stderr.write("      Removing inclusions, "+str(checked)+" checked, "+str(len(included))+" included %.2f"%(100*checked/len(super_reads))+"%\r")
         checked += 1
-        remove_y_subsequence_of_x(sr,SR)
+        stop = longer[len(y[0])]
+        candidates, nb_candidates = None, stop         # positions of the super reads longer than y containing its rarest allele
+        for allele in set(y[0]):
+            positions = occurrences[allele]
+            nb = bisect.bisect_left(positions, stop, 0, min(nb_candidates, len(positions)))
+            if nb < nb_candidates or candidates is None:
+                candidates, nb_candidates = positions, nb
+                if nb == 0: break
+        for position in candidates[:nb_candidates]:
+            if is_subsequence(by_length[position], y, 0):
+                included.append(y)
+                break
+    sys.stderr.write("      Removing inclusions, "+str(checked)+" checked, "+str(len(included))+" included %.2f"%(100*checked/max(1,len(super_reads)))+"%\n")
+    return included
 
-    sys.stderr.write("      Removing inclusions, "+str(checked)+" checked. Size SR "+str(len(SR))+" %.2f"%(100*checked/n)+"%\n")
+def remove_strict_inclusions(SR):
+    ''' remove all super reads strictly included in any other '''
+    for sr in included_super_reads(SR):
+        SR.remove(sr)
     return SR
 
 
-
-
-
 def right_unique_extention(SR,sr):#, unitig_lengths,k,min_conflict_overlap):
     ''' return the unique  possible right sr extension with the largest overlap
         return None if no right extensions or if more than one possible non colinear extensions
         The returned extension can be sr itself
     '''
 
-    n = len(sr)
+    n = len(sr[0])
     #  **** Get the largest right overlap with sr ****
     for len_u in range(n-1,0,-1):
-        u = sr[-len_u:]
+        u = kc.sr_slice(sr, -len_u)
         Y = SR.get_lists_starting_with_given_prefix(u)
         if len(Y) == 0: continue              # No y starting with u
         if len(Y) > 1: return None,len_u      # More than one unique y starting with u, for instance y and y'. Knowing that y is not included in y' it means necessary that y and y' are not colinear and that x is thus not right extensible.
@@ -94,7 +115,7 @@ def right_unique_extention(SR,sr):#, unitig_lengths,k,min_conflict_overlap):
         Y = []
         starting_positions = []
         for starting_suffix_position in range(1,len_u):
-            suffix_u = u[starting_suffix_position:]
+            suffix_u = kc.sr_slice(u, starting_suffix_position)
 
             others = SR.get_lists_starting_with_given_prefix(suffix_u)
             if len(others) >0:
@@ -108,11 +129,12 @@ def right_unique_extention(SR,sr):#, unitig_lengths,k,min_conflict_overlap):
     return None,None
 
 
-def  fusion    (SR,x):
+def  fusion    (SR,x,changes=None):
     '''Main function. For a given super read x, we find y that overlap x with the highest overlap, such that :
     1/ there exists no other y' right overlapping x that is not collinear with y
     2/ there exists no other x' left overlapping y that is not collinear with x
     Once done, we compact x and y, and this is finished for x.
+    If given, x, y and the new super read xy are appended to changes (not their reverse).
     '''
     y,len_u = right_unique_extention(SR,x)              # Define, if exists, the unique y != x having the largest right overlap with x.
     if y == None: return 0                              # if no unique right extension, finished, x is not right extensible.
@@ -163,9 +185,10 @@ def  fusion    (SR,x):
                 #     sys.exit(0)
                 # ### END DEBUG
     # 3
-    new = x+y[len_u:]
+    new = x[0]+y[0][len_u:], x[1]+y[1][len_u:]
     SR.sorted_add(new)
     if not kc.is_palindromic(new): SR.sorted_add(kc.get_reverse_sr(new))
+    if changes is not None: changes += [x, y, new]
     
     # if isthere and not SR.contains(debug_id_node):
     #     sys.stderr.write("\n\n\n"+str(x)+" "+str(y)+" "+str(new)+"\n\n\n")
@@ -200,6 +223,151 @@ def compaction(SR):
 
 
 
+def left_overlapping(SR,sr):
+    ''' return the super reads whose right extensions may change if sr (or its reverse) is added or removed: the ones
+    having a suffix equal to a prefix of sr or of its reverse, that is the reverses of the super reads starting with a
+    suffix of the reverse of sr or of sr.
+    Their first distance is 0.
+    '''
+    res = []
+    for x_ in [kc.get_reverse_sr(sr), sr]:
+        for position_suffix in range(len(x_[0])):
+            for y in SR.get_lists_starting_with_given_prefix(kc.sr_slice(x_, position_suffix)):
+                res.append(kc.get_reverse_sr(y))
+    return res
+
+
+def fixpoint_compaction(SR):
+    ''' Removal of the strict inclusions and compaction of all sr in SR, until nothing changes (a fixpoint)
+    1/ All strict inclusions are removed. Afterwards no super read is included in another one: a compacted super read xy
+       is not included in any other super read (x would be), and the super reads included in xy are removed at once.
+    2/ The fusion of each super read of a worklist is tried. A fusion or a removal of a super read r may change only the
+       extensions of the super reads left overlapping r or its reverse: those are the worklist of the next iteration,
+       with the new compacted super reads.
+    3/ When the worklist is empty, the fusion of all super reads is tried once more: if one happens, the iterations go on,
+       else no super read can be compacted anymore.
+    The first iteration, and the last one, go through all super reads. Statistics of each iteration are written on stderr.
+    '''
+    SR = remove_strict_inclusions(SR)
+    worklist = None                                     # None: all super reads
+    iteration = 0
+    while True:
+        iteration += 1
+        start_time = time.time()
+        full = worklist is None
+        if full: worklist = SR.traverse()               # yields the super reads added during the traversal after the current one
+        next_worklist = {}                              # super reads with a first distance 0 -> None, in order of insertion
+        checked = 0
+        processed = 0
+        compacted = 0
+        included = 0
+        for sr in worklist:
+            if checked%100 == 0:
+                sys.stderr.write("      Iteration "+str(iteration)+", "+str(checked)+" checked. Size SR "+str(len(SR))+", "+str(compacted)+" couple of nodes compacted\r")
+            checked += 1
+            if sr not in SR: continue                   # removed since it was added to the worklist
+            processed += 1
+            changes = []
+            if fusion(SR,sr,changes) == 0: continue
+            compacted += 1
+            x, y, new = changes
+            removed = []
+            remove_y_subsequence_of_x(new,SR,removed)
+            included += len(removed)
+            next_worklist[new] = None
+            next_worklist[kc.get_reverse_sr(new)] = None
+            for r in [x, y, new]+removed:
+                for w in left_overlapping(SR,r):
+                    next_worklist[w] = None
+        sys.stderr.write("      Iteration "+str(iteration)+(" (all super reads)" if full else "")+": "+str(processed)+" super reads processed, "
+                         +str(compacted)+" couple of nodes compacted, "+str(included)+" inclusions removed. Size SR "+str(len(SR))
+                         +" (%.2fs)"%(time.time()-start_time)+"                    \n")
+        if next_worklist: worklist = list(next_worklist)
+        elif full: break                                # no fusion of any super read: fixpoint
+        else: worklist = None                           # check all super reads
+    return SR
+
+
+def snp_components(SR):
+    ''' partition of the super reads of SR into connected components: two super reads sharing a SNP (an allele, or the
+    other allele of its SNP, in any orientation) are in the same component. As inclusions and fusions only happen between
+    super reads sharing alleles, the components are compacted independently.
+    A union-find over the SNP ids (abs(allele)//2) of the super reads gives the components. Each component is the list of
+    its super reads in the order of SR.traverse().
+    '''
+    buckets = [(first, SR.get_lists_starting_with_given_prefix(((first,),(0,)))) for first in SR.first_alleles]  # super reads by first allele, in the order of SR.traverse()
+    parent = list(range((max((max(map(abs, sr[0])) for first, bucket in buckets for sr in bucket), default=-1)>>1)+1))  # SNP id -> its parent in its tree
+    def find(snp):
+        root = snp
+        while parent[root] != root: root = parent[root]
+        while parent[snp] != root: parent[snp], snp = root, parent[snp]                 # path compression
+        return root
+    for first, bucket in buckets:
+        first_root = find(abs(first)>>1)
+        for sr in bucket:
+            for allele in sr[0]:
+                root = parent[abs(allele)>>1]
+                if parent[root] != root: root = find(root)
+                if root != first_root: parent[root] = first_root
+    components = {}                                     # root of a component -> its super reads
+    for first, bucket in buckets:
+        components.setdefault(find(abs(first)>>1), []).extend(bucket)
+    return list(components.values())
+
+
+def silent_process():
+    ''' the progress of the compaction of each component is not written '''
+    sys.stderr = open(os.devnull, 'w')
+
+
+def compact_components(components):
+    ''' fixpoint compaction of each component of a list (super reads in the order of SR.traverse()).
+    Return the maximal super reads printed by kc.print_maximal_super_reads for each first allele: {first allele: lines}
+    '''
+    lines = {}
+    for component in components:
+        SR = prefix_index.prefix_index()
+        for sr in component: SR.add(sr)                 # in the order of SR.traverse(): same order of the buckets and in them
+        SR = fixpoint_compaction(SR)
+        for sr in SR.traverse():
+            if kc.is_canonical(sr) or kc.is_palindromic(sr):
+                lines.setdefault(sr[0][0], []).append(str(sr[0][0])+";" if len(sr[0])==1 else kc.sr_to_string(sr))
+    return lines
+
+
+def parallel_compaction(SR, nb_threads):
+    ''' fixpoint compaction of the connected components of SR (see snp_components) by a pool of nb_threads processes,
+    and print of the canonical maximal super reads.
+    The output is the one of the serial run: fusions and removals only change the component of the super reads involved,
+    whose super reads are traversed in the same order, and the compaction adds no new first allele. The super reads are
+    thus printed bucket by bucket in the order of SR, then in the order of their component.
+    '''
+    components = snp_components(SR)
+    sys.stderr.write("      "+str(len(components))+" connected components, the largest one with "+str(max(map(len, components), default=0))+" super reads\n")
+    first_alleles = SR.first_alleles
+    nb_sr = len(SR)
+    SR = None
+    components.sort(key=len, reverse=True)              # the largest components first, for a balanced load
+    tasks = [[]]
+    size = 0
+    for component in components:
+        if size >= min(SR_PER_TASK, nb_sr//(4*nb_threads)+1):
+            tasks.append([])
+            size = 0
+        tasks[-1].append(component)
+        size += len(component)
+    components = None
+    lines = {}
+    with multiprocessing.Pool(nb_threads, initializer=silent_process) as pool:
+        for i, task_lines in enumerate(pool.imap_unordered(compact_components, tasks)):
+            sys.stderr.write("      Compacting components, "+str(i+1)+"/"+str(len(tasks))+" tasks done\r")
+            lines.update(task_lines)                    # a first allele is in one component only
+    sys.stderr.write("\n")
+    for first in first_alleles:
+        for line in lines.get(first, []):
+            print(line)
+
+
 def main():
     '''
     Compaction of set of super reads coded as set of ids of unitigs
@@ -208,6 +376,8 @@ def main():
     parser = argparse.ArgumentParser(description='Compaction of set of super reads coded as set of ids of unitigs.')
     parser.add_argument("input_file", type=str,
                         help="input file containing dbg paths as a list of unitig ids, eg. on line looks like \"-1;24;198;\"" )
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="number of processes compacting the connected components of the super reads (default 1: all super reads at once)")
 
 
 
@@ -225,30 +395,14 @@ def main():
 
 
 
-    sys.stderr.write("  Remove strict inclusions\r")
-    SR = remove_strict_inclusions(SR)
-    sys.stderr.write("  Remove strict inclusions. Done      - nb SR="+ str(len(SR))+"\n")
- 
-
-    sys.stderr.write("  Compaction of simple paths \r")
-    SR = compaction(SR)
-    sys.stderr.write("  Compaction of simple paths. Done    - nb SR="+ str(len(SR))+"\n")
-
-    sys.stderr.write("  Remove2 strict inclusions\r")
-    SR = remove_strict_inclusions(SR)
-    sys.stderr.write("  Remove2 strict inclusions. Done      - nb SR="+ str(len(SR))+"\n")
-
-    sys.stderr.write("  Compaction2 of simple paths \r")
-    SR = compaction(SR)
-    sys.stderr.write("  Compaction2 of simple paths. Done    - nb SR="+ str(len(SR))+"\n")
-
-    sys.stderr.write("  Remove3 strict inclusions\r")
-    SR = remove_strict_inclusions(SR)
-    sys.stderr.write("  Remove3 strict inclusions. Done      - nb SR="+ str(len(SR))+"\n")
+    if args.threads > 1:
+        sys.stderr.write("  Remove strict inclusions and compaction of simple paths per connected component, until a fixpoint, and print\n")
+        parallel_compaction(SR, args.threads)
+        return
 
-    sys.stderr.write("  Compaction3 of simple paths \r")
-    SR = compaction(SR)
-    sys.stderr.write("  Compaction3 of simple paths. Done    - nb SR="+ str(len(SR))+"\n")
+    sys.stderr.write("  Remove strict inclusions and compaction of simple paths, until a fixpoint\n")
+    SR = fixpoint_compaction(SR)
+    sys.stderr.write("  Remove strict inclusions and compaction of simple paths. Done    - nb SR="+ str(len(SR))+"\n")
 
 
     sys.stderr.write("  Print canonical compacted phased alleles\n")
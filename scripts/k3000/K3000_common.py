@@ -9,7 +9,7 @@ Common file
 '''
 
 import sys
-import sorted_list
+import prefix_index
 import os
 
 
@@ -88,9 +88,30 @@ def get_reverse_complement(seq):
     return s
 
 allele_value = lambda x: int(x.split('_')[0])
-allele_values = lambda list_: [allele_value(x) for x in list_]
 distance_string_value = lambda x: x.split('_')[1]
 
+# A super read is a pair of tuples of integers (alleles, distances): "4_0;2_3;-6_21;" is ((4,2,-6),(0,3,21)).
+# The strings of the files are decoded once when loading the super reads, and made again only when printing them.
+# Super reads are compared (order, inclusion, colinearity) on their alleles only, the distances being ignored.
+
+def sr_from_strings(alleles_distances):
+    ''' super read from its "allele_distance" strings, eg ["4_0","2_3","-6_21"] -> ((4,2,-6),(0,3,21)). A lone allele ("4") has the distance 0 '''
+    alleles = []
+    distances = []
+    for allele_distance in alleles_distances:
+        allele, _, distance = allele_distance.partition('_')
+        alleles.append(int(allele))
+        distances.append(int(distance) if distance else 0)
+    return tuple(alleles), tuple(distances)
+
+def sr_to_string(sr):
+    ''' ((4,2,-6),(0,3,21)) -> "4_0;2_3;-6_21;" '''
+    return "".join([str(allele)+"_"+str(distance)+";" for allele, distance in zip(sr[0], sr[1])])
+
+def sr_slice(sr, start, stop=None):
+    ''' sub super read made of the alleles (and their distances) from start to stop, as sr[start:stop] for a list '''
+    return sr[0][start:stop], sr[1][start:stop]
+
 def generate_header(raw_int_facts):
     # from 204_0;201_-23;336_-85; to 102h;100l;168h;
     res=""
@@ -98,44 +119,16 @@ def generate_header(raw_int_facts):
         res+=unitig_id2snp_id(allele_value(raw_int_fact))+";"
     return res
 
-def d_list_equal(a_d,b_d):
-    a=[allele_value(x) for x in a_d]
-    b=[allele_value(x) for x in b_d]
-    return a==b
-    
-def d_list_sup(a_d,b_d):
-    a=[allele_value(x) for x in a_d]
-    b=[allele_value(x) for x in b_d]
-    return a>=b
-    
-    
-def d_list_order(a_d,b_d):
-    a=[allele_value(x) for x in a_d]
-    b=[allele_value(x) for x in b_d]
-    if a<b: return -1
-    if a==b: return 0
-    return 1
-
-
 def get_reverse_sr(x):
-    ''' reverse of a super read x. Example is super read x = ["4_0","2_3","-6_21"], reverse(x) = ["6_0","-2_21","-4_3"] '''
-    res =[]
-    for i in range (len(x)):
-        value = -allele_value(x[-i-1])                          # With i=0, '-6_21' is transformed into 6
-        if i==0: 
-            value=str(value)+"_0"                               # With i=0, add '_0' to the value
-        else:
-            value=str(value)+"_"+distance_string_value(x[-i])   # With i=1, add '_21' to the value
-        res.append(value)
-    return res
+    ''' reverse of a super read x. Example is super read x = ["4_0","2_3","-6_21"], reverse(x) = ["6_0","-2_21","-4_3"]
+    that is ((4,2,-6),(0,3,21)) -> ((6,-2,-4),(0,21,3)): the distance of an allele goes to the previous one in the reverse '''
+    return tuple([-allele for allele in reversed(x[0])]), (0,)+x[1][:0:-1]
 
 
 def is_palindromic(x):
     ''' return true is a sr x is palindromic, eg [1_0,2_12,-2_13,-1_12]'''
-    if len(x)%2 == 1: return False
-    for i in range(0,int(len(x)/2)):
-        if allele_value(x[i]) != -allele_value(x[-i-1]): return False
-    return True
+    alleles = x[0]
+    return len(alleles)%2 == 0 and alleles == tuple([-allele for allele in reversed(alleles)])
     #
 #
 # print(get_reverse_sr(["4_0","2_3","-6_21"]))
@@ -150,9 +143,9 @@ def f(variant):
 
     f(sVp)=s2V+g(p) with g(p)=0 if p='h' and 1 if p='l'
     '''
-    s=''
+    s=1
     if variant[0]=='-': 
-        s='-'
+        s=-1
         V=int(variant[1:-1])
     else: 
         V=int(variant[:-1])
@@ -162,7 +155,7 @@ def f(variant):
         odd=1
     
     res=(V*2)+odd
-    return s+str(res)
+    return s*res
 
 
         
@@ -170,7 +163,7 @@ def f(variant):
 
 def generate_SR_from_disco_pashing(file_name):
     mfile = open(file_name)
-    sl = sorted_list.sorted_list()
+    sl = prefix_index.prefix_index()
     for line in mfile: 
         #9h_0;35100h_34;-42157l_33; -16792l_0;-41270h_70; => 1
         # or
@@ -181,12 +174,14 @@ def generate_SR_from_disco_pashing(file_name):
         line=line.strip().split("=>")[0]
         line=line.strip().split()
         for fact in line: 
-            facttab=[]
+            alleles=[]
+            distances=[]
             for variant in fact.split(';')[:-1]:
-                facttab.append(f(variant.split('_')[0])+"_"+variant.split('_')[1])
+                alleles.append(f(variant.split('_')[0]))
+                distances.append(int(variant.split('_')[1]))
         
             
-            facttab = get_canonical(facttab) # store the canonical version of the fact. Btw, afterwards we add all reverse complements. 
+            facttab = get_canonical((tuple(alleles), tuple(distances))) # store the canonical version of the fact. Btw, afterwards we add all reverse complements. 
             sl.add(facttab)
 
     sl.unique() # Remove redundancies
@@ -197,15 +192,11 @@ def generate_SR(file_name):
     ''' Given an input file storing super reads, store them in the SR array'''
     # -10021_0;68561_21;-86758_3;27414_12;
     sr_file = open(file_name, 'r')
-    sl = sorted_list.sorted_list()
+    sl = prefix_index.prefix_index()
     for line in sr_file:
         if line[0]==">": continue # compatible with fasta-file format
         line = line.split()[0].rstrip()[:-1].split(';')
-        sr=[]
-        for allele_id in line:
-            # sr_val=int(unitig_id)
-            sr=sr+[allele_id]
-        sl.add(sr)
+        sl.add(sr_from_strings(line))
         # print(sr)#DEBUG
     return sl
 
@@ -215,7 +206,7 @@ def add_reverse_SR(SR):
     ''' For all super reads in SR, we add there reverse in SR
     This double the SR size, unless there are palindromes ([1_0,-1_21] for instance). Those are not added.
     We don't check that this does not create any duplicates'''
-    SR_ = sorted_list.sorted_list()
+    SR_ = prefix_index.prefix_index()
     for sr in SR.traverse():
         if not is_palindromic(sr):
             SR_.add(get_reverse_sr(sr))
@@ -228,21 +219,17 @@ def add_reverse_SR(SR):
 def colinear(x,X,starting_positions):
     ''' Check that all sr in X are colinear with x
     For each sr in X, one knows its starting position on x, with table starting_positions'''
-    for i in range(len(X)):
-        other = X[i]
-        starting_position = starting_positions[i]
-        pos=0
-        while True:
-            if pos>=len(other) or pos+starting_position>=len(x) : break
-            if allele_value(other[pos]) != allele_value(x[pos+starting_position]):          # "non colinear"
-                return False
-            pos+=1
+    x_alleles = x[0]
+    for other, starting_position in zip(X, starting_positions):
+        other_alleles = other[0][:len(x_alleles)-starting_position]                         # the part of other facing x
+        if other_alleles != x_alleles[starting_position:starting_position+len(other_alleles)]:  # "non colinear"
+            return False
     return True
 
 
 def is_canonical(sr):
     ''' return True if the canonical representation of sr is itself'''
-    if d_list_sup(sr, get_reverse_sr(sr)):
+    if sr[0] >= get_reverse_sr(sr)[0]:
         return True
     else:
         return False
@@ -250,7 +237,7 @@ def is_canonical(sr):
 def get_canonical(sr):
     ''' return the canonical representation of sr'''
     sr_=get_reverse_sr(sr)
-    if d_list_sup(sr, sr_):    
+    if sr[0] >= sr_[0]:
         return sr
     else:
         return sr_
@@ -259,12 +246,10 @@ def print_maximal_super_reads(SR):
     '''print all maximal super reads as a flat format'''
     for sr in SR.traverse():
         if is_canonical(sr) or is_palindromic(sr):
-            if len(sr)==1:
-                print (str(allele_value(sr[0]))+";")
+            if len(sr[0])==1:
+                print (str(sr[0][0])+";")
             else:
-                for unitig_id in sr:
-                    print (str(unitig_id)+";", end="")
-                print ()
+                print (sr_to_string(sr))
 
 
 
@@ -273,6 +258,30 @@ def determine_k(fa_file_name):
     """
     return int(fa_file_name.split("_k_")[1].split("_")[0]) 
 
+class StoreSequences:
+    """ Same as the sequences dictionary of index_sequences (K3000_compacted_*_to_fa.py), read on demand from a bubble store (see bubble_store.py):
+    sequences[snp_id] = [left_unitig_len, right_unitig_len, upperseq, lowerseq] for a SNP, KeyError otherwise.
+    The last SNP is kept, as its values are read several times in a row.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.last_snp_id = None
+        self.last_value = None
+
+    def __getitem__(self, snp_id):
+        if snp_id != self.last_snp_id:
+            row = self.store.row(int(snp_id)) if snp_id.isdigit() else -1
+            if row < 0 or self.store.bubble_type(row) != "SNP":
+                raise KeyError(snp_id)
+            left_unitig_len, right_unitig_len = self.store.unitig_lengths(row)
+            upperseq, lowerseq = self.store.sequences(row)
+            self.last_snp_id = snp_id
+            self.last_value = [left_unitig_len, right_unitig_len, upperseq, lowerseq]
+        return self.last_value
+
+    def close(self):
+        self.store.close()
+
 def unitig_id2snp_id(unitig_id):
     sign=1
     if unitig_id<0: sign=-1
@@ -287,9 +296,9 @@ def unitig_id2snp_id(unitig_id):
 
 def get_msr_id(msr):
     ''' returns the id of a msr
-    WARNING: here msr contains as last value its unique id.
+    WARNING: here msr contains as last value its unique id: (alleles, distances, id).
     '''
-    return int(msr[-1].split("_")[1])
+    return msr[-1]
 
 def get_reverse_msr_id(msr,MSR):
     ''' returns the id of the reverse complement of msr
@@ -304,7 +313,7 @@ def get_reverse_msr_id(msr,MSR):
     Y=MSR.get_lists_starting_with_given_prefix(without_id_reverse_msr)          # find the reverse complement in the list.
     # print("Y is", Y)
     for y in Y:                                                                 # should be of size >= 1. One of them is exactly 'without_id_reverse_msr' plus its id.
-        if len(y) == len(without_id_reverse_msr)+1:                             # 'y' is 'without_id_reverse_msr' with its node id
+        if len(y[0]) == len(without_id_reverse_msr[0]):                         # 'y' is 'without_id_reverse_msr' with its node id
             return get_msr_id(y)                                                # 2/
     return None                                                                 # Should not happend
 
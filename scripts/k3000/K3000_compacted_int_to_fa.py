@@ -7,21 +7,22 @@ Creation of a FA file from a compacted fact int file.
 '''
 
 import sys
+import os
 import K3000_common as kc
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+from disco_bubbles import read_bubbles
+from bubble_store import BubbleStore, is_bubble_store
 
 
 def index_sequences(fa_file_name):
+    if is_bubble_store(fa_file_name): # a SNP is read from the store when needed, no need to index the whole file
+        return kc.StoreSequences(BubbleStore(fa_file_name))
     sequences = {}
-    mfile = open(fa_file_name)
-    while True: 
-        line1 = mfile.readline()
-        if not line1: break
-        line1 = line1.strip()
-        line2 = mfile.readline().strip()
-        line3 = mfile.readline().strip()
-        line4 = mfile   .readline().strip()
-        
-        if not line1.startswith(">SNP"): continue
+    for bubble in read_bubbles(fa_file_name):
+        if not bubble.is_snp: continue
+        line1 = bubble.header_up
+        line2 = bubble.sequence_up
+        line4 = bubble.sequence_low
         
         #line1: 
         #>SNP_higher_path_9|P_1:30_A/C|high|nb_pol_1|left_unitig_length_152|right_unitig_length_3|C1_25|Q1_63|G1_0/1:399,14,359|rank_0
@@ -38,7 +39,6 @@ def index_sequences(fa_file_name):
        
         sequences[snp_id] = [left_unitig_len, right_unitig_len, line2, line4] #sequences[snp_id] = [left_unitig_len, right_unitig_len, upperseq, lowerseq] 
         
-    mfile.close()
     return sequences
     
 def generate_sequence_paths(sequences, k, compacted_fact_file_name):
@@ -114,7 +114,7 @@ def generate_sequence_paths(sequences, k, compacted_fact_file_name):
             
             
         
-    mdile.close()
+    mfile.close()
 
 def main():
     '''
@@ -123,6 +123,7 @@ def main():
     sequences=index_sequences(sys.argv[1]) #for each snp id: sequences[snp_id]=[left_unitig_len, right_unitig_len, upperseq, lowerseq] 
     k = kc.determine_k(sys.argv[1])
     generate_sequence_paths(sequences, k, sys.argv[2])
+    if isinstance(sequences, kc.StoreSequences): sequences.close()
     
 
 
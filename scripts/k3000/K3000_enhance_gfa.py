@@ -1,4 +1,8 @@
 import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+from disco_bubbles import read_bubbles
+from bubble_store import BubbleStore, is_bubble_store
 
 def get_left_clean_snp(snp):
     return snp.lstrip().lstrip('-')
@@ -88,49 +92,53 @@ def get_compatible_facts(text_raw_fact, compacted_facts, snp_to_fact_id):
 
 get_allele_id = lambda x: x.split("_")[-1]+x.split("_")[1][0]   #>SNP_higher_path_9 to "9h"
 get_coverage  = lambda x: int(x.split("_")[-1])                 #C1_31 to int(31)
+class StoreAlleleCoverage:
+    """
+    Same as the dictionary of index_allele_coverage, read on demand from a bubble store (see bubble_store.py): allele_id (eg 21112l) -> coverage
+    """
+    def __init__(self, store, read_set_id):
+        assert 1 <= read_set_id <= store.nb_samples, "Read set id "+str(read_set_id)+" not in the bubble store"
+        self.store = store
+        self.read_set_id = read_set_id
+
+    def __getitem__(self, allele_id):
+        snp_id = allele_id[:-1]
+        row = self.store.row(int(snp_id)) if snp_id.isdigit() and allele_id[-1] in "hl" else -1
+        if row < 0 or self.store.bubble_type(row) != "SNP": # do not deal with indels for now
+            raise KeyError(allele_id)
+        return self.store.coverage(row, self.read_set_id, upper=allele_id[-1] == "h")
+
+    def close(self):
+        self.store.close()
+
 def index_allele_coverage(raw_disco_fa_file_name, read_set_id):
     """
     For each allele name (eg 21112l) provides its coverage in the considered read set)
     Returns a dictionary: allele_id -> coverage
     Used only by "detects_allele_coverage"
     """
+    if is_bubble_store(raw_disco_fa_file_name): # the coverages are read from the store when needed, no need to index the whole file
+        return StoreAlleleCoverage(BubbleStore(raw_disco_fa_file_name), int(read_set_id))
     alleles_coverage = {}                    # Fora each allele, store its read coverage
-    mfile = open(raw_disco_fa_file_name)
-    # first variant rteated appart to recover the position of the coverage in which we are interested
     coverage_field=-1
-    while True:
-        comment = mfile.readline()
-        if not comment: break
-        if not comment.startswith(">SNP"): continue # do not deal with indels for now
-        s_comment = comment.strip().split("|")
-        mfile.readline()        # sequence we don't care
-        for i,field_content in enumerate(s_comment):
-            if field_content.startswith("C"+str(read_set_id)+"_"):
-                coverage_field=i
-                break
-        assert coverage_field != -1, "Read set id "+str(read_set_id)+" not in "+comment
-        allele_id = get_allele_id(s_comment[0])
-        coverage  = get_coverage(s_comment[coverage_field])
-        alleles_coverage[allele_id]=coverage
-    
-    
-    
-    # other variants
-    while True:
+    for bubble in read_bubbles(raw_disco_fa_file_name):
         # >SNP_higher_path_9|P_1:30_C/T,P_2:35_T/G|high|nb_pol_2|left_unitig_length_31|right_unitig_length_66|C1_31|Q1_63|G1_0/1:398,14,458|rank_0
         # ggtgcagacaacccggcaggtgttgatgataAAGATCTGGTTAAATACGCCGATATTGGCGCGACTTACTATTTCAATAAAAACATGTCCACCTACGttgactataaaatcaacctgttggatgaagatgacagcttctacgctgccaatggcatctctaccg
         # >SNP_lower_path_9|P_1:30_C/T,P_2:35_T/G|high|nb_pol_2|left_unitig_length_31|right_unitig_length_66|C1_28|Q1_63|G1_0/1:398,14,458|rank_0
         # ggtgcagacaacccggcaggtgttgatgataAAGATCTGGTTAAATACGCCGATATTGGCGTGACTGACTATTTCAATAAAAACATGTCCACCTACGttgactataaaatcaacctgttggatgaagatgacagcttctacgctgccaatggcatctctaccg
-        comment = mfile.readline()
-        if not comment: break
-        if not comment.startswith(">SNP"): continue # do not deal with indels for now
-        comment = comment.strip().split("|")
-        mfile.readline()        # sequence we don't care
-        allele_id = get_allele_id(comment[0])
-        coverage  = get_coverage(comment[coverage_field])
-        alleles_coverage[allele_id]=coverage
+        if not bubble.is_snp: continue # do not deal with indels for now
+        if coverage_field == -1:
+            # first variant treated appart to recover the position of the coverage in which we are interested
+            for i,field_content in enumerate(bubble.fields_up):
+                if field_content.startswith("C"+str(read_set_id)+"_"):
+                    coverage_field=i
+                    break
+            assert coverage_field != -1, "Read set id "+str(read_set_id)+" not in "+bubble.lines[0]
+        for comment in (bubble.fields_up, bubble.fields_low):
+            allele_id = get_allele_id(comment[0])
+            coverage  = get_coverage(comment[coverage_field])
+            alleles_coverage[allele_id]=coverage
         
-    mfile.close()
     return alleles_coverage
 
 def detects_allele_coverage(compacted_facts, raw_disco_file_name, read_set_id):
@@ -155,6 +163,7 @@ def detects_allele_coverage(compacted_facts, raw_disco_file_name, read_set_id):
             nb+=1
         compacted_fact_allele_weight[fact_id] = [min,max,sum/float(nb)] #min, max, mean
         # print(compacted_fact_allele_weight[fact_id])
+    if isinstance(alleles_coverage, StoreAlleleCoverage): alleles_coverage.close()
     return compacted_fact_allele_weight
 
 def detects_facts_coverage(compacted_facts, snp_to_fact_id, raw_facts_file_name):
@@ -23,13 +23,13 @@ def show_right_edges (MSR,x,id_x):
     '''
     x=x[:-1]                                # remove the x_id from the x msr
     if not kc.is_canonical(x): return
-    n=len(x)
+    n=len(x[0])
 
     # CASES 1 AND 2
     strandx='+'
     # print ("x is", x)
     for len_u in range(1,n): # for each possible x suffix
-        u=x[-len_u:]
+        u=kc.sr_slice(x, -len_u)
         # print ("u is", u)
         Y=MSR.get_lists_starting_with_given_prefix(u)
         # if x in Y: Y.remove(x)            # we remove x itself from the list of y : note that it should not occur.
@@ -60,7 +60,7 @@ def show_right_edges (MSR,x,id_x):
     strandx='-'
     x_=kc.get_reverse_sr(x)
     for len_u in range(1,n): # for each possible x suffix
-        u=x_[-len_u:]
+        u=kc.sr_slice(x_, -len_u)
         Y=MSR.get_lists_starting_with_given_prefix(u)
         # assert(x_ not in Y)
         if len(Y)==0: continue  # No y starting with u
@@ -90,14 +90,14 @@ def print_GFA_edges(MSR):
 
 
 def check_msr(msr, fact_int):
-    # msr ['49648_0', '67994_-20', '20000_23']
+    # msr ((49648, 67994, 20000), (0, -20, 23))
     # fact_int 49648_0;67994_-20;20000_23; SP:0_166;126_261;178_444; BP:0_83;-20_72;23_61;
-    for i,allele_id in enumerate(fact_int.split()[0].split(";")[:-1]):
-        if msr[i] != allele_id:
-            sys.stderr.write("Not corresponding msr and fact_int:\n")
-            sys.stderr.write(str(msr)+"\n")
-            sys.stderr.write(fact_int+"\n")
-            sys.exit(0)
+    fact = kc.sr_from_strings(fact_int.split()[0].split(";")[:-1])
+    if kc.sr_slice(msr, 0, len(fact[0])) != fact:
+        sys.stderr.write("Not corresponding msr and fact_int:\n")
+        sys.stderr.write(str(msr)+"\n")
+        sys.stderr.write(fact_int+"\n")
+        sys.exit(0)
             
 def index_nodeid_to_distance(MSR, compacted_fact_int_file_name): 
     """ returns an index nodeid -> distances
@@ -107,7 +107,7 @@ def index_nodeid_to_distance(MSR, compacted_fact_int_file_name):
     for fact_line in compacted_fact_int_file.readlines():
         # 49648_0;67994_-20;20000_23; SP:0_166;126_261;178_444; BP:0_83;-20_72;23_61;
         s_fact_line = fact_line.strip().split()
-        node_as_list = [node for node in s_fact_line[0].split(";")[:-1]]
+        node_as_list = kc.sr_from_strings(s_fact_line[0].split(";")[:-1])
         # print(s_fact_line[0], node_as_list)
         if not  kc.is_canonical(node_as_list):                       continue
         node_id = MSR.get_node_id(node_as_list)
@@ -130,11 +130,11 @@ def print_GFA_nodes_as_ids(MSR, compacted_fact_int_file_name):
         msr = msr[:-1]                                      # remove the last value that corresponds to the node id
         if not kc.is_canonical(msr):                       continue
         print ("S\t"+str(node_id)+"\t", end="")
-        for unitig_id in msr:                       
-            print (kc.unitig_id2snp_id(kc.allele_value(unitig_id))+";", end="")
+        for unitig_id in msr[0]:                    
+            print (kc.unitig_id2snp_id(unitig_id)+";", end="")
         # check_msr(msr, fact_int)
         # assert str(node_id) in nodeid_to_distance, nodeid_to_distance
-        print ("\t"+nodeid_to_distance[str(node_id)])
+        print ("\t"+nodeid_to_distance[node_id])
 
 def union(a, b):
     """ return the union of two lists """
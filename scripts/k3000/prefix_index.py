@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+'''
+Prefix index of super reads: the set SR of K3000.py, MSR of K3000_msr_to_gfa.py
+A super read is a pair of tuples of integers (alleles, distances), see K3000_common.py
+The super reads are divided into buckets, one per first allele (the distance of the first allele is 0).
+A bucket is an array of the super reads sorted by alleles: the super reads starting with a prefix are contiguous in it,
+found by bisection in O(|prefix|*log(|bucket|) + |output|). A super read is added or removed at its position, found
+by bisection as well (the array is shifted by a memmove, no comparison).
+'''
+
+import bisect
+
+# A super read is stored as (alleles, rank, distances[1:]), followed by its node id once indexed (index_nodes).
+# rank is its order of insertion: the super reads with equal alleles are kept in this order.
+
+
+class prefix_index(object):
+    """Set of super reads (a super read may be present several times), see the module docstring
+    Super reads are traversed bucket by bucket (in their order of creation), by increasing alleles in a bucket.
+    """
+
+    def __init__(self):
+        self.buckets={}         # first allele -> sorted array of the super reads starting with it
+        self.first_alleles=[]   # keys of buckets in their order of creation
+        self.rank=0             # of the next super read added
+        self.size=0
+        self.indexed=False      # the super reads have a node id
+
+    def add(self, mylist):
+        """add a new super read, at its position in the order (after the equal alleles)"""
+        alleles = mylist[0]
+        current = self.buckets.get(alleles[0])
+        if current is None:
+            current = self.buckets[alleles[0]] = []
+            self.first_alleles.append(alleles[0])
+        entry = (alleles, self.rank, mylist[1][1:])+mylist[2:]
+        self.rank+=1
+        current.insert(bisect.bisect_right(current, entry), entry)
+        self.size+=1
+
+    sorted_add = add    # the index is always sorted
+
+    def sort(self):
+        """the index is always sorted, nothing to do"""
+        pass
+
+    def traverse(self):
+        """yield each super read. Super reads may be added or removed during the traversal: a super read is yielded if it
+        is present when the traversal reaches its position"""
+        i=0
+        while i<len(self.first_alleles):
+            current = self.buckets[self.first_alleles[i]]
+            position=0
+            while position<len(current):
+                entry = current[position]
+                yield (entry[0], (0,)+entry[2])+entry[3:]
+                if position<len(current) and current[position] is entry: position+=1
+                else: position = bisect.bisect_right(current, entry)   # the array changed meanwhile
+            i+=1
+
+    def index_nodes(self):
+        ''' For each element in the structure, we add its id as a last value, for instance 14 for node 14: (alleles, distances, 14).'''
+        index_id=0
+        for first in self.first_alleles:
+            current = self.buckets[first]
+            current[:] = [entry[:3]+(index_id+i,) for i, entry in enumerate(current)]
+            index_id+=len(current)
+        self.indexed=True
+
+    def find(self,mylist):
+        '''return the bucket and the position of the first copy of a super read (its first distance is not compared), None,-1 if absent'''
+        alleles = mylist[0]
+        current = self.buckets.get(alleles[0])
+        if current is None: return None,-1
+        distances = mylist[1][1:]
+        position = bisect.bisect_left(current, (alleles,))
+        while position<len(current) and current[position][0]==alleles:
+            if current[position][2]==distances and current[position][3:]==mylist[2:]:
+                return current,position
+            position+=1
+        return None,-1
+
+    def remove(self,mylist):
+        '''remove an element from the structure (its first copy), return 1 if removed, 0 if it was absent'''
+        current,position = self.find(mylist)
+        if current is None: return 0
+        del current[position]
+        self.size-=1
+        return 1
+
+    def __contains__(self,mylist):
+        ''' True if the super read is in the set (its first distance is not compared) '''
+        return self.find(mylist)[0] is not None
+
+    def get_node_id(self, search_sr):
+        list_nodes = self.get_lists_starting_with_given_prefix(search_sr)
+        for node in list_nodes:
+            if node[:-1]==search_sr:
+                return node[-1]
+        return None
+
+    def get_lists_starting_with_given_prefix(self, prefix):
+        ''' given a prefix of a super read, return all super reads in the set starting with the alleles of this prefix,
+        by increasing alleles. Their first distance is the one of the prefix.
+        '''
+        alleles = prefix[0]
+        current = self.buckets.get(alleles[0])
+        if current is None: return []
+        distance = prefix[1][:1]
+        if len(alleles)>1:
+            start = bisect.bisect_left(current, (alleles,))                               # first alleles >= prefix
+            stop = bisect.bisect_left(current, (alleles[:-1]+(alleles[-1]+1,),), start)   # first alleles > all the ones starting with prefix
+            current = current[start:stop]
+        if self.indexed:
+            return [(entry[0], distance+entry[2], entry[3]) for entry in current]
+        return [(entry[0], distance+entry[2]) for entry in current]
+
+    def __len__(self):
+        return self.size
+
+    def contains(self,query):
+        """only for debug purpose, no need to be optimized"""
+        for first, current in self.buckets.items():
+            if first==query:
+                print("key", first, "query",query)
+                return True
+            for entry in current:
+                if query in entry[0]:
+                    return True
+        return False
+
+    def unique(self):
+        ''' keep one super read per list of alleles, the first one in the order (distances are not compared) '''
+        for current in self.buckets.values():
+            size_before=len(current)
+            current[:] = [entry for i, entry in enumerate(current) if i==0 or entry[0]!=current[i-1][0]]
+            self.size-=size_before-len(current)
+
+    def __str__(self):
+        str_SR=""
+        for sr in self.traverse():
+            str_SR+=",".join([str(allele)+"_"+str(distance) for allele, distance in zip(sr[0], sr[1])])+"\n"
+        return str_SR
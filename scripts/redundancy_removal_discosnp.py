@@ -5,6 +5,7 @@
 #   check pair of variants that start with the same kmer and keep only one bubble
 #   check pair of variants that end with the same kmer and keep only one bubble
 import sys
+from disco_bubbles import read_bubbles
 
 def get_first_kmer(seq,k):
     for i in range (len(seq)):
@@ -34,25 +35,23 @@ def non_empty_intersection(a,b):
     return False
     
 
-def parse(fafile,k,faout):
+def parse(fafile_name,k,faout):
     start_kmer_to_var_id={}
     stop_kmer_to_var_id ={}
     i=1
     printed=0
-    while (True):
+    for bubble in read_bubbles(fafile_name):
         if i%100==0 : 
             sys.stdout.write ("\r"+str(i)+ " bubbles treated, "+str(printed)+" bubbles non redundant")
             sys.stdout.flush()
         i+=1
-        com1=fafile.readline()
-        if not com1: break
-        com1=com1.rstrip() #>SNP_higher_path_1|P_1:30_T/G|high|nb_pol_1|left_unitig_length_22|right_unitig_length_0
-        seq1=fafile.readline().rstrip()
-        com2=fafile.readline().rstrip()
-        seq2=fafile.readline().rstrip()
+        com1=bubble.header_up #>SNP_higher_path_1|P_1:30_T/G|high|nb_pol_1|left_unitig_length_22|right_unitig_length_0
+        seq1=bubble.sequence_up
+        com2=bubble.header_low
+        seq2=bubble.sequence_low
         
         # get variant_id: 
-        var_id=com1.split("|")[0].split("_")[-1]
+        var_id=bubble.id
         
         # deal with starting kmer
         kmer_start1=get_first_kmer(seq1,k)
@@ -80,15 +79,14 @@ def parse(fafile,k,faout):
         faout.write(com2+"\n")
         faout.write(seq2+"\n")
         printed+=1
-    sys.stdout.write ("\r"+str(i)+ " bubbles treated, "+str(printed)+" bubbles non redundant\n")
+    sys.stdout.write ("\r"+str(i-1)+ " bubbles treated, "+str(printed)+" bubbles non redundant\n")
 
 if len(sys.argv) !=4: 
     print ("Script "+ sys.argv[0].split("/")[-1])
     print ("  From a discoSnp .fa output: from all variants that start or stop with the same kmer, keep only one of their occurrences")
     print ("  usage: "+ sys.argv[0].split("/")[-1]+ " input.fa k_value output.fa")
     exit(1)
-fafile=open(sys.argv[1],"r")
 k=int(sys.argv[2])
 faout=open(sys.argv[3],"w")
-parse(fafile,k,faout)
+parse(sys.argv[1],k,faout)
 
@@ -25,16 +25,9 @@ while True:
 #    SNP_higher_path_3       196     3       C       G       .       .       Ty=SNP;Rk=1;UL=86;UR=261;CL=166;CR=761;Genome=.;Sd=.    GT:DP:PL:AD:HQ  0/0:124:10,378,2484:124,0:0,0   1/1:134:2684,408,10:0,134:0,0
     splitted_line = line.split()
     
-    toprint=""
-    for i in range(9):
-        toprint+=splitted_line[i]+'\t'
-    for i in range(9,len(splitted_line)):
-        splitted_geno = splitted_line[i].split(':')
-        if int(splitted_geno[1])<=dp_threshold: toprint+= "./.:"
-        else: toprint+= splitted_geno[0]+":"
-        
-        for j in range(1,len(splitted_geno)):
-            toprint+= splitted_geno[j]
-            if j<len(splitted_geno)-1: toprint+= ":"
-        if i<len(splitted_line): toprint+='\t'
-    print (toprint)
\ No newline at end of file
+    genotypes=[]
+    for genotype in splitted_line[9:]:
+        splitted_geno = genotype.split(':')
+        if int(splitted_geno[1])<=dp_threshold: splitted_geno[0]="./."
+        genotypes.append(":".join(splitted_geno))
+    print ("\t".join(splitted_line[:9]+genotypes)+"\t")
\ No newline at end of file
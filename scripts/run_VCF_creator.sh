@@ -275,7 +275,6 @@ if [ -z "$samfile" ];then
        #BWA files
        #Pierre: user gave a file name we must respect its choice.
        #	vcf=$(basename $vcffile .vcf)"_"$(basename $discoSNPs .fa)"_n"$n"_l"$l"_s"$s".vcf"
-       samfile=$(basename $discoSNPs .fa)"BWA_MEM".sam
        indexamb=$genome".amb"
        indexann=$genome".ann"
        indexbwt=$genome".bwt"
@@ -297,12 +296,18 @@ if [ -z "$samfile" ];then
        fi
        #---------------------------------------------------------------------------------------------------------------------------
        #---------------------------------------------------------------------------------------------------------------------------
-       ##Alignment discosnps on the reference genome
-       echo "ALIGNMENT: $PATH_BWA/bwa mem -h 80 -k $k $genome $discoSNPsbis > $samfile"
-       $PATH_BWA/bwa mem -h 80 -k $k $genome $discoSNPsbis > $samfile
-       if [ $? -ne 0 ]
+       ##Alignment discosnps on the reference genome, streamed to VCF_creator (no intermediate sam file)
+       echo "ALIGNMENT: $PATH_BWA/bwa mem -h 80 -k $k $genome $discoSNPsbis | python $PATH_VCF_creator/VCF_creator.py - --format sam -o $vcffile"
+       $PATH_BWA/bwa mem -h 80 -k $k $genome $discoSNPsbis | python $PATH_VCF_creator/VCF_creator.py - --format sam -o $vcffile
+       pipe_status=("${PIPESTATUS[@]}")
+       if [ ${pipe_status[0]} -ne 0 ]
+       then
+              echo "there was a problem with BWA (command was \"$PATH_BWA/bwa mem $genome $discoSNPsbis\""
+              exit 1
+       fi
+       if [ ${pipe_status[1]} -ne 0 ]
        then
-              echo "there was a problem with BWA (command was \"$PATH_BWA/bwa mem $genome $discoSNPsbis > $samfile\""
+              echo "there was a problem with the VCF creation (command was \"python $PATH_VCF_creator/VCF_creator.py - --format sam -o $vcffile\""
               exit 1
        fi
        #---------------------------------------------------------------------------------------------------------------------------
@@ -318,14 +323,15 @@ else
               echo -e "...You must provide an output <file>..."
               exit 1
        fi
-fi
 
-python $PATH_VCF_creator/VCF_creator.py -s $samfile -o $vcffile 
-if [ $? -ne 0 ]
-then
-       echo "there was a problem with the VCF creation (command was \"python $PATH_VCF_creator/VCF_creator.py -s $samfile -o $vcffile \""
-       exit 1
+       python $PATH_VCF_creator/VCF_creator.py -s $samfile -o $vcffile 
+       if [ $? -ne 0 ]
+       then
+              echo "there was a problem with the VCF creation (command was \"python $PATH_VCF_creator/VCF_creator.py -s $samfile -o $vcffile \""
+              exit 1
+       fi
 fi
+
 echo -e "... Creation of the vcf file: done ...==> $vcffile "
 
 
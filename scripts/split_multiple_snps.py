@@ -1,4 +1,5 @@
 import sys
+from disco_bubbles import read_bubbles
 
 """ 
 Given a discoSnp fasta file result, splits the bubbles into bubbles containing a unique SNP. Upper and lower case of each SNP is STRICTLY the same excepted at the variant position. Thus the phasing is lost here.
@@ -30,7 +31,6 @@ GCGCTGGCCCCGTCCAGACTTCCTGTCTTTGGCTCCATAGGACGGTCCCCAGGAAGAAGAA
 >SNP_lower_path_711_2|P_2:32_G/C
 GCGCTGGCCCCGTCCAGACTTCCTGTCTTTCGCTCCATAGGACGGTCCCCAGGAAGAAGAA
 """
-file = open(sys.argv[1])
 
 def get_maj_seq(seq):
     """
@@ -44,14 +44,12 @@ def get_maj_seq(seq):
 
 delta=30
 count=0
-while True: 
-    com1=file.readline()
-    if not com1: break
+for bubble in read_bubbles(sys.argv[1]):
     count+=1
-    com1=com1.rstrip()               #>SNP_higher_path_30|P_1:30_A/T,P_2:55_G/T|low|nb_pol_2|left_unitig_length_6|right_unitig_length_0
-    seq1=get_maj_seq(file.readline().rstrip())
-    com2=file.readline().rstrip()
-    seq2=get_maj_seq(file.readline().rstrip())
+    com1=bubble.header_up               #>SNP_higher_path_30|P_1:30_A/T,P_2:55_G/T|low|nb_pol_2|left_unitig_length_6|right_unitig_length_0
+    seq1=get_maj_seq(bubble.sequence_up)
+    com2=bubble.header_low
+    seq2=get_maj_seq(bubble.sequence_low)
     str_nb_pol=com1.split('|')[3]
     assert str_nb_pol.startswith("nb_pol")
     nb_pol=int(com1.split('|')[3].split('_')[-1])
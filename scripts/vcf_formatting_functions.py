@@ -13,14 +13,16 @@
     *********************************************** '''
 
 import re
+import functools
 
-def vcf_header(source, date, fasta_file, nb_samples):
+def vcf_header(source, date, fasta_file, nb_samples, samples = None):
     '''
         Returns the first lines of the vcf file, composed of the COMMENTS and the HEADER
         source:     the name of the python program that writes this vcf
         date:       the date to appear in the vcf file
         fasta_file: the input fasta file
         nb_samples: the nb of samples
+        samples:    numbers (1-based) of the output samples, None: all samples
         '''
 
     VCF_COMMENTS = f'''##fileformat=VCFv4.1
@@ -46,110 +48,183 @@ def vcf_header(source, date, fasta_file, nb_samples):
 ##FORMAT=<ID=AD,Number=2,Type=Integer,Description="Depth of each allele by sample">
 ##FORMAT=<ID=HQ,Number=2,Type=Integer,Description="Haplotype Quality">'''
 
-    HEADER = "\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]+["G"+str(i+1) for i in range(nb_samples)])
+    HEADER = "\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]+["G"+str(i) for i in (samples or range(1, nb_samples + 1))])
     
     header_str = VCF_COMMENTS + "\n" + HEADER + "\n"
     return header_str
 
 
-def format_vcf(splitted_1, splitted_2, nb_samples, rank, sequence, cluster_id, cluster_size, tig_type = 0):
+def bubble_filter(min_rank, max_miss, nb_samples, samples = None, bubble_ids = None, rejections = None):
     '''
-        Format information extracted from the fasta headers of a single bubble into one or several vcf lines
+        Returns a function checking the raw header of the higher path of a bubble against the rank and missing genotype filters,
+        without splitting it into fields. This function returns the rank of a kept bubble, None for a filtered out one.
+        min_rank:   min rank value
+        max_miss:   a bubble is filtered out if its ratio of missing genotypes (Gi_./.) is >= max_miss ; None: no missing genotype filter
+        nb_samples: the nb of samples
+        samples:    numbers (1-based) of the samples on which the ratio of missing genotypes is computed, None: all samples
+        bubble_ids: set of the ids (strings, "3" for SNP_higher_path_3) of the bubbles to keep, None: all bubbles
+        rejections: dict in which the rejected bubbles are counted per filter ("bubble_id", "rank", "missing"), see filter_metrics.py
+        '''
+    missing = [f"|G{sample}_./." for sample in samples] if samples else None
+    def keep(header):
+        if bubble_ids is not None:
+            name_end = header.index("|")
+            if header[header.rindex("_", 0, name_end) + 1:name_end] not in bubble_ids:
+                if rejections is not None:
+                    rejections["bubble_id"] += 1
+                return None
+        rank = float(header[header.rindex("|rank_") + 6:])
+        if rank < min_rank:
+            if rejections is not None:
+                rejections["rank"] += 1
+            return None
+        if max_miss is not None:
+            if missing is None:
+                ratio = header.count("_./.") / nb_samples
+            else:
+                ratio = sum(1 for genotype in missing if genotype in header) / len(missing)
+            if ratio >= max_miss:
+                if rejections is not None:
+                    rejections["missing"] += 1
+                return None
+        return rank
+    return keep
+
+
+def sample_columns(splitted_1, splitted_2, nb_samples, nb_fixed_fields, samples = None):
+    '''
+        Decodes the per-sample fields of the headers of a bubble column by column (all C fields, then all Q fields, then all G fields)
+        Returns 6 lists of strings, with one value per sample: ad_1, ad_2, qual_1, qual_2, genotype, likelihood
+        samples: numbers (1-based) of the samples to decode, in the output order ; None: all samples
+
+        >SNP_higher_path_3|P_1:30_C/G|...|C1_124|C2_0|Q1_0|Q2_0|G1_0/0:10,378,2484|G2_1/1:2684,408,10|rank_1
+        ad_1 = ["124", "0"], qual_1 = ["0", "0"], genotype = ["0/0", "1/1"], likelihood = ["10,378,2484", "2684,408,10"]
+        '''
+    if samples is None:
+        select = lambda splitted, start: splitted[start:start + nb_samples]
+    else:
+        select = lambda splitted, start: [splitted[start + sample - 1] for sample in samples]
+    start_q = nb_fixed_fields + nb_samples
+    start_g = start_q + nb_samples
+    ad_1 = [field.split("_")[1] for field in select(splitted_1, nb_fixed_fields)]
+    ad_2 = [field.split("_")[1] for field in select(splitted_2, nb_fixed_fields)]
+    qual_1 = [field.split("_")[1] for field in select(splitted_1, start_q)]
+    qual_2 = [field.split("_")[1] for field in select(splitted_2, start_q)] #necessary : is qual_2 always == qual_1 ???
+    geno_fields = [field.split("_")[1].split(":") for field in select(splitted_1, start_g)]
+    genotype = [fields[0] for fields in geno_fields]
+    likelihood = [fields[1] for fields in geno_fields]
+    return ad_1, ad_2, qual_1, qual_2, genotype, likelihood
+
+
+SNP_POLYMORPHISM = re.compile(r"P_\d+:(\d+)_(\w)/(\w)")    # P_1:30_A/G : position, REF, ALT
+INDEL_POLYMORPHISM = re.compile(r"P_\d+:(\d+)_(\d+)")      # P_1:30_27_3 : position, indel size
+
+
+class VcfFormatter:
+    '''
+        Formats the bubbles of a fasta file into vcf lines. The layout of the headers is the same for the whole file:
+        the positions of the fields and the INFO layout are computed once, from nb_samples and tig_type.
 
-        splitted_1:     a list of values contained in the higher path fasta header (splitted by "|")
-        splitted_2:     idem of lower path
         nb_samples:     nb of samples
-        rank:           rank of the variant
-        sequence :      DNA sequence of the lower path : usefull for INDELs (longest sequnce)
-        cluster_id:     cluster_id, if not clustered "."
-        cluster_size:   size of the cluster, if not clustered "."
         tig_type :      0 no extension, 1 unitig, 2 contig (ie. unitig and contig length are present)
-
+        samples:        numbers (1-based) of the samples to output, None: all samples. The fields of the other samples are not decoded
         '''
-    
-    '''
-        >SNP_higher_path_1487|P_1:30_A/G|low|nb_pol_1|left_unitig_length_
-        SNP_higher_path_1487    34    1487    A    G    .    .    Ty=SNP;Rk=0.00072476;UL=4;UR=60;CL=.;CR=.;Genome=.;Sd=.;Cluster=.;ClSize=.    GT:DP:PL:AD:HQ    0/1:53:194,32,613:37,16:71,71    0/1:83:296,44,955:58,25:71,71
+    FORMAT = "GT:DP:PL:AD:HQ"
+
+    def __init__(self, nb_samples, tig_type = 0, samples = None):
+        self.nb_samples = nb_samples
+        self.samples = samples
+        self.tig_type = tig_type
+        self.nb_fixed_fields = 4 + 2*tig_type
+        self.length_fields = slice(4, self.nb_fixed_fields)     # left/right unitig (and contig) lengths
+        if tig_type == 0:
+            self.info_lengths = "UL=.;UR=.;CL=.;CR=.;"
+        elif tig_type == 1:
+            self.info_lengths = "UL={};UR={};CL=.;CR=.;"
+        else:
+            self.info_lengths = "UL={};UR={};CL={};CR={};"
+        self.offset_field = 0 if tig_type == 1 else 2           # position of the left length giving the position offset (contig if any)
+
+    def format(self, splitted_1, splitted_2, rank, sequence, cluster_id, cluster_size):
         '''
-    
-    ''' INDEL :
-        >INDEL_higher_path_3205|P_1:30_27_3|high|nb_pol_1|left_unitig_length_14|right_unitig_length_6|C1_14|C2_17|Q1_71|Q2_71|G1_0/1:243,13,203|G2_0/1:268,13,248|rank_0.019011
-        aaggcagcggccagTCCAGGATGTCCAAGAATTCAACCAATTCGAACAATTCTAAAGGATCGTTTAATTCAagcggc
-        >INDEL_lower_path_3205|P_1:30_27_3|high|nb_pol_1|left_unitig_length_14|right_unitig_length_6|C1_16|C2_18|Q1_71|Q2_71|G1_0/1:243,13,203|G2_0/1:268,13,248|rank_0.019011
-        aaggcagcggccagTCCAGGATGTCCAAGAATTCAACCAATTCG GGACAGTCCAGATAGTCGTATAACTCG AACAATTCTAAAGGATCGTTTAATTCAagcggc
-        aaggcagcggccagTCCAGGATGTCCAAGAATTCAACCAAT TCGGGACAGTCCAGATAGTCGTATAAC TCGAACAATTCTAAAGGATCGTTTAATTCAagcggc
-        INDEL_higher_path_3205    41    3205    T    TTCGGGACAGTCCAGATAGTCGTATAAC    .    .    Ty=INS;Rk=0.019011;UL=14;UR=6;CL=.;CR=.;Genome=.;Sd=.;Cluster=.;ClSize=.    GT:DP:PL:AD:HQ    0/1:30:243,13,203:14,16:71,71    0/1:35:268,13,248:17,18:71,71
+            Format information extracted from the fasta headers of a single bubble into one or several vcf lines
+
+            splitted_1:     a list of values contained in the higher path fasta header (splitted by "|")
+            splitted_2:     idem of lower path
+            rank:           rank of the variant
+            sequence :      DNA sequence of the lower path : usefull for INDELs (longest sequnce)
+            cluster_id:     cluster_id, if not clustered "."
+            cluster_size:   size of the cluster, if not clustered "."
+            '''
         
-        POS = UL + POS  : 1-based   (note: no longer left-normalized)
         '''
-    
-    FORMAT = "GT:DP:PL:AD:HQ"
-    nb_fixed_fields = 4 + 2*tig_type
-
-    vcf_line = ""
-    nb_pol = int(splitted_1[3].split("nb_pol_")[1])
-    path_name = splitted_1[0].lstrip(">")
-    CHROM = path_name
-    id = path_name.split("_")[3]
-    ty = re.findall("(\w+)_higher_path",path_name)[0]
-    
-    if ty != "SNP":
-        ty = "INS"
-    
-    INFO = f"Ty={ty};Rk={rank};"
-    position_offset = 0
-    if tig_type >0:
-        unitig_len = re.findall("_unitig_length_(\d+)","|".join(splitted_1[4:6]))
-        position_offset = int(unitig_len[0])
-        INFO += f"UL={unitig_len[0]};UR={unitig_len[1]};";
-        if tig_type == 2:
-            contig_len = re.findall("_contig_length_(\d+)","|".join(splitted_1[6:8]))
-            position_offset = int(contig_len[0]) # if contig POS = POS + left_contig_len
-            INFO += f"CL={contig_len[0]};CR={contig_len[1]};"
-        else:
-            INFO += "CL=.;CR=.;"
-    else:
-        INFO += "UL=.;UR=.;CL=.;CR=.;"
-    INFO += f"Genome=.;Sd=.;Cluster={cluster_id};ClSize={cluster_size}"
-
-    # Genotype info (same for all polymorphisms)
-    GENO = ""
-    for indiv in range(nb_samples):
-        ad_1 = splitted_1[nb_fixed_fields + indiv].split("_")[1]
-        ad_2 = splitted_2[nb_fixed_fields + indiv].split("_")[1]
-        dp = int(ad_1) + int(ad_2)
-        qual_1 = splitted_1[nb_fixed_fields + nb_samples + indiv].split("_")[1]
-        qual_2 = splitted_2[nb_fixed_fields + nb_samples + indiv].split("_")[1] #necessary : is qual_2 always == qual_1 ???
+            >SNP_higher_path_1487|P_1:30_A/G|low|nb_pol_1|left_unitig_length_
+            SNP_higher_path_1487    34    1487    A    G    .    .    Ty=SNP;Rk=0.00072476;UL=4;UR=60;CL=.;CR=.;Genome=.;Sd=.;Cluster=.;ClSize=.    GT:DP:PL:AD:HQ    0/1:53:194,32,613:37,16:71,71    0/1:83:296,44,955:58,25:71,71
+            '''
+        
+        ''' INDEL :
+            >INDEL_higher_path_3205|P_1:30_27_3|high|nb_pol_1|left_unitig_length_14|right_unitig_length_6|C1_14|C2_17|Q1_71|Q2_71|G1_0/1:243,13,203|G2_0/1:268,13,248|rank_0.019011
+            aaggcagcggccagTCCAGGATGTCCAAGAATTCAACCAATTCGAACAATTCTAAAGGATCGTTTAATTCAagcggc
+            >INDEL_lower_path_3205|P_1:30_27_3|high|nb_pol_1|left_unitig_length_14|right_unitig_length_6|C1_16|C2_18|Q1_71|Q2_71|G1_0/1:243,13,203|G2_0/1:268,13,248|rank_0.019011
+            aaggcagcggccagTCCAGGATGTCCAAGAATTCAACCAATTCG GGACAGTCCAGATAGTCGTATAACTCG AACAATTCTAAAGGATCGTTTAATTCAagcggc
+            aaggcagcggccagTCCAGGATGTCCAAGAATTCAACCAAT TCGGGACAGTCCAGATAGTCGTATAAC TCGAACAATTCTAAAGGATCGTTTAATTCAagcggc
+            INDEL_higher_path_3205    41    3205    T    TTCGGGACAGTCCAGATAGTCGTATAAC    .    .    Ty=INS;Rk=0.019011;UL=14;UR=6;CL=.;CR=.;Genome=.;Sd=.;Cluster=.;ClSize=.    GT:DP:PL:AD:HQ    0/1:30:243,13,203:14,16:71,71    0/1:35:268,13,248:17,18:71,71
+            
+            POS = UL + POS  : 1-based   (note: no longer left-normalized)
+            '''
         
-        geno_fields = splitted_1[nb_fixed_fields + 2*nb_samples + indiv].split("_")[1].split(":")
-        genotype = geno_fields[0]
-        likelihood = geno_fields[1]
-        GENO += "\t" + ":".join([genotype,str(dp),likelihood,",".join([ad_1,ad_2]),",".join([qual_1,qual_2])])
-
-    GENO = GENO.strip()
-
-    cigar = splitted_1[1].split(",")
-    isolated = False
-    if len(cigar) == 1:
-        isolated = True
-
-    i = 1
-    for pol in cigar:
-        if ty == "SNP":
-            POS, REF, ALT = re.findall("P_\d+:(\d+)_(\w)/(\w)",pol)[0]
-            POS = int(POS) + position_offset  # POS is 1-based
-        else:  # INDEL
-            POS, indel_size = re.findall("P_\d+:(\d+)_(\d+)",pol)[0]
-            POS = int(POS) + position_offset # 1-based
-            ALT = sequence[(POS-1):(POS+int(indel_size))]
-            REF = ALT[0]
-        ID = id
-        if not isolated:
-            ID += f"_{i}"
-        my_line = "\t".join([CHROM, str(POS), ID, REF, ALT, ".", ".", INFO, FORMAT, GENO])
-        vcf_line += my_line + "\n"
-        i += 1
-
-    return vcf_line
+        path_name = splitted_1[0].lstrip(">")
+        CHROM = path_name
+        id = path_name.split("_")[3]
+        is_snp = path_name[:path_name.rfind("_higher_path")] == "SNP"
+        
+        position_offset = 0
+        if self.tig_type > 0:
+            lengths = [field[field.rindex("_") + 1:] for field in splitted_1[self.length_fields]]
+            position_offset = int(lengths[self.offset_field]) # if contig POS = POS + left_contig_len
+            info_lengths = self.info_lengths.format(*lengths)
+        else:
+            info_lengths = self.info_lengths
+        INFO = f"Ty={'SNP' if is_snp else 'INS'};Rk={rank};{info_lengths}Genome=.;Sd=.;Cluster={cluster_id};ClSize={cluster_size}"
+
+        # Genotype info (same for all polymorphisms)
+        ad_1, ad_2, qual_1, qual_2, genotype, likelihood = sample_columns(splitted_1, splitted_2, self.nb_samples, self.nb_fixed_fields, self.samples)
+        dp = [int(a1) + int(a2) for a1, a2 in zip(ad_1, ad_2)]
+        GENO = "\t".join([f"{g}:{d}:{l}:{a1},{a2}:{q1},{q2}" for g, d, l, a1, a2, q1, q2 in zip(genotype, dp, likelihood, ad_1, ad_2, qual_1, qual_2)])
+        end_of_line = f"\t.\t.\t{INFO}\t{self.FORMAT}\t{GENO}\n"
+
+        cigar = splitted_1[1].split(",")
+        isolated = len(cigar) == 1
+
+        vcf_line = ""
+        for i, pol in enumerate(cigar, 1):
+            if is_snp:
+                POS, REF, ALT = SNP_POLYMORPHISM.search(pol).groups()
+                POS = int(POS) + position_offset  # POS is 1-based
+            else:  # INDEL
+                POS, indel_size = INDEL_POLYMORPHISM.search(pol).groups()
+                POS = int(POS) + position_offset # 1-based
+                ALT = sequence[(POS-1):(POS+int(indel_size))]
+                REF = ALT[0]
+            ID = id if isolated else f"{id}_{i}"
+            vcf_line += f"{CHROM}\t{POS}\t{ID}\t{REF}\t{ALT}{end_of_line}"
+
+        return vcf_line
+
+
+@functools.lru_cache(maxsize=None)
+def vcf_formatter(nb_samples, tig_type = 0, samples = None):
+    '''
+        Returns the VcfFormatter of a layout of headers (samples: tuple or None), created on first use
+        '''
+    return VcfFormatter(nb_samples, tig_type, samples)
+
+
+def format_vcf(splitted_1, splitted_2, nb_samples, rank, sequence, cluster_id, cluster_size, tig_type = 0, samples = None):
+    '''
+        Format information extracted from the fasta headers of a single bubble into one or several vcf lines (see VcfFormatter.format)
+        Scripts formatting a whole file should create a VcfFormatter once and call its format method
+        '''
+    return vcf_formatter(nb_samples, tig_type, tuple(samples) if samples else None).format(splitted_1, splitted_2, rank, sequence, cluster_id, cluster_size)
 
     
@@ -17,6 +17,29 @@ if [ $? -ne 0 ] ; then
   exit 1
 fi
 
+# bubble store round trip: the store gives back the lines of the fasta file, its columns are read inside a with block
+python3 ../scripts/bubble_store.py -i ref_discoRes_k_31_c_3_D_100_P_1_b_0_coherent.fa -o discoRes_store.bst
+python3 - discoRes_store.bst > discoRes_store.fa << 'EOF'
+import sys
+sys.path.insert(0, "../scripts")
+from bubble_store import BubbleStore
+from disco_bubbles import read_bubbles
+with BubbleStore(sys.argv[1]) as store:
+    ranks = store.column("rank")
+    assert len(ranks) == len(store)
+for bubble in read_bubbles(sys.argv[1]):
+    sys.stdout.write(bubble.text)
+EOF
+if [ $? -ne 0 ] ; then
+  echo "*** Test: FAILURE on bubble store columns"
+  exit 1
+fi
+diff discoRes_store.fa ref_discoRes_k_31_c_3_D_100_P_1_b_0_coherent.fa
+if [ $? -ne 0 ] ; then
+  echo "*** Test: FAILURE on diff bubble store .fa"
+  exit 1
+fi
+
 rm -fr discoRes_*  reference_genome.fa.*
 
 